@@ -0,0 +1,112 @@
+"""
+比較原始解析度解碼與縮小解碼 (JPEG draft + 灰階 + reduce) 計算 phash 的差異：
+每張圖片的延遲、解碼時的記憶體高峰，以及兩種方式算出的雜湊距離。
+
+記憶體高峰以每個模式各自啟動一個子行程量測 (僅支援 Linux/macOS)。
+
+用法:
+    python benchmarks/bench_decode.py --repeat 3
+"""
+import os
+import io
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx_scanner import PhashHasher
+from hash_index import hamming
+
+
+def make_image(width, height, fmt, seed):
+    """產生帶有色塊與漸層的測試圖片，模擬照片或螢幕截圖。"""
+    rng = random.Random(seed)
+    img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randrange(width // 4 + 1), rng.randrange(height // 4 + 1)
+        draw.rectangle([x, y, x + w, y + h], fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    if fmt == 'JPEG':
+        img = img.filter(ImageFilter.GaussianBlur(2))
+    buf = io.BytesIO()
+    img.save(buf, fmt, quality=90) if fmt == 'JPEG' else img.save(buf, fmt)
+    return buf.getvalue()
+
+
+CASES = [
+    ('JPEG 20MP 照片', 5472, 3648, 'JPEG'),
+    ('JPEG 2MP', 1920, 1080, 'JPEG'),
+    ('PNG 4K 截圖', 3840, 2160, 'PNG'),
+    ('PNG 小圖', 640, 480, 'PNG'),
+]
+
+
+def peak_rss_mib():
+    """目前行程的記憶體高峰。Linux 讀 /proc 的 VmHWM (ru_maxrss 會繼承 fork 前父行程的高峰)。"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # macOS 的 ru_maxrss 單位是 bytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / 1024
+
+
+def _measure(args):
+    data, reduced, repeat = args
+    hasher = PhashHasher(reduced_decode=reduced)
+    # 先算一張小圖，讓 imagehash/scipy 的延遲載入不計入量測
+    hasher(make_image(64, 64, 'PNG', 0))
+    base = peak_rss_mib()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        value = hasher(data)
+    elapsed = (time.perf_counter() - start) / repeat
+    return value, elapsed, peak_rss_mib() - base
+
+
+def run_isolated(data, reduced, repeat):
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        return pool.apply(_measure, ((data, reduced, repeat),))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較原始解析度與縮小解碼的 phash 計算")
+    parser.add_argument("--repeat", type=int, default=3, help="每張圖片重複計算次數")
+    parser.add_argument("--samples", type=int, default=60, help="用來比較雜湊距離的隨機圖片數")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'圖片':<16}{'原始解碼':>12}{'縮小解碼':>12}{'加速':>8}{'記憶體(原始)':>14}{'記憶體(縮小)':>14}{'距離':>6}")
+    for label, width, height, fmt in CASES:
+        data = make_image(width, height, fmt, args.seed)
+        full_hash, full_time, full_mem = run_isolated(data, False, args.repeat)
+        fast_hash, fast_time, fast_mem = run_isolated(data, True, args.repeat)
+        print(f"{label:<16}{full_time * 1000:>10.1f}ms{fast_time * 1000:>10.1f}ms{full_time / fast_time:>7.1f}x"
+              f"{full_mem:>12.1f}MiB{fast_mem:>12.1f}MiB{hamming(full_hash, fast_hash):>6}")
+
+    # 隨機尺寸與格式的圖片，統計兩種方式的雜湊距離
+    rng = random.Random(args.seed)
+    full, fast = PhashHasher(reduced_decode=False), PhashHasher(reduced_decode=True)
+    distances = []
+    for i in range(args.samples):
+        width, height = rng.randrange(200, 4000), rng.randrange(200, 3000)
+        data = make_image(width, height, rng.choice(['JPEG', 'PNG']), i)
+        distances.append(hamming(full(data), fast(data)))
+    distances.sort()
+    print(f"\n{args.samples} 張隨機圖片的雜湊距離：平均 {sum(distances) / len(distances):.2f}，"
+          f"中位數 {distances[len(distances) // 2]}，最大 {distances[-1]}")
+
+
+if __name__ == "__main__":
+    main()
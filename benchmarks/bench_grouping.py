@@ -0,0 +1,90 @@
+"""
+分群效能基準測試：比較原本以 ImageHash 逐一掃描群組的做法與各種近鄰索引。
+
+用法:
+    python benchmarks/bench_grouping.py --count 5000 --threshold 5
+    python benchmarks/bench_grouping.py --count 200000 --skip-baseline
+
+最後也會列出各分群方式 (--cluster-mode) 以預設索引分群的時間與群組數。
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import imagehash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hash_index import INDEX_TYPES, int_to_hex
+from clustering import group_by_representative, cluster_hashes, CLUSTER_MODES
+
+
+def make_hashes(count, dup_rate, max_flip, seed):
+    """產生隨機 64-bit 雜湊，其中 dup_rate 比例是既有雜湊翻轉少數 bit 的近似副本。"""
+    rng = random.Random(seed)
+    hashes = []
+    for _ in range(count):
+        if hashes and rng.random() < dup_rate:
+            value = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(0, max_flip)):
+                value ^= 1 << bit
+        else:
+            value = rng.getrandbits(64)
+        hashes.append(value)
+    return hashes
+
+
+def baseline_scan(image_hashes, threshold):
+    """原本 main() / WorkerThread.run() 內的分群迴圈。"""
+    groups = []
+    for i, h in enumerate(image_hashes):
+        for group in groups:
+            if h - image_hashes[group[0]] <= threshold:
+                group.append(i)
+                break
+        else:
+            groups.append([i])
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較分群演算法的執行時間")
+    parser.add_argument("--count", type=int, default=5000, help="雜湊數量")
+    parser.add_argument("--threshold", type=int, default=5)
+    parser.add_argument("--dup-rate", type=float, default=0.3, help="近似副本的比例")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-baseline", action="store_true", help="略過 ImageHash 線性掃描 (數量很大時很慢)")
+    args = parser.parse_args()
+
+    hashes = make_hashes(args.count, args.dup_rate, args.threshold, args.seed)
+    print(f"雜湊數量: {args.count}, 閥值: {args.threshold}, 近似副本比例: {args.dup_rate}")
+
+    expected = None
+    if not args.skip_baseline:
+        image_hashes = [imagehash.hex_to_hash(int_to_hex(h)) for h in hashes]
+        start = time.perf_counter()
+        expected = baseline_scan(image_hashes, args.threshold)
+        elapsed = time.perf_counter() - start
+        print(f"  {'imagehash-scan':<15} {elapsed:8.3f} s  群組數 {len(expected)}")
+
+    for kind in INDEX_TYPES:
+        start = time.perf_counter()
+        groups = group_by_representative(hashes, args.threshold, kind)
+        elapsed = time.perf_counter() - start
+        status = ""
+        if expected is not None:
+            status = "一致" if groups == expected else "結果不一致!"
+        print(f"  {kind:<15} {elapsed:8.3f} s  群組數 {len(groups)} {status}")
+
+    print("分群方式:")
+    for mode in CLUSTER_MODES:
+        start = time.perf_counter()
+        groups = cluster_hashes(hashes, args.threshold, mode)
+        elapsed = time.perf_counter() - start
+        print(f"  {mode:<15} {elapsed:8.3f} s  群組數 {len(groups)}")
+
+
+if __name__ == "__main__":
+    main()
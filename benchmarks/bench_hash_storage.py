@@ -0,0 +1,70 @@
+"""
+比較雜湊的兩種保存方式：
+  1. 原本的 list of dict，每筆 dict 帶一個 imagehash.ImageHash 物件
+  2. PackedHashes，所有雜湊放在一個連續的 uint64 陣列
+
+並比較「一個查詢對全部雜湊算距離」的速度 (ImageHash.__sub__ 與向量化 XOR + popcount)。
+
+用法:
+    python benchmarks/bench_hash_storage.py --count 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+import imagehash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hash_index import PackedHashes, int_to_hex
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較雜湊保存方式的記憶體用量與距離計算速度")
+    parser.add_argument("--count", type=int, default=50000, help="雜湊數量")
+    parser.add_argument("--queries", type=int, default=20, help="距離計算的查詢次數")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    values = [rng.getrandbits(64) for _ in range(args.count)]
+
+    records, records_bytes = measure(lambda: [{'hash': imagehash.hex_to_hash(int_to_hex(v))} for v in values])
+    packed, packed_bytes = measure(lambda: PackedHashes(values))
+
+    print(f"雜湊數量: {args.count}")
+    print(f"  list of dict + ImageHash : {records_bytes / 1024 / 1024:8.2f} MiB ({records_bytes / args.count:6.1f} bytes/張)")
+    print(f"  PackedHashes (uint64)    : {packed_bytes / 1024 / 1024:8.2f} MiB ({packed_bytes / args.count:6.1f} bytes/張)")
+
+    queries = rng.sample(range(args.count), min(args.queries, args.count))
+
+    start = time.perf_counter()
+    for q in queries:
+        query_hash = records[q]['hash']
+        [query_hash - r['hash'] for r in records]
+    imagehash_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    packed.distances([values[q] for q in queries])
+    packed_time = time.perf_counter() - start
+
+    pairs = len(queries) * args.count
+    print(f"距離計算 ({len(queries)} 個查詢 x {args.count} 張):")
+    print(f"  ImageHash.__sub__        : {imagehash_time:8.3f} s ({pairs / imagehash_time / 1e6:10.2f} M 對/秒)")
+    print(f"  XOR + popcount           : {packed_time:8.3f} s ({pairs / packed_time / 1e6:10.2f} M 對/秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+批次 phash 與逐張呼叫 imagehash.phash 的比較：圖片先解碼好，只量測之後的
+縮放、DCT、中位數與組成雜湊的時間，並核對兩種方式的雜湊完全相同。
+
+用法:
+    python benchmarks/bench_phash.py --count 5000 --batch 256
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import imagehash
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx_scanner import phash_pixels, phash_batch
+from hash_index import hash_to_int
+
+
+def make_images(count, size, seed):
+    """產生已解碼的灰階測試圖片 (相當於縮小解碼後的結果)。"""
+    rng = np.random.default_rng(seed)
+    base = np.asarray(Image.linear_gradient('L').resize((size, size)), dtype=np.int16)
+    images = []
+    for _ in range(count):
+        noise = rng.integers(-40, 40, (size, size), dtype=np.int16)
+        images.append(Image.fromarray(np.clip(np.roll(base, rng.integers(size), axis=1) + noise, 0, 255).astype(np.uint8)))
+    return images
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較批次 phash 與逐張 imagehash.phash")
+    parser.add_argument("--count", type=int, default=5000, help="圖片數")
+    parser.add_argument("--size", type=int, default=256, help="解碼後的圖片邊長 (預設 256，與縮小解碼相同)")
+    parser.add_argument("--batch", type=int, default=256, help="每批圖片數")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    images = make_images(args.count, args.size, args.seed)
+    print(f"圖片數: {args.count}，邊長 {args.size}，每批 {args.batch} 張")
+
+    expected, t_single = timed(lambda: [hash_to_int(imagehash.phash(img)) for img in images])
+    pixels, t_resize = timed(lambda: [phash_pixels(img) for img in images])
+    # 只比較縮成 32x32 之後的部分：逐張 DCT 與整批 DCT
+    one_by_one, t_dct_single = timed(lambda: [phash_batch([p])[0] for p in pixels])
+    batched, t_dct_batch = timed(lambda: [value for start in range(0, len(pixels), args.batch)
+                                          for value in phash_batch(pixels[start:start + args.batch])])
+
+    per_image = lambda t: t / args.count * 1e6
+    print(f"imagehash.phash 逐張:      {per_image(t_single):7.1f} µs/張")
+    print(f"  轉灰階與縮成 32x32:      {per_image(t_resize):7.1f} µs/張")
+    print(f"  DCT/中位數/組成雜湊 逐張: {per_image(t_dct_single):7.1f} µs/張")
+    print(f"  DCT/中位數/組成雜湊 批次: {per_image(t_dct_batch):7.1f} µs/張 "
+          f"(每張省下 {per_image(t_dct_single - t_dct_batch):.1f} µs)")
+    print(f"批次合計:                  {per_image(t_resize + t_dct_batch):7.1f} µs/張，"
+          f"比 imagehash.phash 快 {t_single / (t_resize + t_dct_batch):.2f} 倍")
+    same = expected == batched == one_by_one
+    print(f"雜湊與 imagehash.phash {'完全相同' if same else '不一致!'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+索引檔查詢效能：以隨機雜湊建立大型索引檔，量測開啟時間、單張圖片的查詢延遲，
+並與全部比較的結果核對是否一致。
+
+用法:
+    python benchmarks/bench_query.py --count 1000000 --threshold 5
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus_index import write_index, CorpusIndex, DEFAULT_INDEX_DISTANCE
+from hash_index import hamming_distances
+from bench_grouping import make_hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測索引檔的查詢延遲")
+    parser.add_argument("--count", type=int, default=1_000_000, help="索引中的圖片數")
+    parser.add_argument("--queries", type=int, default=200, help="查詢次數")
+    parser.add_argument("--threshold", type=int, default=5)
+    parser.add_argument("--max-distance", type=int, default=DEFAULT_INDEX_DISTANCE, help="建立索引時的距離上限")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    hashes = make_hashes(args.count, 0.3, args.threshold, args.seed)
+    records = [{'docx_path': f"/archive/doc{i // 20}.docx", 'image_name': f"image{i % 20}.png",
+                'context': "", 'page': 1, 'member': f"word/media/image{i % 20}.png"} for i in range(args.count)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.idx")
+        start = time.perf_counter()
+        write_index(path, records, hashes, args.max_distance)
+        build_time = time.perf_counter() - start
+        print(f"圖片數: {args.count}，建立 {build_time:.1f} 秒，檔案 {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+
+        start = time.perf_counter()
+        index = CorpusIndex(path)
+        print(f"開啟索引: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        rng = random.Random(args.seed)
+        queries = []
+        for _ in range(args.queries):
+            value = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(0, args.threshold)):
+                value ^= 1 << bit
+            queries.append(value)
+
+        latencies = []
+        mismatches = 0
+        corpus = np.asarray(hashes, dtype=np.uint64)
+        for value in queries:
+            start = time.perf_counter()
+            found, _ = index.query(value, args.threshold)
+            latencies.append(time.perf_counter() - start)
+            expected = np.flatnonzero(hamming_distances(value, corpus) <= args.threshold)
+            mismatches += not np.array_equal(found, expected)
+
+        latencies.sort()
+        print(f"查詢 {args.queries} 次 (閥值 {args.threshold})：中位數 {latencies[len(latencies) // 2] * 1000:.2f} ms，"
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms，"
+              f"與全部比較的結果{'一致' if mismatches == 0 else f'有 {mismatches} 次不一致!'}")
+
+        start = time.perf_counter()
+        for value in queries[:20]:
+            hamming_distances(value, index.hashes)
+        print(f"對照：全部比較每次 {(time.perf_counter() - start) / min(20, len(queries)) * 1000:.2f} ms")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
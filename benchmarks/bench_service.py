@@ -0,0 +1,77 @@
+"""
+重複圖片檢查服務的負載測試：在本機以隨機埠號啟動服務，同時送出多個上傳請求，
+輸出用戶端量測的延遲與吞吐量，以及服務端 /stats 的統計。
+
+用法:
+    python benchmarks/bench_service.py archive.idx /放/測試/docx/的/資料夾 --requests 200 --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from duplicate_service import DuplicateService, make_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測本機重複圖片檢查服務的延遲與吞吐量")
+    parser.add_argument("index", help="索引檔")
+    parser.add_argument("folder", help="要上傳的 docx 所在資料夾")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=0, help="服務的工作行程數 (0 代表所有 CPU 核心)")
+    args = parser.parse_args()
+
+    documents = [open(os.path.join(args.folder, f), 'rb').read()
+                 for f in sorted(os.listdir(args.folder)) if f.lower().endswith('.docx')]
+    if not documents:
+        print("資料夾中沒有 docx 檔案")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    # 排隊上限設得夠大，量測時不會因為忙碌而被拒絕
+    service = DuplicateService(args.index, workers=args.workers, max_queue=args.concurrency)
+    service.warm_up()
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"服務啟動 {time.perf_counter() - start:.2f} 秒，{service.workers} 個工作行程，索引 {len(service.index)} 張圖片")
+
+    def send(i):
+        data = documents[i % len(documents)]
+        req = urllib.request.Request(url + "/check", data=data, headers={'Content-Type': 'application/octet-stream'})
+        t = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req) as resp:
+                resp.read()
+                status = resp.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        return status, time.perf_counter() - t
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(t for _, t in results)
+    failed = sum(status != 200 for status, _ in results)
+    print(f"{args.requests} 個請求 (同時 {args.concurrency} 個)：{elapsed:.2f} 秒，{args.requests / elapsed:.1f} 請求/秒，失敗 {failed}")
+    print(f"用戶端延遲：中位數 {latencies[len(latencies) // 2] * 1000:.1f} ms，"
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms")
+    with urllib.request.urlopen(url + "/stats") as resp:
+        print("服務端統計:", json.dumps(json.loads(resp.read()), ensure_ascii=False, indent=2))
+
+    server.shutdown()
+    service.close()
+
+
+if __name__ == "__main__":
+    main()
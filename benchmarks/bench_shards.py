@@ -0,0 +1,66 @@
+"""
+在本機模擬多節點分片掃描：同時啟動 N 個 build-index --shard i/N 行程，
+再以 merge 合併並分群，核對報告與單機執行 find_docx_duplicates.py 完全相同，並比較耗時。
+
+用法:
+    python benchmarks/bench_shards.py /您的/目標/資料夾路徑 --shards 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_START = "共提取並計算了"
+
+
+def run(args):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+
+
+def report_part(output):
+    """只比較分群報告的部分，掃描過程的訊息在兩種執行方式中本來就不同。"""
+    return output[output.index(REPORT_START):]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="核對分片掃描合併後的結果與單機掃描相同")
+    parser.add_argument("folder", help="包含 docx 檔案的資料夾")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--threshold", type=int, default=5)
+    args = parser.parse_args()
+    folder = os.path.abspath(args.folder)
+
+    start = time.perf_counter()
+    single = run(["find_docx_duplicates.py", folder, "--no-cache", "--threshold", str(args.threshold)])
+    single_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        parts = [os.path.join(tmp, f"part{i}.idx") for i in range(1, args.shards + 1)]
+        start = time.perf_counter()
+        procs = [subprocess.Popen([sys.executable, "corpus_index.py", "build-index", folder, part,
+                                   "--shard", f"{i}/{args.shards}", "--no-cache"],
+                                  cwd=ROOT, stdout=subprocess.DEVNULL)
+                 for i, part in enumerate(parts, 1)]
+        for proc in procs:
+            if proc.wait() != 0:
+                raise SystemExit("分片掃描失敗")
+        shard_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        merged = run(["corpus_index.py", "merge", *parts, "--threshold", str(args.threshold)])
+        merge_time = time.perf_counter() - start
+
+    print(f"單機掃描: {single_time:.2f} 秒")
+    print(f"{args.shards} 個分片同時掃描: {shard_time:.2f} 秒，合併與分群: {merge_time:.2f} 秒")
+    if report_part(single) == report_part(merged):
+        print("合併結果與單機掃描完全相同")
+    else:
+        print("合併結果與單機掃描不同!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
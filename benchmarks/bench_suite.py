@@ -0,0 +1,327 @@
+"""
+可重現的整體基準測試：以 synthetic_corpus.py 產生 (或沿用) 合成的 docx 資料夾，
+分別量測擷取圖片 (extract_images_from_docx)、計算雜湊 (scan_files) 與各分群方式的時間、
+處理速度與記憶體高峰，並依 ground truth 計算重複偵測的精確率與召回率。
+
+結果可存成基準檔 (--save-baseline)，之後以 --compare 比較：時間或記憶體超過基準的 (1 + 容許比例) 倍、
+或精確率/召回率下降，都視為退步並以結束碼 1 結束，可放進 CI 或改版前後的檢查。
+
+每個階段各自在新的子行程中執行，記憶體高峰互不影響 (僅支援 Linux/macOS)；
+時間取 --repeat 次中最快的一次，降低其他程式干擾。
+
+用法:
+    python benchmarks/bench_suite.py --documents 200 --save-baseline benchmarks/baselines/local.json
+    python benchmarks/bench_suite.py --documents 200 --compare benchmarks/baselines/local.json
+    python benchmarks/bench_suite.py --corpus /tmp/corpus --workers 4 --read-ahead 8
+    python benchmarks/bench_suite.py --transform-rate 0.15 --match invariant
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_decode import peak_rss_mib
+from synthetic_corpus import GROUND_TRUTH, add_arguments, params_from_args, generate_corpus, load_ground_truth
+from docx_scanner import extract_images_from_docx, scan_files, create_hasher, MATCH_MODES, DEFAULT_MATCH_MODE
+from discovery import is_docx_file
+from clustering import cluster_hashes, CLUSTER_MODES
+
+# 精確率/召回率允許的下降幅度 (相同參數與 seed 下結果應完全相同，只容許浮點誤差)
+QUALITY_TOLERANCE = 0.001
+# 記憶體高峰的比較另外容許的絕對差距 (MiB)，避免小資料夾的量測雜訊被當成退步
+MEMORY_SLACK_MIB = 8
+# 時間另外容許的絕對差距 (秒)，只需幾毫秒的階段 (例如小資料夾的分群) 雜訊比例很大
+TIME_SLACK_SECONDS = 0.05
+
+
+def _pairs(n):
+    return n * (n - 1) // 2
+
+
+def _extract_phase(docx_files):
+    base = peak_rss_mib()
+    start = time.perf_counter()
+    images = 0
+    size = 0
+    for path in docx_files:
+        for img in extract_images_from_docx(path):
+            images += 1
+            size += len(img['bytes'])
+    return {'seconds': time.perf_counter() - start, 'images': images, 'bytes': size,
+            'peak_mib': peak_rss_mib() - base}
+
+
+def _hash_phase(docx_files, workers, read_ahead, match):
+    hasher = create_hasher(match)
+    base = peak_rss_mib()
+    start = time.perf_counter()
+    hashes = []
+    for _, records, _ in scan_files(docx_files, workers, None, hasher, read_ahead):
+        hashes.extend((img['filename'], img['member'], img['hash']) for img in records)
+    return {'seconds': time.perf_counter() - start, 'images': len(hashes), 'peak_mib': peak_rss_mib() - base,
+            'hashes': hashes}
+
+
+def _group_phase(hashes, threshold, mode, match):
+    base = peak_rss_mib()
+    start = time.perf_counter()
+    # 與 ScanEngine.scan 相同，以 hasher 提供的容器保存雜湊 (串接比對時另外保存預篩雜湊)
+    store = create_hasher(match).new_store()
+    store.extend(hashes)
+    groups = cluster_hashes(store, threshold, mode)
+    return {'seconds': time.perf_counter() - start, 'peak_mib': peak_rss_mib() - base, 'groups': groups}
+
+
+def run_isolated(func, *args):
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def best_of(repeat, func, *args):
+    """執行 repeat 次，取時間最短的一次；記憶體高峰取最大值。"""
+    results = [run_isolated(func, *args) for _ in range(repeat)]
+    best = min(results, key=lambda r: r['seconds'])
+    best['peak_mib'] = max(r['peak_mib'] for r in results)
+    return best
+
+
+def evaluate(groups, labels, kinds):
+    """
+    以配對計算精確率與召回率：同一群組內的每一對圖片視為預測為重複，
+    來自同一張原始圖片的每一對視為真正的重複。另外依來源種類 (完全重複、各種變形) 計算
+    有多少比例與其原始圖片分在同一組。
+    """
+    group_of = {}
+    for group_id, group in enumerate(groups):
+        for i in group:
+            group_of[i] = group_id
+
+    contingency = {}
+    group_sizes = {}
+    source_sizes = {}
+    for i, source in enumerate(labels):
+        key = (group_of[i], source)
+        contingency[key] = contingency.get(key, 0) + 1
+        group_sizes[group_of[i]] = group_sizes.get(group_of[i], 0) + 1
+        source_sizes[source] = source_sizes.get(source, 0) + 1
+
+    true_positive = sum(_pairs(n) for n in contingency.values())
+    predicted = sum(_pairs(n) for n in group_sizes.values())
+    actual = sum(_pairs(n) for n in source_sizes.values())
+    precision = true_positive / predicted if predicted else 1.0
+    recall = true_positive / actual if actual else 1.0
+
+    original_group = {source: group_of[i] for i, source in enumerate(labels) if kinds[i] == 'original'}
+    by_kind = {}
+    for i, kind in enumerate(kinds):
+        if kind == 'original':
+            continue
+        found, total = by_kind.get(kind, (0, 0))
+        by_kind[kind] = (found + (group_of[i] == original_group.get(labels[i])), total + 1)
+
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        'pairs': {'true_positive': true_positive, 'predicted': predicted, 'actual': actual},
+        'recall_by_kind': {kind: found / total for kind, (found, total) in sorted(by_kind.items())},
+    }
+
+
+def run_suite(corpus_dir, truth, threshold, modes, workers, read_ahead, repeat, match=DEFAULT_MATCH_MODE):
+    docx_files = sorted(os.path.join(corpus_dir, f) for f in os.listdir(corpus_dir) if is_docx_file(f))
+    corpus_size = sum(os.path.getsize(path) for path in docx_files)
+    metrics = {}
+
+    extract = best_of(repeat, _extract_phase, docx_files)
+    metrics['extract'] = {
+        'seconds': extract['seconds'],
+        'peak_mib': extract['peak_mib'],
+        'documents_per_second': len(docx_files) / extract['seconds'],
+        'images_per_second': extract['images'] / extract['seconds'],
+        'mib_per_second': extract['bytes'] / 1024 / 1024 / extract['seconds'],
+    }
+
+    hashed = best_of(repeat, _hash_phase, docx_files, workers, read_ahead, match)
+    metrics['hash'] = {
+        'seconds': hashed['seconds'],
+        'peak_mib': hashed['peak_mib'],
+        'documents_per_second': len(docx_files) / hashed['seconds'],
+        'images_per_second': hashed['images'] / hashed['seconds'],
+        'mib_per_second': corpus_size / 1024 / 1024 / hashed['seconds'],
+    }
+
+    truth_by_member = {(img['filename'], img['member']): img for img in truth['images']}
+    hashes = [value for _, _, value in hashed['hashes']]
+    labels = [truth_by_member[(filename, member)]['source'] for filename, member, _ in hashed['hashes']]
+    kinds = [truth_by_member[(filename, member)]['kind'] for filename, member, _ in hashed['hashes']]
+
+    quality = {}
+    for mode in modes:
+        grouped = best_of(repeat, _group_phase, hashes, threshold, mode, match)
+        metrics[f'group.{mode}'] = {
+            'seconds': grouped['seconds'],
+            'peak_mib': grouped['peak_mib'],
+            'images_per_second': len(hashes) / grouped['seconds'] if grouped['seconds'] else 0.0,
+        }
+        quality[mode] = evaluate(grouped['groups'], labels, kinds)
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'corpus': {'params': truth['params'], 'documents': len(docx_files), 'images': len(truth['images']),
+                   'hashed_images': len(hashes), 'bytes': corpus_size},
+        'settings': {'threshold': threshold, 'workers': workers, 'read_ahead': read_ahead, 'repeat': repeat,
+                     'match': match},
+        'metrics': metrics,
+        'quality': quality,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """回傳 (是否可比較的說明清單, 退步項目清單)。"""
+    notes = []
+    if result['corpus']['params'] != baseline['corpus']['params']:
+        notes.append("資料夾參數與基準不同，比較結果沒有意義")
+    if result['settings'] != baseline['settings']:
+        notes.append(f"執行設定與基準不同: 基準 {baseline['settings']}，本次 {result['settings']}")
+    if result['machine'] != baseline['machine']:
+        notes.append(f"基準是在不同的環境量測的 ({baseline['machine']['platform']}，{baseline['machine']['cpus']} CPU)")
+
+    regressions = []
+    for phase, old in baseline['metrics'].items():
+        new = result['metrics'].get(phase)
+        if new is None:
+            continue
+        if new['seconds'] > old['seconds'] * (1 + tolerance) + TIME_SLACK_SECONDS:
+            regressions.append(f"{phase} 時間 {old['seconds']:.3f} → {new['seconds']:.3f} 秒 "
+                               f"(+{(new['seconds'] / old['seconds'] - 1) * 100:.0f}%)")
+        if new['peak_mib'] > old['peak_mib'] * (1 + tolerance) + MEMORY_SLACK_MIB:
+            regressions.append(f"{phase} 記憶體高峰 {old['peak_mib']:.1f} → {new['peak_mib']:.1f} MiB")
+    for mode, old in baseline['quality'].items():
+        new = result['quality'].get(mode)
+        if new is None:
+            continue
+        for key, label in (('precision', '精確率'), ('recall', '召回率')):
+            if new[key] < old[key] - QUALITY_TOLERANCE:
+                regressions.append(f"{mode} {label} {old[key]:.4f} → {new[key]:.4f}")
+    return notes, regressions
+
+
+def print_result(result, baseline=None):
+    corpus = result['corpus']
+    print(f"{corpus['documents']} 份文件 ({corpus['bytes'] / 1024 / 1024:.1f} MiB)、{corpus['images']} 張圖片，"
+          f"閥值 {result['settings']['threshold']}，{result['settings']['workers']} 個行程，"
+          f"預讀 {result['settings']['read_ahead']} 份，比對模式 {result['settings'].get('match', DEFAULT_MATCH_MODE)}，"
+          f"取 {result['settings']['repeat']} 次中最快")
+    print(f"\n{'階段':<20}{'秒':>9}{'文件/秒':>10}{'圖片/秒':>11}{'MiB/秒':>9}{'記憶體 MiB':>12}{'基準比':>9}")
+    for phase, m in result['metrics'].items():
+        ratio = ""
+        if baseline is not None and phase in baseline['metrics']:
+            ratio = f"{m['seconds'] / baseline['metrics'][phase]['seconds']:.2f}x"
+        docs = f"{m['documents_per_second']:.1f}" if 'documents_per_second' in m else "-"
+        mib = f"{m['mib_per_second']:.1f}" if 'mib_per_second' in m else "-"
+        print(f"{phase:<20}{m['seconds']:>9.3f}{docs:>10}{m['images_per_second']:>11.1f}{mib:>9}"
+              f"{m['peak_mib']:>12.1f}{ratio:>9}")
+
+    print(f"\n{'分群方式':<16}{'精確率':>8}{'召回率':>8}{'F1':>8}  各來源與原始圖片同組的比例")
+    for mode, q in result['quality'].items():
+        kinds = "，".join(f"{kind} {value:.0%}" for kind, value in q['recall_by_kind'].items())
+        print(f"{mode:<16}{q['precision']:>8.4f}{q['recall']:>8.4f}{q['f1']:>8.4f}  {kinds}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以合成的 docx 資料夾量測擷取、雜湊與分群的效能及偵測品質")
+    parser.add_argument("--corpus", help="資料夾位置；已有 ground_truth.json 且參數相同時直接沿用，不存在或是空的時在此產生 "
+                                         "(預設產生到暫存資料夾，結束後刪除)")
+    parser.add_argument("--regenerate", action="store_true",
+                        help="--corpus 是以不同參數產生的合成資料夾時，清空後重新產生 (預設直接結束，不會覆寫)")
+    add_arguments(parser)
+    parser.add_argument("--threshold", type=int, default=5, help="容忍閥值 (預設 5)")
+    parser.add_argument("--cluster-modes", default=",".join(CLUSTER_MODES), help="要量測的分群方式，以逗號分隔")
+    parser.add_argument("--match", choices=MATCH_MODES, default=DEFAULT_MATCH_MODE, help="比對模式 (預設 phash)")
+    parser.add_argument("--workers", type=int, default=1, help="計算雜湊的行程數 (預設 1)")
+    parser.add_argument("--read-ahead", type=int, default=0, help="預讀文件數 (預設 0)")
+    parser.add_argument("--repeat", type=int, default=1, help="每個階段執行的次數，取最快的一次 (預設 1)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="把結果存成基準檔")
+    parser.add_argument("--compare", metavar="PATH", help="與基準檔比較，有退步時以結束碼 1 結束")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="時間與記憶體容許增加的比例 (預設 0.2)")
+    args = parser.parse_args()
+    try:
+        params = params_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    modes = args.cluster_modes.split(',')
+    invalid = set(modes) - set(CLUSTER_MODES)
+    if invalid:
+        parser.error(f"未知的分群方式: {', '.join(sorted(invalid))} (可用: {', '.join(CLUSTER_MODES)})")
+
+    regenerate = False
+    if args.corpus and os.path.isdir(args.corpus) and os.listdir(args.corpus):
+        # 使用者指定的資料夾只在明確要求時才覆寫，且只覆寫之前產生的合成資料夾
+        if not os.path.exists(os.path.join(args.corpus, GROUND_TRUTH)):
+            parser.error(f"{args.corpus} 不是空的資料夾，也不是合成資料夾 (沒有 {GROUND_TRUTH})")
+        # JSON 會把 tuple 存成 list，比較前先轉成相同形式
+        if load_ground_truth(args.corpus)['params'] != json.loads(json.dumps(params)):
+            if not args.regenerate:
+                parser.error(f"{args.corpus} 是以不同的參數產生的；請改用其他資料夾，或加上 --regenerate 清空後重新產生")
+            regenerate = True
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="docx_bench_")
+    try:
+        truth = None
+        if regenerate:
+            print(f"{corpus_dir} 的參數與指定的不同，清空後重新產生")
+            shutil.rmtree(corpus_dir)
+        elif os.path.exists(os.path.join(corpus_dir, GROUND_TRUTH)):
+            truth = load_ground_truth(corpus_dir)
+        if truth is None:
+            start = time.perf_counter()
+            truth = generate_corpus(corpus_dir, **params)
+            print(f"已產生合成資料夾 {corpus_dir} ({time.perf_counter() - start:.1f} 秒)")
+            truth = load_ground_truth(corpus_dir)
+
+        result = run_suite(corpus_dir, truth, args.threshold, modes, args.workers, args.read_ahead, args.repeat,
+                           args.match)
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    print()
+    print_result(result, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n基準已儲存至 {args.save_baseline}")
+
+    if baseline is not None:
+        notes, regressions = compare(result, baseline, args.tolerance)
+        print(f"\n與基準 {args.compare} ({baseline['created']}) 比較:")
+        for note in notes:
+            print(f"  注意: {note}")
+        if regressions:
+            print(f"  發現 {len(regressions)} 項退步 (容許 +{args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"    {line}")
+            sys.exit(1)
+        print("  沒有發現退步")
+
+
+if __name__ == "__main__":
+    main()
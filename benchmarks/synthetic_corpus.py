@@ -0,0 +1,291 @@
+"""
+產生合成的 docx 測試資料夾，供效能基準測試使用。
+
+可設定文件數、每份文件的圖片數、圖片尺寸與格式、完全重複、近似重複 (縮放、重新壓縮)
+與變形重複 (旋轉、翻轉、裁切) 的比例，以及標題與分頁的密度。相同的參數與 seed 會產生完全相同的內容；
+ground_truth.json 記錄每張圖片來自哪一張原始圖片，用來計算重複偵測的精確率與召回率。
+
+用法:
+    python benchmarks/synthetic_corpus.py /tmp/corpus --documents 200 --images 2-8 --dup-rate 0.2 --near-dup-rate 0.1
+"""
+import io
+import os
+import sys
+import json
+import random
+import zipfile
+import argparse
+from functools import lru_cache
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_decode import make_image
+
+GROUND_TRUTH = "ground_truth.json"
+
+DEFAULT_PARAMS = {
+    'documents': 100,
+    'images': (2, 6),
+    'sizes': ((640, 480), (1280, 720), (1920, 1080)),
+    'formats': ('JPEG', 'PNG'),
+    'dup_rate': 0.15,
+    'near_dup_rate': 0.15,
+    'transform_rate': 0.0,
+    'heading_rate': 0.2,
+    'page_break_rate': 0.3,
+    'seed': 0,
+}
+
+# 近似重複的變形方式
+PERTURBATIONS = ('resize', 'recompress', 'resize+recompress')
+# 變形重複的方式 (預設比例為 0，只在比較旋轉/翻轉/裁切比對模式時使用)
+TRANSFORMS = ('rotate', 'mirror', 'crop', 'rotate+crop', 'mirror+crop')
+
+_NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"'
+)
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+
+_PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+_IMAGE_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+_EXTENSIONS = {'JPEG': 'jpeg', 'PNG': 'png'}
+
+
+def parse_range(text):
+    """解析 "2-8" 或 "5" 形式的整數範圍。"""
+    lo, _, hi = text.partition('-')
+    try:
+        lo, hi = int(lo), int(hi or lo)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的範圍: {text} (例如 2-8)")
+    if lo < 0 or hi < lo:
+        raise argparse.ArgumentTypeError(f"無效的範圍: {text}")
+    return lo, hi
+
+
+def parse_sizes(text):
+    """解析以逗號分隔的 "寬x高" 清單。"""
+    try:
+        return tuple(tuple(int(v) for v in item.lower().split('x')) for item in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的圖片尺寸: {text} (例如 640x480,1920x1080)")
+
+
+@lru_cache(maxsize=256)
+def _source_image(seed, width, height, fmt):
+    return make_image(width, height, fmt, seed)
+
+
+def perturb(data, kind, rng):
+    """產生近似重複：縮小到 50%~90% 及/或以較低品質重新存成 JPEG。回傳 (bytes, 格式)。"""
+    img = Image.open(io.BytesIO(data))
+    fmt = img.format
+    if 'resize' in kind:
+        scale = rng.uniform(0.5, 0.9)
+        img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    if 'recompress' in kind:
+        fmt = 'JPEG'
+        img.convert('RGB').save(buf, 'JPEG', quality=rng.randint(50, 80))
+    else:
+        img.save(buf, fmt, quality=90) if fmt == 'JPEG' else img.save(buf, fmt)
+    return buf.getvalue(), fmt
+
+
+def transform(data, kind, rng):
+    """產生變形重複：旋轉 90/180/270 度、左右或上下翻轉，及/或每邊裁掉 0~4% 的邊緣。回傳 (bytes, 格式)。"""
+    img = Image.open(io.BytesIO(data))
+    fmt = img.format
+    if 'rotate' in kind:
+        img = img.transpose(rng.choice((Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_180,
+                                        Image.Transpose.ROTATE_270)))
+    if 'mirror' in kind:
+        img = img.transpose(rng.choice((Image.Transpose.FLIP_LEFT_RIGHT, Image.Transpose.FLIP_TOP_BOTTOM)))
+    if 'crop' in kind:
+        left, right = (int(img.width * rng.uniform(0, 0.04)) for _ in range(2))
+        top, bottom = (int(img.height * rng.uniform(0, 0.04)) for _ in range(2))
+        img = img.crop((left, top, img.width - right, img.height - bottom))
+    buf = io.BytesIO()
+    img.save(buf, fmt, quality=90) if fmt == 'JPEG' else img.save(buf, fmt)
+    return buf.getvalue(), fmt
+
+
+def _paragraph(text, style=None):
+    ppr = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+    return f'<w:p>{ppr}<w:r><w:t>{text}</w:t></w:r></w:p>'
+
+
+def _drawing(rel_id, pic_id, width, height):
+    # 以 EMU 表示的顯示尺寸 (96 DPI 下每像素 9525 EMU)，寬度上限約 6 英吋
+    scale = min(1.0, 576 / width)
+    cx, cy = int(width * scale * 9525), int(height * scale * 9525)
+    return (
+        f'<w:p><w:r><w:drawing><wp:inline><wp:extent cx="{cx}" cy="{cy}"/>'
+        f'<wp:docPr id="{pic_id}" name="圖片 {pic_id}"/>'
+        '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+        f'<pic:pic><pic:nvPicPr><pic:cNvPr id="{pic_id}" name="image{pic_id}"/><pic:cNvPicPr/></pic:nvPicPr>'
+        f'<pic:blipFill><a:blip r:embed="{rel_id}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+        f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+        '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>'
+        '</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>'
+    )
+
+
+def generate_corpus(out_dir, **params):
+    """
+    在 out_dir 產生合成的 docx 檔案與 ground_truth.json，回傳 ground truth。
+    params 可覆寫 DEFAULT_PARAMS 中的任何參數。
+
+    每個圖片位置依序決定：dup_rate 的機率沿用先前出現過的原始圖片 (內容完全相同)，
+    near_dup_rate 的機率是先前原始圖片的縮放或重新壓縮版本，transform_rate 的機率是旋轉、翻轉或裁切版本，
+    其餘為新的原始圖片。
+    """
+    params = dict(DEFAULT_PARAMS, **params)
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"未知的參數: {', '.join(sorted(unknown))}")
+    rng = random.Random(params['seed'])
+    os.makedirs(out_dir, exist_ok=True)
+
+    sources = []  # 原始圖片的 (seed, width, height, format)
+    truth = []
+    digits = len(str(max(params['documents'] - 1, 1)))
+    for doc_index in range(params['documents']):
+        filename = f"doc{doc_index:0{digits}d}.docx"
+        body = []
+        media = []
+        page = 1
+        for slot in range(rng.randint(*params['images'])):
+            roll = rng.random()
+            if sources and roll < params['dup_rate']:
+                source = rng.randrange(len(sources))
+                kind = 'exact'
+                data = _source_image(*sources[source])
+                fmt = sources[source][3]
+            elif sources and roll < params['dup_rate'] + params['near_dup_rate']:
+                source = rng.randrange(len(sources))
+                kind = rng.choice(PERTURBATIONS)
+                data, fmt = perturb(_source_image(*sources[source]), kind, rng)
+            elif sources and roll < params['dup_rate'] + params['near_dup_rate'] + params['transform_rate']:
+                source = rng.randrange(len(sources))
+                kind = rng.choice(TRANSFORMS)
+                data, fmt = transform(_source_image(*sources[source]), kind, rng)
+            else:
+                width, height = rng.choice(params['sizes'])
+                sources.append((rng.getrandbits(32), width, height, rng.choice(params['formats'])))
+                source = len(sources) - 1
+                kind = 'original'
+                data = _source_image(*sources[source])
+                fmt = sources[source][3]
+
+            # 圖片前的文字段落，依密度插入標題與分頁
+            if rng.random() < params['heading_rate']:
+                body.append(_paragraph(f"第 {doc_index + 1}-{slot + 1} 節", style="Heading1"))
+            for line in range(rng.randint(1, 3)):
+                body.append(_paragraph(f"文件 {doc_index + 1} 第 {slot + 1} 張圖片前的說明文字 {line + 1}。"))
+            if rng.random() < params['page_break_rate']:
+                body.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+                page += 1
+
+            member = f"word/media/image{slot + 1}.{_EXTENSIONS[fmt]}"
+            rel_id = f"rId{slot + 1}"
+            width, height = Image.open(io.BytesIO(data)).size
+            body.append(_drawing(rel_id, slot + 1, width, height))
+            media.append((rel_id, member, data))
+            truth.append({'filename': filename, 'member': member, 'source': source, 'kind': kind, 'page': page})
+
+        document = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {_NAMESPACES}><w:body>'
+                    + "".join(body) + '<w:sectPr/></w:body></w:document>')
+        rels = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                + "".join(f'<Relationship Id="{rel_id}" Type="{_IMAGE_REL_TYPE}" Target="{member[len("word/"):]}"/>'
+                          for rel_id, member, _ in media)
+                + '</Relationships>')
+        with zipfile.ZipFile(os.path.join(out_dir, filename), 'w', zipfile.ZIP_DEFLATED) as docx_zip:
+            docx_zip.writestr('[Content_Types].xml', _CONTENT_TYPES)
+            docx_zip.writestr('_rels/.rels', _PACKAGE_RELS)
+            docx_zip.writestr('word/document.xml', document)
+            docx_zip.writestr('word/_rels/document.xml.rels', rels)
+            for _, member, data in media:
+                docx_zip.writestr(member, data)
+
+    result = {'params': params, 'sources': len(sources), 'images': truth}
+    with open(os.path.join(out_dir, GROUND_TRUTH), 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=1)
+    return result
+
+
+def load_ground_truth(corpus_dir):
+    with open(os.path.join(corpus_dir, GROUND_TRUTH), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def add_arguments(parser):
+    """加入產生資料夾的參數，bench_suite.py 共用同一組選項。"""
+    parser.add_argument("--documents", type=int, default=DEFAULT_PARAMS['documents'], help="文件數")
+    parser.add_argument("--images", type=parse_range, default=DEFAULT_PARAMS['images'], help="每份文件的圖片數範圍 (例如 2-6)")
+    parser.add_argument("--sizes", type=parse_sizes, default=DEFAULT_PARAMS['sizes'], help="原始圖片尺寸，以逗號分隔 (例如 640x480,1920x1080)")
+    parser.add_argument("--formats", type=lambda text: tuple(text.upper().split(',')), default=DEFAULT_PARAMS['formats'],
+                        help="原始圖片格式，以逗號分隔 (JPEG、PNG)")
+    parser.add_argument("--dup-rate", type=float, default=DEFAULT_PARAMS['dup_rate'], help="完全重複的圖片比例")
+    parser.add_argument("--near-dup-rate", type=float, default=DEFAULT_PARAMS['near_dup_rate'], help="近似重複 (縮放、重新壓縮) 的圖片比例")
+    parser.add_argument("--transform-rate", type=float, default=DEFAULT_PARAMS['transform_rate'],
+                        help="變形重複 (旋轉、翻轉、裁切) 的圖片比例 (預設 0)")
+    parser.add_argument("--heading-rate", type=float, default=DEFAULT_PARAMS['heading_rate'], help="每張圖片前出現標題的機率")
+    parser.add_argument("--page-break-rate", type=float, default=DEFAULT_PARAMS['page_break_rate'], help="每張圖片前出現分頁的機率")
+    parser.add_argument("--seed", type=int, default=DEFAULT_PARAMS['seed'])
+
+
+def params_from_args(args):
+    params = {name: getattr(args, name) for name in DEFAULT_PARAMS}
+    for name in ('formats',):
+        invalid = set(params[name]) - set(_EXTENSIONS)
+        if invalid:
+            raise ValueError(f"不支援的圖片格式: {', '.join(sorted(invalid))}")
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產生合成的 docx 測試資料夾")
+    parser.add_argument("output", help="輸出資料夾")
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        params = params_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    truth = generate_corpus(args.output, **params)
+    kinds = {}
+    for img in truth['images']:
+        kinds[img['kind']] = kinds.get(img['kind'], 0) + 1
+    print(f"已產生 {params['documents']} 份文件、{len(truth['images'])} 張圖片 ({truth['sources']} 張原始圖片) 於 {args.output}")
+    print("圖片來源: " + "，".join(f"{kind} {count}" for kind, count in sorted(kinds.items())))
+
+
+if __name__ == "__main__":
+    main()
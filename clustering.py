@@ -0,0 +1,305 @@
+"""
+把相似的圖片雜湊分成群組。
+"""
+import numpy as np
+
+from hash_index import (create_index, DEFAULT_INDEX, pack_hashes, hamming_distances, cascade_radius,
+                        cascade_distances, mih_plan, mih_pairs)
+
+# 分群方式：以代表圖片分群 (原本的行為)、單一連結、完全連結
+CLUSTER_MODES = ('representative', 'single', 'complete')
+DEFAULT_CLUSTER_MODE = 'representative'
+
+# 分群方式在介面與報告上顯示的名稱
+CLUSTER_MODE_LABELS = {
+    'representative': "代表圖片",
+    'single': "遞移相連",
+    'complete': "完全連結",
+}
+
+
+def group_by_representative(hashes, threshold, index_kind=DEFAULT_INDEX):
+    """
+    與原本的分群邏輯完全相同：每張圖片依序與各群組的第一張代表圖片比較，
+    加入最早建立且距離 <= threshold 的群組，否則自成一組。
+    差別在於代表圖片放在近鄰索引中，不必逐一掃描所有群組。
+
+    hashes 為 64-bit 整數雜湊的序列 (list、uint64 陣列或 PackedHashes)，
+    回傳以索引值組成的群組清單。
+    """
+    if hasattr(hashes, 'tolist'):
+        hashes = hashes.tolist()
+
+    index = create_index(index_kind, threshold)
+    groups = []
+
+    for i, value in enumerate(hashes):
+        matches = index.query(value, threshold)
+        if matches:
+            # 取最早建立的群組，確保結果與線性掃描一致
+            group_id = min(item for _, item in matches)
+            groups[group_id].append(i)
+        else:
+            index.add(value, len(groups))
+            groups.append([i])
+
+    return groups
+
+
+class UnionFind:
+    """併查集 (disjoint-set union)，採路徑壓縮與依大小合併。"""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        return ra
+
+    def groups(self):
+        """依最小成員的順序回傳所有集合，集合內成員由小到大排列。"""
+        members = {}
+        for i in range(len(self.parent)):
+            members.setdefault(self.find(i), []).append(i)
+        return sorted(members.values(), key=lambda g: g[0])
+
+
+class NeighborGraph:
+    """
+    所有涵明距離 <= max_distance 的雜湊配對所構成的稀疏鄰接圖。
+
+    只需要在掃描後建立一次，之後任何 <= max_distance 的閥值都可以
+    直接從圖上過濾邊並重新分群，不必重新提取圖片或計算雜湊。
+    邊以 (較早的索引 earlier, 較晚的索引 later, 距離 dist) 三個陣列保存，
+    並依 later 排序，以 indptr 取得每張圖片與更早圖片之間的邊。
+
+    hashes 為 hash_index.CascadeHashes (旋轉/翻轉/裁切比對模式) 時，先以 cascade_radius() 放寬的
+    phash 距離找出候選配對，再以 ahash/dhash 確認，邊上保存的是 cascade_distances() 的有效距離。
+    """
+
+    def __init__(self, count, earlier, later, dist, max_distance, values=None, prefilter=None):
+        order = np.lexsort((earlier, later))
+        self.count = count
+        # 原始雜湊 (uint64 陣列)，完全連結分群檢查群組直徑時使用
+        self.values = values
+        # 串接比對的 (ahash 陣列, dhash 陣列)，一般 phash 時為 None
+        self.prefilter = prefilter
+        self.max_distance = max_distance
+        self.earlier = earlier[order]
+        self.later = later[order]
+        self.dist = dist[order]
+        self.indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.later, minlength=count), out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.dist)
+
+    def _distances(self, a, b):
+        """a 中每張圖片對 b 中每張圖片的距離 (串接比對時為有效距離)，形狀 (len(a), len(b))。"""
+        d = hamming_distances(self.values[a], self.values[b])
+        if self.prefilter is None:
+            return d
+        ahash, dhash = self.prefilter
+        return cascade_distances(d, hamming_distances(ahash[a], ahash[b]), hamming_distances(dhash[a], dhash[b]))
+
+    @staticmethod
+    def _confirm(prefilter, rows, cols, dist, max_distance):
+        """以預篩雜湊把候選配對的 phash 距離換成有效距離，回傳保留的遮罩與有效距離。"""
+        ahash, dhash = prefilter
+        dist = cascade_distances(dist, np.bitwise_count(ahash[rows] ^ ahash[cols]),
+                                 np.bitwise_count(dhash[rows] ^ dhash[cols]))
+        return dist <= max_distance, dist
+
+    @classmethod
+    def build(cls, hashes, max_distance, max_block_elements=1 << 24):
+        """以分塊的向量化 XOR + popcount 找出所有距離 <= max_distance 的配對。"""
+        values = pack_hashes(hashes.tolist() if hasattr(hashes, 'tolist') else hashes)
+        prefilter = getattr(hashes, 'prefilter', None)
+        radius = cascade_radius(max_distance) if prefilter is not None else max_distance
+        n = len(values)
+        # 控制每塊距離矩陣的大小，避免中間陣列占用過多記憶體
+        block = max(1, min(n, max_block_elements // max(n, 1)))
+
+        earlier_parts, later_parts, dist_parts = [], [], []
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            d = hamming_distances(values[start:stop], values[start:])
+            rows, cols = np.nonzero(d <= radius)
+            cols += start
+            rows += start
+            keep = cols > rows
+            rows, cols = rows[keep], cols[keep]
+            dist = d[rows - start, cols - start]
+            if prefilter is not None:
+                keep, dist = cls._confirm(prefilter, rows, cols, dist, max_distance)
+                rows, cols, dist = rows[keep], cols[keep], dist[keep]
+            earlier_parts.append(rows.astype(np.int32))
+            later_parts.append(cols.astype(np.int32))
+            dist_parts.append(dist)
+
+        def concat(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+
+        return cls(n, concat(earlier_parts, np.int32), concat(later_parts, np.int32),
+                   concat(dist_parts, np.uint8), max_distance, values, prefilter)
+
+    @classmethod
+    def from_index(cls, hashes, max_distance, index_kind=DEFAULT_INDEX):
+        """
+        以近鄰索引找出配對：每張圖片先查詢索引中較早的圖片再加入索引。
+        雜湊分布稀疏時成本約與圖片數成線性，適合一次性的分群。
+
+        index_kind 為 'mih' 時改以 hash_index.mih_pairs() 一次向量化地找出所有配對；
+        距離上限太大、分段無法有效篩選時 (見 mih_plan) 改以 build() 分塊向量化地全部比較。
+        串接雜湊以 phash 部分在放寬的距離內找出候選，只對候選配對以 ahash/dhash 確認。
+        """
+        values = pack_hashes(hashes.tolist() if hasattr(hashes, 'tolist') else hashes)
+        prefilter = getattr(hashes, 'prefilter', None)
+        radius = cascade_radius(max_distance) if prefilter is not None else max_distance
+        if index_kind == 'mih':
+            plan = mih_plan(radius, len(values))
+            if plan is None:
+                return cls.build(hashes, max_distance)
+            earlier, later, dist = mih_pairs(values, radius, plan)
+            return cls._from_candidates(values, earlier, later, dist, max_distance, prefilter)
+
+        index = create_index(index_kind, radius)
+        earlier, later, dist = [], [], []
+        for i, value in enumerate(values.tolist()):
+            for d, j in index.query(value, radius):
+                earlier.append(j)
+                later.append(i)
+                dist.append(d)
+            index.add(value, i)
+        return cls._from_candidates(values, np.array(earlier, dtype=np.int32), np.array(later, dtype=np.int32),
+                                    np.array(dist, dtype=np.uint8), max_distance, prefilter)
+
+    @classmethod
+    def _from_candidates(cls, values, earlier, later, dist, max_distance, prefilter):
+        if prefilter is not None:
+            keep, dist = cls._confirm(prefilter, earlier, later, dist, max_distance)
+            earlier, later, dist = earlier[keep], later[keep], dist[keep]
+        return cls(len(values), earlier, later, dist, max_distance, values, prefilter)
+
+    def _check(self, threshold):
+        if threshold > self.max_distance:
+            raise ValueError(f"閥值 {threshold} 超過鄰接圖建立時的上限 {self.max_distance}")
+
+    def pairs(self, threshold):
+        """回傳距離 <= threshold 的所有配對 (earlier, later, dist)。"""
+        self._check(threshold)
+        mask = self.dist <= threshold
+        return self.earlier[mask], self.later[mask], self.dist[mask]
+
+    def group_by_representative(self, threshold):
+        """結果與 group_by_representative(hashes, threshold) 完全相同，但只需要走訪圖上的邊。"""
+        self._check(threshold)
+        rep_group = np.full(self.count, -1, dtype=np.int64)
+        groups = []
+        indptr, earlier, dist = self.indptr, self.earlier, self.dist
+
+        for i in range(self.count):
+            start, stop = indptr[i], indptr[i + 1]
+            if start != stop:
+                neighbors = earlier[start:stop][dist[start:stop] <= threshold]
+                candidates = rep_group[neighbors]
+                candidates = candidates[candidates >= 0]
+                if candidates.size:
+                    groups[candidates.min()].append(i)
+                    continue
+            rep_group[i] = len(groups)
+            groups.append([i])
+        return groups
+
+    def connected_components(self, threshold):
+        """把距離 <= threshold 的邊視為相連，回傳所有連通分量 (遞移分群，即 single linkage)。"""
+        earlier, later, _ = self.pairs(threshold)
+        uf = UnionFind(self.count)
+        for a, b in zip(earlier.tolist(), later.tolist()):
+            uf.union(a, b)
+        return uf.groups()
+
+    def complete_linkage(self, threshold, max_diameter=None):
+        """
+        由距離最近的邊開始合併群組，但合併後群組內任兩張圖片的距離都不能超過
+        max_diameter (預設等於 threshold)，避免 single linkage 的鏈狀效應把差很多的圖片串在一起。
+
+        合併前先以三角不等式估計直徑上限，只有上限超過 max_diameter 時
+        才實際計算兩群之間的所有距離，因此大部分合併不需要額外計算。
+        串接比對的有效距離不滿足三角不等式，每次合併都實際計算。
+        """
+        self._check(threshold)
+        if self.values is None:
+            raise ValueError("鄰接圖沒有保存原始雜湊，無法進行完全連結分群")
+        if max_diameter is None:
+            max_diameter = threshold
+
+        earlier, later, dist = self.pairs(threshold)
+        order = np.lexsort((earlier, later, dist))
+        uf = UnionFind(self.count)
+        members = {}
+        diameter = {}
+        exact = self.prefilter is not None
+
+        for a, b, d in zip(earlier[order].tolist(), later[order].tolist(), dist[order].tolist()):
+            ra, rb = uf.find(a), uf.find(b)
+            if ra == rb:
+                continue
+            ma, mb = members.get(ra, [ra]), members.get(rb, [rb])
+            da, db = diameter.get(ra, 0), diameter.get(rb, 0)
+            bound = da + d + db
+            if exact or bound > max_diameter:
+                bound = int(self._distances(ma, mb).max())
+                if bound > max_diameter:
+                    continue
+            root = uf.union(ra, rb)
+            # 把較小的群組併入較大的群組，合併成本與群組大小的總和成線性對數
+            if len(ma) < len(mb):
+                ma, mb = mb, ma
+            ma.extend(mb)
+            members[root] = ma
+            diameter[root] = max(bound, da, db)
+            members.pop(ra if root == rb else rb, None)
+        return uf.groups()
+
+    def cluster(self, threshold, mode=DEFAULT_CLUSTER_MODE, max_diameter=None):
+        """依 mode 分群，mode 為 CLUSTER_MODES 其中之一。"""
+        if mode == 'representative':
+            return self.group_by_representative(threshold)
+        if mode == 'single':
+            return self.connected_components(threshold)
+        if mode == 'complete':
+            return self.complete_linkage(threshold, max_diameter)
+        raise ValueError(f"未知的分群方式: {mode} (可用: {', '.join(CLUSTER_MODES)})")
+
+
+def cluster_hashes(hashes, threshold, mode=DEFAULT_CLUSTER_MODE, max_diameter=None, index_kind=DEFAULT_INDEX):
+    """
+    依 mode 把雜湊分群，回傳以索引值組成的群組清單：
+    - representative：與原本相同，只和各群組的第一張代表圖片比較，結果與輸入順序有關。
+    - single：距離 <= threshold 的圖片遞移相連 (A~B、B~C 則 A、B、C 同組)，結果與順序無關。
+    - complete：同 single，但群組內任兩張圖片的距離都不超過 max_diameter (預設等於 threshold)。
+    hashes 為 CascadeHashes 時一律透過 NeighborGraph 分群，才能以預篩雜湊確認候選配對。
+    """
+    if mode not in CLUSTER_MODES:
+        raise ValueError(f"未知的分群方式: {mode} (可用: {', '.join(CLUSTER_MODES)})")
+    if mode == 'representative' and getattr(hashes, 'prefilter', None) is None:
+        return group_by_representative(hashes, threshold, index_kind)
+    graph = NeighborGraph.from_index(hashes, threshold, index_kind)
+    return graph.cluster(threshold, mode, max_diameter)
@@ -0,0 +1,489 @@
+"""
+把整個資料夾 (檔案庫) 的圖片雜湊預先建成一個索引檔，之後只需要計算新文件的圖片雜湊，
+就能查出它是否重複使用了檔案庫中的圖片，不必把新文件放進資料夾重新掃描全部。
+
+索引檔格式 (小端序，可直接以 mmap 唯讀開啟)：
+- 標頭：magic、版本、max_distance、圖片數，以及各區段的位移
+- hashes：uint64[N]，每張圖片的 64-bit 雜湊
+- perms：uint32[S][N]，多重索引雜湊的 S = max_distance + 1 段，
+  每段一個依該段數值排序的圖片索引，查詢時以二分搜尋找出該段完全相同的候選者
+- meta_offsets / meta：每張圖片的位置資訊 (JSON)，只有命中時才解碼
+- info：建立時的雜湊算法、文件清單、分片編號等 (JSON)
+
+大型檔案庫可以分成 N 個分片在多台機器上各自建立部分索引，再以 merge 合併並分群，
+結果與單機完整掃描相同。
+
+用法:
+    python corpus_index.py build-index /檔案庫/資料夾 archive.idx
+    python corpus_index.py query archive.idx 新文件.docx --threshold 5
+    python corpus_index.py build-index /檔案庫/資料夾 part1.idx --shard 1/4   (每個分片各執行一次)
+    python corpus_index.py merge part1.idx part2.idx part3.idx part4.idx --output archive.idx
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import argparse
+import multiprocessing
+
+import numpy as np
+
+from docx_scanner import scan_docx_source, scan_files, PhashHasher, DEFAULT_MAX_PIXELS
+from hash_cache import HashCache
+from hash_index import split_segments, hamming_distances, pack_hashes, int_to_hex, PackedHashes, INDEX_TYPES, DEFAULT_INDEX
+from clustering import CLUSTER_MODES, DEFAULT_CLUSTER_MODE
+from find_docx_duplicates import report_duplicates, parse_thresholds
+from scan_engine import find_docx_files
+from discovery import add_discovery_arguments, discovery_options, document_order
+from report_writers import add_report_arguments, report_targets
+
+MAGIC = b'DOCXIDX1'
+VERSION = 1
+DEFAULT_INDEX_DISTANCE = 8
+
+# magic, 版本, max_distance, 圖片數, hashes/perms/meta_offsets/meta/info 的位移, info 長度
+_HEADER = struct.Struct('<8sIIQQQQQQQ')
+
+
+def _align(offset, size=8):
+    return (offset + size - 1) // size * size
+
+
+def write_index(path, records, hashes, max_distance=DEFAULT_INDEX_DISTANCE, variant='phash-reduced', folder=None,
+                documents=None, shard=None):
+    """
+    把 records (filename、docx_path、image_name、context、page、member) 與對應的 hashes
+    寫成索引檔。先寫到暫存檔再改名，寫入途中中斷不會留下不完整的索引。
+
+    documents 為處理過的所有文件 (包含沒有圖片的文件)，未提供時由 records 推得；
+    shard 為 (i, N)，表示這是第 i 個分片的部分索引。
+    """
+    values = pack_hashes(hashes.tolist() if hasattr(hashes, 'tolist') else hashes)
+    count = len(values)
+    if count >= 2 ** 32:
+        raise ValueError("圖片數超過索引檔上限")
+    segments = split_segments(max_distance)
+
+    documents = list(documents or [])
+    doc_ids = {path: i for i, path in enumerate(documents)}
+    meta_parts = []
+    for rec in records:
+        doc_id = doc_ids.get(rec['docx_path'])
+        if doc_id is None:
+            doc_id = doc_ids[rec['docx_path']] = len(documents)
+            documents.append(rec['docx_path'])
+        meta_parts.append(json.dumps([doc_id, rec['image_name'], rec['context'], rec['page'], rec['member']],
+                                     ensure_ascii=False).encode('utf-8'))
+    meta_offsets = np.zeros(count + 1, dtype='<u8')
+    np.cumsum([len(m) for m in meta_parts], out=meta_offsets[1:])
+    info = json.dumps({'variant': variant, 'folder': folder, 'documents': documents, 'shard': shard,
+                       'created': time.time()}, ensure_ascii=False).encode('utf-8')
+
+    hashes_offset = _HEADER.size
+    perms_offset = hashes_offset + 8 * count
+    meta_offsets_offset = _align(perms_offset + 4 * count * len(segments))
+    meta_offset = meta_offsets_offset + 8 * (count + 1)
+    info_offset = meta_offset + int(meta_offsets[-1])
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, max_distance, count, hashes_offset, perms_offset,
+                             meta_offsets_offset, meta_offset, info_offset, len(info)))
+        f.write(values.astype('<u8').tobytes())
+        for shift, mask in segments:
+            keys = (values >> np.uint64(shift)) & np.uint64(mask)
+            f.write(np.argsort(keys, kind='stable').astype('<u4').tobytes())
+        f.write(b'\0' * (meta_offsets_offset - f.tell()))
+        f.write(meta_offsets.tobytes())
+        for part in meta_parts:
+            f.write(part)
+        f.write(info)
+    os.replace(tmp_path, path)
+
+
+class CorpusIndex:
+    """以 mmap 唯讀開啟的索引檔，開啟時只讀標頭與文件清單，其餘資料由作業系統按需載入。"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # 空檔案無法 mmap
+                raise ValueError(f"不是有效的索引檔: {path}")
+        try:
+            (magic, version, self.max_distance, self.count, hashes_offset, perms_offset,
+             meta_offsets_offset, meta_offset, info_offset, info_size) = _HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            raise ValueError(f"不是有效的索引檔: {path}")
+        if magic != MAGIC:
+            raise ValueError(f"不是有效的索引檔: {path}")
+        if version != VERSION:
+            raise ValueError(f"索引檔版本 {version} 不支援，請重新建立索引")
+
+        self.segments = split_segments(self.max_distance)
+        self.hashes = np.frombuffer(self._mm, dtype='<u8', count=self.count, offset=hashes_offset)
+        self.perms = [
+            np.frombuffer(self._mm, dtype='<u4', count=self.count, offset=perms_offset + 4 * self.count * i)
+            for i in range(len(self.segments))
+        ]
+        self._meta_offsets = np.frombuffer(self._mm, dtype='<u8', count=self.count + 1, offset=meta_offsets_offset)
+        self._meta_offset = meta_offset
+        info = json.loads(self._mm[info_offset:info_offset + info_size].decode('utf-8'))
+        self.variant = info['variant']
+        self.folder = info['folder']
+        self.documents = info['documents']
+        self.shard = tuple(info['shard']) if info.get('shard') else None
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        # numpy 陣列仍參照 mmap 時無法關閉，先釋放參照
+        self.hashes = self.perms = self._meta_offsets = None
+        self._mm.close()
+
+    def _bisect(self, perm, shift, mask, key, upper):
+        """在依 (hash >> shift) & mask 排序的 perm 中二分搜尋 key 的左界 (upper=True 時為右界)。"""
+        lo, hi = 0, self.count
+        hashes = self.hashes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = (int(hashes[perm[mid]]) >> shift) & mask
+            if value < key or (upper and value == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def query(self, value, radius):
+        """回傳 (索引值陣列, 距離陣列)，包含所有距離 <= radius 的圖片，依索引值排序。"""
+        if radius > self.max_distance:
+            # 超過建立時的距離上限，鴿籠原理不再成立，改為全部比較
+            d = hamming_distances(value, self.hashes)
+            found = np.flatnonzero(d <= radius)
+            return found, d[found]
+
+        candidates = []
+        for (shift, mask), perm in zip(self.segments, self.perms):
+            key = (value >> shift) & mask
+            lo = self._bisect(perm, shift, mask, key, False)
+            hi = self._bisect(perm, shift, mask, key, True)
+            if hi > lo:
+                candidates.append(perm[lo:hi])
+        if not candidates:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+        # 先過濾距離再去除重複，命中的數量通常遠少於候選者
+        candidates = np.concatenate(candidates)
+        d = hamming_distances(value, self.hashes[candidates])
+        keep = d <= radius
+        found, first = np.unique(candidates[keep], return_index=True)
+        return found.astype(np.int64), d[keep][first]
+
+    def record(self, i):
+        """第 i 張圖片的位置資訊 (與掃描結果的紀錄格式相同，hash 為整數)。"""
+        start, stop = int(self._meta_offsets[i]), int(self._meta_offsets[i + 1])
+        doc_id, image_name, context, page, member = json.loads(
+            self._mm[self._meta_offset + start:self._meta_offset + stop].decode('utf-8'))
+        docx_path = self.documents[doc_id]
+        return {
+            'filename': os.path.basename(docx_path),
+            'image_name': image_name,
+            'context': context,
+            'page': page,
+            'docx_path': docx_path,
+            'member': member,
+            'hash': int(self.hashes[i]),
+        }
+
+
+def hasher_for_variant(variant, max_pixels=DEFAULT_MAX_PIXELS):
+    """依索引檔記錄的雜湊算法名稱建立相同的計算器，確保查詢與建立時的雜湊可以比較。"""
+    for hasher in (PhashHasher(reduced_decode=True, max_pixels=max_pixels),
+                   PhashHasher(reduced_decode=False, max_pixels=max_pixels)):
+        if hasher.name == variant:
+            return hasher
+    raise ValueError(f"不支援的雜湊算法: {variant}")
+
+
+def hash_document(docx_path, hasher, log=print, filename=None):
+    """
+    計算單一文件中每張圖片的雜湊，回傳不含圖片內容的紀錄清單。
+    docx_path 可以是路徑或檔案物件 (此時以 filename 作為顯示名稱)。
+    個別圖片無法解析時以 log 回報並略過；整份文件無法開啟或解析時丟出 ValueError。
+    """
+    source = None
+    if hasattr(docx_path, 'read'):
+        docx_path, source = filename or 'upload.docx', docx_path
+    messages = []
+    records, ok = scan_docx_source(docx_path, source, messages.append, hasher)
+    if not ok:
+        raise ValueError(messages.pop())
+    for msg in messages:
+        log(msg)
+    if filename is not None:
+        for rec in records:
+            rec['filename'] = filename
+    return records
+
+
+def parse_shard(text):
+    """解析 --shard 的 "i/N" (1 <= i <= N)。"""
+    try:
+        i, n = (int(v) for v in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的分片: {text} (格式為 i/N，例如 1/4)")
+    if not 1 <= i <= n:
+        raise argparse.ArgumentTypeError(f"無效的分片: {text} (i 必須介於 1 與 N 之間)")
+    return i, n
+
+
+def shard_of(docx_path, count):
+    """
+    依檔名的 CRC32 決定文件屬於哪個分片 (1 起算)。
+    只看檔名本身，與其他檔案或資料夾在各台機器上的掛載路徑無關，新增檔案也不會改變既有檔案的分片。
+    """
+    return zlib.crc32(os.path.basename(docx_path).encode('utf-8')) % count + 1
+
+
+def _document_order(docx_path, folder):
+    # 與 find_docx_duplicates 相同的走訪順序；舊版索引記錄的是相對路徑且只有最上層的文件，依檔名排序即可
+    if not os.path.isabs(docx_path):
+        return (os.path.basename(docx_path),), docx_path
+    if folder is None:
+        # 合併後的索引沒有單一的來源資料夾
+        return tuple(docx_path.split(os.sep)), docx_path
+    return document_order(docx_path, folder), docx_path
+
+
+def merge_indexes(paths):
+    """
+    讀取多個分片的部分索引，依單機完整掃描時的文件順序合併。
+    回傳 (documents, records, hashes, variant)，records 不含 hash，hashes 與 records 對應。
+    """
+    variant = None
+    shard_count = None
+    seen_shards = set()
+    by_document = {}
+    order = {}
+    for path in paths:
+        with CorpusIndex(path) as index:
+            if variant is None:
+                variant = index.variant
+            elif index.variant != variant:
+                raise ValueError(f"{path} 的雜湊算法 {index.variant} 與其他分片 ({variant}) 不同，無法合併")
+            if index.shard is not None:
+                i, n = index.shard
+                if shard_count is None:
+                    shard_count = n
+                elif n != shard_count:
+                    raise ValueError(f"{path} 屬於 {n} 個分片的掃描，與其他分片 ({shard_count}) 不同")
+                if i in seen_shards:
+                    raise ValueError(f"分片 {i}/{n} 重複出現 ({path})")
+                seen_shards.add(i)
+
+            for docx_path in index.documents:
+                if docx_path in by_document:
+                    raise ValueError(f"文件 {docx_path} 同時出現在多個索引中")
+                by_document[docx_path] = []
+                order[docx_path] = _document_order(docx_path, index.folder)
+            for i in range(len(index)):
+                rec = index.record(i)
+                by_document[rec['docx_path']].append(rec)
+
+    if shard_count is not None and len(seen_shards) != shard_count:
+        missing = sorted(set(range(1, shard_count + 1)) - seen_shards)
+        print(f"警告：缺少分片 {', '.join(f'{i}/{shard_count}' for i in missing)}，結果不包含這些文件")
+
+    documents = sorted(by_document, key=order.get)
+    records = []
+    hashes = []
+    for docx_path in documents:
+        for rec in by_document[docx_path]:
+            hashes.append(rec.pop('hash'))
+            records.append(rec)
+    return documents, records, hashes, variant
+
+
+def build_index(args):
+    folder_path = args.folder
+    if not os.path.isdir(folder_path):
+        print(f"錯誤：找不到指定的資料夾 '{folder_path}'")
+        sys.exit(1)
+
+    # 索引記錄文件的絕對路徑，合併分片時才能依相對於資料夾的路徑排回單機掃描的順序
+    docx_files = find_docx_files(os.path.abspath(folder_path), **discovery_options(args))
+    if args.shard is not None:
+        i, n = args.shard
+        total = len(docx_files)
+        docx_files = [f for f in docx_files if shard_of(f, n) == i]
+        print(f"分片 {i}/{n}：負責 {total} 個 docx 檔案中的 {len(docx_files)} 個，開始計算圖片雜湊...")
+    else:
+        print(f"找到 {len(docx_files)} 個 docx 檔案，開始計算圖片雜湊...")
+
+    hasher = PhashHasher(reduced_decode=not args.full_decode, max_pixels=args.max_pixels)
+    cache = HashCache(args.cache_path, variant=hasher.name) if args.cache else None
+    records = []
+    hashes = []
+    start = time.perf_counter()
+    try:
+        for df, recs, messages in scan_files(docx_files, args.workers, cache, hasher):
+            for msg in messages:
+                print(msg)
+            for rec in recs:
+                hashes.append(rec.pop('hash'))
+                records.append(rec)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    write_index(args.output, records, hashes, args.max_distance, hasher.name, os.path.abspath(folder_path),
+                docx_files, args.shard)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(args.output)
+    print(f"已建立索引 {args.output}：{len(docx_files)} 份文件、{len(records)} 張圖片，"
+          f"{size / 1024 / 1024:.1f} MiB，耗時 {elapsed:.1f} 秒")
+
+
+def query_index(args):
+    # 錯誤訊息一律輸出到 stderr，--json 時 stdout 只有 JSON Lines
+    log = lambda msg: print(msg, file=sys.stderr)
+    try:
+        index = CorpusIndex(args.index)
+    except (OSError, ValueError) as e:
+        log(f"錯誤：無法開啟索引檔：{e}")
+        sys.exit(2)
+    with index:
+        hasher = hasher_for_variant(index.variant, args.max_pixels)
+        found_any = False
+        failed = False
+        for docx_path in args.docx:
+            start = time.perf_counter()
+            try:
+                records = hash_document(docx_path, hasher, log)
+            except ValueError as e:
+                log(str(e))
+                failed = True
+                continue
+            hashed = time.perf_counter()
+            results = []
+            for rec in records:
+                found, dist = index.query(rec['hash'], args.threshold)
+                matches = [dict(index.record(int(i)), distance=int(d)) for i, d in zip(found, dist)]
+                matches.sort(key=lambda m: (m['distance'], m['docx_path'], m['page']))
+                results.append((rec, matches))
+            searched = time.perf_counter()
+
+            if args.json:
+                for rec, matches in results:
+                    print(json.dumps({
+                        'query': {k: rec[k] for k in ('filename', 'image_name', 'context', 'page')} | {'hash': int_to_hex(rec['hash'])},
+                        'matches': [{k: m[k] for k in ('filename', 'image_name', 'context', 'page', 'distance')} | {'hash': int_to_hex(m['hash'])}
+                                    for m in matches],
+                    }, ensure_ascii=False))
+                found_any = found_any or any(matches for _, matches in results)
+                continue
+
+            print(f"\n📄 {os.path.basename(docx_path)}：{len(records)} 張圖片，"
+                  f"計算雜湊 {(hashed - start) * 1000:.1f} ms，查詢 {(searched - hashed) * 1000:.1f} ms "
+                  f"(索引共 {len(index)} 張圖片)")
+            for rec, matches in results:
+                if not matches:
+                    continue
+                found_any = True
+                print(f"\n  🖼 第 {rec['page']} 頁 {rec['image_name']} ({rec['context']}) 與檔案庫中 {len(matches)} 張圖片相似:")
+                for m in matches:
+                    print(f"    📂 {m['filename']} 第 {m['page']} 頁 {m['image_name']} ({m['context']})，距離 {m['distance']}")
+            if not any(matches for _, matches in results):
+                print("  🎉 沒有與檔案庫重複的圖片。")
+    # 找到重複時以結束碼 1 回報，有文件或索引檔無法讀取時以 2 回報 (優先)，方便在自動化流程中判斷
+    sys.exit(2 if failed else 1 if found_any else 0)
+
+
+def merge_command(args):
+    start = time.perf_counter()
+    documents, records, hashes, variant = merge_indexes(args.parts)
+    print(f"已合併 {len(args.parts)} 個索引：{len(documents)} 份文件、{len(records)} 張圖片，"
+          f"耗時 {time.perf_counter() - start:.1f} 秒")
+
+    if args.output:
+        write_index(args.output, records, hashes, args.max_distance, variant, documents=documents)
+        print(f"合併後的索引已寫入 {args.output}")
+
+    if not args.no_report:
+        report_duplicates(records, PackedHashes(hashes), args.threshold, args.thresholds, args.cluster_mode,
+                          args.max_diameter, args.index, targets=report_targets(args),
+                          folder_path=_common_folder(records), file_count=len(documents))
+
+
+def _common_folder(records):
+    """報告摘要中顯示的資料夾：所有文件共同的上層資料夾 (混用絕對與相對路徑時為空字串)。"""
+    try:
+        return os.path.commonpath([os.path.dirname(rec['docx_path']) for rec in records])
+    except ValueError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="建立檔案庫圖片索引，並查詢新文件是否重複使用檔案庫中的圖片。")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build-index", help="掃描資料夾並建立索引檔")
+    build.add_argument("folder", help="檔案庫資料夾")
+    build.add_argument("output", help="索引檔輸出路徑")
+    build.add_argument("--max-distance", type=int, default=DEFAULT_INDEX_DISTANCE,
+                       help=f"查詢時可快速搜尋的最大閥值 (預設 {DEFAULT_INDEX_DISTANCE})，超過時改為全部比較")
+    build.add_argument("--workers", type=int, default=1, help="同時處理文件的行程數 (預設 1，0 代表使用所有 CPU 核心)")
+    build.add_argument("--cache", action=argparse.BooleanOptionalAction, default=True, help="使用本機雜湊快取 (預設開啟)")
+    build.add_argument("--cache-path", default=None, help="快取檔位置")
+    build.add_argument("--full-decode", action="store_true", help="以原始解析度解碼圖片後再計算雜湊")
+    build.add_argument("--max-pixels", type=int, default=DEFAULT_MAX_PIXELS, help="單張圖片的像素上限，0 代表只套用 PIL 內建的上限")
+    build.add_argument("--shard", type=parse_shard, default=None,
+                       help="只處理第 i 個分片 (格式 i/N，例如 1/4)，輸出可用 merge 合併的部分索引")
+    add_discovery_arguments(build)
+    build.set_defaults(func=build_index)
+
+    query = subparsers.add_parser("query", help="查詢新文件的圖片是否出現在索引中",
+                                  description="查詢新文件的圖片是否出現在索引中。結束碼：0 沒有重複、1 找到重複、"
+                                              "2 索引檔或文件無法開啟或解析 (錯誤訊息輸出到 stderr)。")
+    query.add_argument("index", help="以 build-index 建立的索引檔")
+    query.add_argument("docx", nargs="+", help="要查詢的 docx 檔案")
+    query.add_argument("--threshold", type=int, default=5, help="圖片相似度寬容閥值 (預設 5)")
+    query.add_argument("--json", action="store_true", help="以 JSON Lines 輸出，每張圖片一行")
+    query.add_argument("--max-pixels", type=int, default=DEFAULT_MAX_PIXELS, help="單張圖片的像素上限，0 代表只套用 PIL 內建的上限")
+    query.set_defaults(func=query_index)
+
+    merge = subparsers.add_parser("merge", help="合併各分片的部分索引，並以與單機掃描相同的方式分群輸出報告")
+    merge.add_argument("parts", nargs="+", help="以 build-index --shard 建立的部分索引")
+    merge.add_argument("--output", default=None, help="同時寫出合併後的完整索引檔 (可供 query 使用)")
+    merge.add_argument("--max-distance", type=int, default=DEFAULT_INDEX_DISTANCE, help="合併後索引的距離上限")
+    merge.add_argument("--threshold", type=int, default=5, help="圖片相似度寬容閥值 (預設 5)")
+    merge.add_argument("--thresholds", type=parse_thresholds, default=None, help="一次輸出多個閥值的結果，以逗號分隔")
+    merge.add_argument("--cluster-mode", choices=CLUSTER_MODES, default=DEFAULT_CLUSTER_MODE, help="分群方式")
+    merge.add_argument("--max-diameter", type=int, default=None, help="complete 分群時群組內允許的最大距離")
+    merge.add_argument("--index", choices=sorted(INDEX_TYPES), default=DEFAULT_INDEX, help="分群時使用的近鄰搜尋索引")
+    merge.add_argument("--no-report", action="store_true", help="只合併索引，不輸出分群報告")
+    add_report_arguments(merge)
+    merge.set_defaults(func=merge_command)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except ValueError as e:
+        print(f"錯誤：{e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
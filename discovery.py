@@ -0,0 +1,188 @@
+"""
+找出要掃描的 docx 文件：以 os.scandir 逐層走訪資料夾 (預設包含子資料夾)，邊走訪邊產生路徑，
+掃描可以在走訪完成前就開始處理，不需要先列出整個檔案庫。
+
+- include / exclude 以 glob 樣式比對相對於根目錄的路徑或檔名，exclude 也會略過整個子資料夾；
+- 可限制檔案大小；
+- 跟隨符號連結時記錄走訪過的資料夾 (裝置與 inode)，不會因為連結形成迴圈而無限走訪；
+- 根目錄下的 report/ 是報告輸出資料夾，預設略過。
+
+每個資料夾內依名稱排序後深度優先走訪，因此順序固定，與檔案系統回傳的順序無關；
+document_order() 可以不經走訪算出相同的順序 (合併分片索引時使用)。
+"""
+import os
+import fnmatch
+import argparse
+
+# 根目錄下預設略過的資料夾 (報告輸出位置)
+DEFAULT_SKIP_DIRS = ('report',)
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def is_docx_file(name):
+    """副檔名為 .docx，並排除 Word 開啟文件時產生的 ~$ 暫存檔。"""
+    return name.lower().endswith('.docx') and not name.startswith('~')
+
+
+def parse_size(text):
+    """解析檔案大小，可加上 K、M、G (1024 進位) 單位，例如 "500K"、"50M"。"""
+    value = text.strip().upper().removesuffix('B').removesuffix('I')
+    unit = value[-1:] if value[-1:] in _SIZE_UNITS else ''
+    try:
+        size = float(value[:len(value) - len(unit)]) * _SIZE_UNITS[unit]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的檔案大小: {text} (例如 500K、50M)")
+    if size < 0:
+        raise argparse.ArgumentTypeError(f"無效的檔案大小: {text}")
+    return int(size)
+
+
+def document_order(docx_path, root):
+    """文件在走訪順序中的排序鍵：相對於 root 的路徑各層名稱。"""
+    return tuple(os.path.relpath(docx_path, root).split(os.sep))
+
+
+class DocumentWalker:
+    """
+    可重複走訪的 docx 文件清單，for path in walker 逐一產生路徑。
+
+    走訪時更新 discovered (已找到的文件數)、skipped (依原因統計略過的文件或資料夾數) 與 errors (無法讀取的資料夾)，
+    finished 在走訪完成後為 True，掃描時可以用來顯示「已處理 / 已找到」的進度。
+    """
+
+    SKIP_REASONS = (('pattern', '不符合篩選條件'), ('size', '不符合大小限制'), ('directory', '略過的資料夾'),
+                    ('loop', '重複或形成迴圈的符號連結'))
+
+    def __init__(self, root, recursive=True, include=(), exclude=(), min_size=0, max_size=None,
+                 follow_symlinks=False, skip_dirs=DEFAULT_SKIP_DIRS):
+        self.root = root
+        self.recursive = recursive
+        self.include = tuple(include or ())
+        self.exclude = tuple(exclude or ())
+        self.min_size = min_size or 0
+        self.max_size = max_size
+        self.follow_symlinks = follow_symlinks
+        self.skip_dirs = tuple(skip_dirs or ())
+        self._reset()
+
+    def _reset(self):
+        self.discovered = 0
+        self.skipped = {}
+        self.errors = []
+        self.finished = False
+
+    def __iter__(self):
+        for path, _ in self.iter_entries():
+            yield path
+
+    def _skip(self, reason):
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def _matches(self, patterns, rel_path, name):
+        return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+    def _scandir(self, folder):
+        """依名稱排序的資料夾內容；無法讀取時記錄錯誤並視為空資料夾。"""
+        try:
+            with os.scandir(folder) as it:
+                return sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            self.errors.append(f"無法讀取資料夾 {folder}: {e}")
+            return []
+
+    def _enter_dir(self, entry, rel_path, visited):
+        if rel_path in self.skip_dirs or self._matches(self.exclude, rel_path, entry.name):
+            self._skip('directory')
+            return False
+        if self.follow_symlinks:
+            try:
+                stat = entry.stat()
+            except OSError:
+                return False
+            key = (stat.st_dev, stat.st_ino)
+            if key in visited:
+                self._skip('loop')
+                return False
+            visited.add(key)
+        return True
+
+    def iter_entries(self):
+        """逐一產生 (路徑, os.stat_result)，監看模式以此比對檔案大小與修改時間。"""
+        self._reset()
+        visited = set()
+        if self.follow_symlinks:
+            try:
+                stat = os.stat(self.root)
+                visited.add((stat.st_dev, stat.st_ino))
+            except OSError:
+                pass
+        # 以堆疊取代遞迴，很深的資料夾結構也不會超過遞迴上限
+        stack = [(iter(self._scandir(self.root)), '')]
+        while stack:
+            entries, rel_dir = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=self.follow_symlinks)
+            except OSError:
+                continue
+            if is_dir:
+                if self.recursive and self._enter_dir(entry, rel_path, visited):
+                    stack.append((iter(self._scandir(entry.path)), rel_path))
+                continue
+
+            if not is_docx_file(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                # 檔案在列出後被刪除
+                continue
+            if (self.include and not self._matches(self.include, rel_path, entry.name)) \
+                    or self._matches(self.exclude, rel_path, entry.name):
+                self._skip('pattern')
+                continue
+            if stat.st_size < self.min_size or (self.max_size is not None and stat.st_size > self.max_size):
+                self._skip('size')
+                continue
+            self.discovered += 1
+            yield entry.path, stat
+        self.finished = True
+
+    def summary_lines(self):
+        skipped = "，".join(f"{label} {self.skipped[reason]}" for reason, label in self.SKIP_REASONS
+                           if self.skipped.get(reason))
+        lines = [f"共找到 {self.discovered} 個 docx 檔案" + (f" (略過：{skipped})" if skipped else "")]
+        lines.extend(self.errors)
+        return lines
+
+
+def add_discovery_arguments(parser):
+    """加入找文件的選項，find_docx_duplicates.py 與 corpus_index.py 共用。"""
+    parser.add_argument("--recursive", action=argparse.BooleanOptionalAction, default=True,
+                        help="包含子資料夾中的文件 (預設開啟，--no-recursive 只掃描最上層)")
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="只處理相對路徑或檔名符合 glob 樣式的文件，可指定多次 (例如 --include '2024/*')")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="略過相對路徑或檔名符合 glob 樣式的文件與資料夾，可指定多次 (例如 --exclude '*/草稿')")
+    parser.add_argument("--min-size", type=parse_size, default=0, help="略過小於此大小的文件 (例如 10K)")
+    parser.add_argument("--max-size", type=parse_size, default=None, help="略過大於此大小的文件 (例如 200M)")
+    parser.add_argument("--follow-symlinks", action="store_true", help="走訪符號連結指向的資料夾 (會避開連結形成的迴圈)")
+
+
+def discovery_options(args):
+    """把 add_discovery_arguments 的選項轉成 DocumentWalker 的參數。"""
+    return {
+        'recursive': args.recursive,
+        'include': args.include,
+        'exclude': args.exclude,
+        'min_size': args.min_size,
+        'max_size': args.max_size,
+        'follow_symlinks': args.follow_symlinks,
+    }
@@ -0,0 +1,1138 @@
+"""
+解析 docx 並計算圖片感知雜湊的共用邏輯，CLI 與 GUI 都透過這裡處理單一文件。
+"""
+import os
+import io
+import time
+import queue
+import hashlib
+import zipfile
+import threading
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.fft
+from PIL import Image
+import imagehash
+
+from hash_index import hash_to_int, HASH_BITS, PackedHashes, CascadeHashes
+from profiling import DocumentTimer, add_stage
+
+# Docx XML 檔案中常用的命名空間
+NS = {
+    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'pic': 'http://schemas.openxmlformats.org/drawingml/2006/picture',
+    'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
+}
+
+
+_W_BODY = f"{{{NS['w']}}}body"
+_W_P = f"{{{NS['w']}}}p"
+_W_PPR = f"{{{NS['w']}}}pPr"
+_W_PSTYLE = f"{{{NS['w']}}}pStyle"
+_W_T = f"{{{NS['w']}}}t"
+_W_BR = f"{{{NS['w']}}}br"
+_W_LAST_PAGE_BREAK = f"{{{NS['w']}}}lastRenderedPageBreak"
+_W_DRAWING = f"{{{NS['w']}}}drawing"
+_W_VAL = f"{{{NS['w']}}}val"
+_W_TYPE = f"{{{NS['w']}}}type"
+_A_BLIP = f"{{{NS['a']}}}blip"
+_R_EMBED = f"{{{NS['r']}}}embed"
+
+# 暫存動作的種類
+_PAGE_BREAK = 0
+_PARAGRAPH = 1
+_DRAWING = 2
+
+
+def iter_image_refs(docx_zip):
+    """
+    依文件順序走訪 document.xml，產生每一個圖片參照的資訊 (不讀取圖片內容)。
+    每筆包含 member (zip 內路徑)、image_name、context 與 page。
+
+    document.xml 以 iterparse 串流解析，處理完的元素會立即清除，
+    分頁、標題、上下文與圖片都在同一次走訪中追蹤，記憶體用量與文件大小無關。
+    """
+    names = set(docx_zip.namelist())
+
+    # 1. 讀取關聯檔 (_rels) 來取得關聯 ID 與實體圖檔路徑的映射關係
+    rels_path = 'word/_rels/document.xml.rels'
+    if rels_path not in names:
+        return
+
+    rels_tree = ET.fromstring(docx_zip.read(rels_path))
+    rel_map = {}
+    for rel in rels_tree.findall('.//{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'):
+        rel_id = rel.get('Id')
+        target = rel.get('Target')
+        if target.startswith('media/'):
+            rel_map[rel_id] = target
+
+    # 2. 讀取主文件內容，依序解析段落與圖片
+    doc_path = 'word/document.xml'
+    if doc_path not in names:
+        return
+
+    current_chapter = "開頭/未命名章節"
+    recent_text_buffer = []
+
+    # 嘗試計算頁數：Word 在分頁時通常會插入 <w:lastRenderedPageBreak> 或 <w:br w:type="page"/>
+    current_page = 1
+
+    # 段落的文字要等到段落結束才完整，但段落本身要比它裡面的圖片先處理，
+    # 所以分頁、段落、圖片先依出現順序暫存，等所有段落都結束後再依序處理。
+    pending = []
+    open_paragraphs = []  # [_PARAGRAPH, 文字片段, 樣式]
+    open_drawings = []    # [_DRAWING, embed ID 清單]
+    tag_stack = []
+    body = None
+
+    with docx_zip.open(doc_path) as doc_stream:
+        for event, elem in ET.iterparse(doc_stream, events=('start', 'end')):
+            tag = elem.tag
+
+            if event == 'start':
+                if body is not None:
+                    if tag == _W_P:
+                        action = [_PARAGRAPH, [], None]
+                        pending.append(action)
+                        open_paragraphs.append(action)
+                    elif tag == _W_LAST_PAGE_BREAK or (tag == _W_BR and elem.get(_W_TYPE) == "page"):
+                        pending.append((_PAGE_BREAK,))
+                    elif tag == _W_PSTYLE:
+                        # 只採用段落屬性 (w:p/w:pPr/w:pStyle) 中的樣式
+                        if open_paragraphs and tag_stack[-1] == _W_PPR and tag_stack[-2] == _W_P and open_paragraphs[-1][2] is None:
+                            open_paragraphs[-1][2] = elem.get(_W_VAL)
+                    elif tag == _W_DRAWING:
+                        action = [_DRAWING, []]
+                        pending.append(action)
+                        open_drawings.append(action)
+                    elif tag == _A_BLIP:
+                        embed_id = elem.get(_R_EMBED)
+                        for drawing in open_drawings:
+                            drawing[1].append(embed_id)
+                elif tag == _W_BODY:
+                    body = elem
+                tag_stack.append(tag)
+                continue
+
+            tag_stack.pop()
+            if body is None:
+                continue
+            if tag == _W_T:
+                if elem.text:
+                    for paragraph in open_paragraphs:
+                        paragraph[1].append(elem.text)
+            elif tag == _W_P:
+                open_paragraphs.pop()
+            elif tag == _W_DRAWING:
+                open_drawings.pop()
+            elif tag == _W_BODY:
+                break
+
+            if not open_paragraphs and pending:
+                for action in pending:
+                    kind = action[0]
+
+                    # 計算頁碼
+                    if kind == _PAGE_BREAK:
+                        current_page += 1
+
+                    # 處理段落
+                    elif kind == _PARAGRAPH:
+                        para_text = "".join(action[1]).strip()
+                        if para_text:
+                            # 檢查這段文字的樣式是不是標題 (Heading)
+                            style_val = action[2]
+                            if style_val and style_val.startswith('Heading'):
+                                current_chapter = para_text
+                                recent_text_buffer = [] # 遇到新標題就清空上下文
+
+                            recent_text_buffer.append(para_text)
+                            # 只保留最近兩段有文字的段落作為上下文參考
+                            if len(recent_text_buffer) > 2:
+                                recent_text_buffer.pop(0)
+
+                    # 處理圖片
+                    else:
+                        for embed_id in action[1]:
+                            if embed_id and embed_id in rel_map:
+                                target_media = 'word/' + rel_map[embed_id]
+                                if target_media in names:
+                                    context = current_chapter
+                                    if current_chapter == "開頭/未命名章節" and recent_text_buffer:
+                                        context = f"上下文: {' '.join(recent_text_buffer)}"
+
+                                    yield {
+                                        'member': target_media,
+                                        'image_name': target_media.split('/')[-1],
+                                        'context': context[:50] + "..." if len(context) > 50 else context,
+                                        'page': current_page,
+                                    }
+                pending.clear()
+
+            # 釋放已處理完的元素；body 底下的頂層元素結束時連同外殼一起移除
+            elem.clear()
+            if tag_stack and tag_stack[-1] == _W_BODY:
+                body.clear()
+
+
+def extract_images_from_docx(docx_path, filename=None):
+    """
+    解析 Docx 壓縮檔，逐一產生裡面的圖片以及其所在的章節、頁數或上下文。
+
+    這是產生器：每張圖片的 bytes 在被取用時才從壓縮檔讀出，
+    呼叫端處理完就可以丟掉，不會一次把整份文件的圖片都留在記憶體中。
+    docx_path 也可以是已開啟的檔案物件 (例如上傳內容的 BytesIO)，此時以 filename 作為顯示名稱。
+    """
+    if filename is None:
+        filename = os.path.basename(docx_path)
+    try:
+        with zipfile.ZipFile(docx_path, 'r') as docx_zip:
+            for ref in iter_image_refs(docx_zip):
+                zinfo = docx_zip.getinfo(ref['member'])
+                yield {
+                    'filename': filename,
+                    'image_name': ref['image_name'],
+                    'context': ref['context'],
+                    'page': ref['page'],
+                    'docx_path': docx_path,
+                    'member': ref['member'],
+                    'crc': zinfo.CRC,
+                    'file_size': zinfo.file_size,
+                    'bytes': docx_zip.read(zinfo),
+                }
+    except Exception as e:
+        print(f"處理檔案時發生錯誤 {docx_path}: {e}")
+
+
+def read_image_bytes(record):
+    """
+    依紀錄中的 docx_path 與 member 重新從壓縮檔讀出圖片內容。
+    掃描結果只保留這兩個欄位作為延遲讀取的依據，需要縮圖等用途時再呼叫。
+    """
+    with zipfile.ZipFile(record['docx_path'], 'r') as docx_zip:
+        return docx_zip.read(record['member'])
+
+
+def load_thumbnail(record, size):
+    """讀出紀錄對應的圖片並縮成最長邊不超過 size 的 PIL 圖片 (GUI 結果清單使用)。"""
+    return make_thumbnail(read_image_bytes(record), size)
+
+
+def make_thumbnail(img_bytes, size):
+    """把圖片內容縮成最長邊不超過 size 的 PIL 圖片。"""
+    img = Image.open(io.BytesIO(img_bytes))
+    # JPEG 在解碼時直接縮小，不必解出原始解析度
+    img.draft('RGB', (size, size))
+    img.thumbnail((size, size))
+    return img
+
+
+def compute_phash(img_bytes):
+    """
+    計算 Perceptual Hash (感知雜湊) 並以 64-bit 整數回傳。
+    Phash 對於圖片稍微壓縮、調整大小等微小變動具有很強的抵抗力。
+    """
+    img = Image.open(io.BytesIO(img_bytes))
+    return hash_to_int(imagehash.phash(img))
+
+
+# phash 最後只需要 32x32 的灰階圖。縮小解碼時保留的最短邊長是它的 8 倍，
+# 最後一步仍與 imagehash 相同以 LANCZOS 縮成 32x32，雜湊與原解析度的結果只差幾個 bit。
+DRAFT_MIN_SIZE = 256
+# 預設的像素上限。PIL 開啟超過 2 × Image.MAX_IMAGE_PIXELS (約 1.79 億) 像素的圖片時會直接拒絕，預設值不超過它
+DEFAULT_MAX_PIXELS = 100_000_000
+
+
+def open_checked(img_bytes, max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    開啟圖片 (只讀取標頭，尚未解碼) 並以原始尺寸檢查像素數，超過 max_pixels 時丟出 ValueError。
+    必須在 draft() 之前檢查，draft() 之後 size 已經是縮小後的尺寸。
+    PIL 內建的 Image.MAX_IMAGE_PIXELS 是整個行程共用的設定 (縮圖等其他執行緒也依賴它)，這裡不會更動，
+    因此 max_pixels 只能比 PIL 的上限更嚴格，0 代表只套用 PIL 的上限。
+    """
+    try:
+        img = Image.open(io.BytesIO(img_bytes))
+    except Image.DecompressionBombError as e:
+        raise ValueError(str(e))
+    width, height = img.size
+    if max_pixels and width * height > max_pixels:
+        raise ValueError(f"圖片尺寸 {width}x{height} 超過像素上限 {max_pixels}")
+    return img
+
+
+def open_for_hash(img_bytes, max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    以盡量小的解析度開啟圖片，供計算雜湊使用：
+    - JPEG 透過 draft() 在解碼時直接縮小 1/2 ~ 1/8 並只解出灰階
+    - 其他格式解碼後立即轉灰階，再以 reduce() 快速縮到接近 DRAFT_MIN_SIZE
+    解碼前會先以原始尺寸檢查像素數，超過 max_pixels 的圖片直接拒絕處理。
+    """
+    img = open_checked(img_bytes, max_pixels)
+    img.draft('L', (DRAFT_MIN_SIZE, DRAFT_MIN_SIZE))
+
+    width, height = img.size
+    img = img.convert('L')
+    factor = min(width, height) // DRAFT_MIN_SIZE
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+
+# imagehash.phash 的參數：縮成 32x32 灰階後取 DCT 左上角 8x8 的低頻係數
+PHASH_SIZE = 8
+PHASH_IMAGE_SIZE = PHASH_SIZE * 4
+# 一次批次計算的圖片數，像素只佔 1 KiB/張，批次上限主要是避免單一文件的圖片過多
+HASH_BATCH_SIZE = 256
+
+
+def phash_pixels(img):
+    """與 imagehash.phash 相同的前處理：轉灰階並以 LANCZOS 縮成 32x32，回傳 uint8 陣列。"""
+    return np.asarray(img.convert('L').resize((PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE), Image.Resampling.LANCZOS))
+
+
+def phash_batch(pixels):
+    """
+    對 N 張 32x32 灰階像素 (N x 32 x 32) 一次計算 phash，回傳 N 個 64-bit 整數。
+    結果與逐張呼叫 imagehash.phash 完全相同：兩次 DCT 沿著相同的軸計算 (scipy.fft 與 imagehash
+    使用的 scipy.fftpack 是同一套實作，先轉成 float64 可省去每次的型別轉換)，
+    中位數與比較也一樣，只是在堆疊後的陣列上一次完成，最後以 packbits 組成整數。
+    """
+    pixels = np.asarray(pixels, dtype=np.float64)
+    if len(pixels) == 0:
+        return []
+    dct = scipy.fft.dct(scipy.fft.dct(pixels, axis=1), axis=2)
+    low = dct[:, :PHASH_SIZE, :PHASH_SIZE].reshape(len(pixels), PHASH_SIZE * PHASH_SIZE)
+    bits = low > np.median(low, axis=1, keepdims=True)
+    # str(ImageHash) 以列優先、高位在前的順序排列 bit，與大端序的 packbits 相同
+    return np.packbits(bits, axis=1).view('>u8').ravel().tolist()
+
+
+class PhashHasher:
+    """
+    把圖片 bytes 轉成 64-bit phash 的計算器。
+
+    reduced_decode=True (預設) 時使用 open_for_hash() 以縮小的解析度解碼，
+    False 時與 compute_phash() 相同，以原始解析度解碼。
+    name 會作為快取的區分鍵，兩種模式算出的雜湊不會混用。
+    """
+
+    def __init__(self, reduced_decode=True, max_pixels=DEFAULT_MAX_PIXELS):
+        self.reduced_decode = reduced_decode
+        self.max_pixels = max_pixels
+
+    @property
+    def name(self):
+        return 'phash-reduced' if self.reduced_decode else 'phash'
+
+    def prepare(self, img_bytes):
+        """解碼圖片並縮成 phash 使用的 32x32 灰階像素，之後可交給 hash_prepared() 批次計算。"""
+        if not self.reduced_decode:
+            return phash_pixels(open_checked(img_bytes, self.max_pixels))
+        return phash_pixels(open_for_hash(img_bytes, self.max_pixels))
+
+    def hash_prepared(self, pixels):
+        return phash_batch(pixels)
+
+    def new_store(self):
+        """建立保存這種雜湊的容器。"""
+        return PackedHashes()
+
+    def __call__(self, img_bytes):
+        return self.hash_prepared([self.prepare(img_bytes)])[0]
+
+
+def _resize_matrix(src, dst):
+    """以線性內插把長度 src 的訊號縮成 dst 個取樣的 (src x dst) 矩陣 (與 PIL 的 BILINEAR 縮小時相近)。"""
+    centers = (np.arange(dst) + 0.5) * src / dst - 0.5
+    left = np.clip(np.floor(centers).astype(int), 0, src - 2)
+    weight = np.clip(centers - left, 0.0, 1.0)
+    matrix = np.zeros((src, dst))
+    matrix[left, np.arange(dst)] = 1 - weight
+    matrix[left + 1, np.arange(dst)] += weight
+    return matrix
+
+
+# dhash 每列 9 個取樣 (相鄰兩兩比較得到 8 bits)
+_DHASH_COLUMNS = _resize_matrix(PHASH_IMAGE_SIZE, PHASH_SIZE + 1)
+_SIGNS = (-1.0) ** np.arange(PHASH_SIZE)
+
+
+def _pack_bits(bits):
+    return np.packbits(bits.reshape(len(bits), -1), axis=1).view('>u8').ravel()
+
+
+def invariant_hash_batch(pixels):
+    """
+    對 N 張 32x32 灰階像素計算旋轉/翻轉不變的串接雜湊，回傳 N 個整數 phash | ahash << 64 | dhash << 128。
+
+    先依 DCT 最低頻的兩個係數把圖片轉到標準方向：水平方向的變化較弱時轉置，
+    再讓兩個係數都變成正的 (左右或上下翻轉只會讓第 v 或第 u 個係數乘上 (-1)^v、(-1)^u)，
+    因此 8 種旋轉/翻轉的結果都轉到同一個方向，只需要計算一次 DCT，比對時也只需要比較一次。
+    ahash 與 dhash 在轉正後的像素上計算，成本遠低於 DCT，供分群時確認距離稍大的候選配對。
+    """
+    pixels = np.asarray(pixels, dtype=np.float64)
+    if len(pixels) == 0:
+        return []
+    dct = scipy.fft.dct(scipy.fft.dct(pixels, axis=1), axis=2)
+    low = dct[:, :PHASH_SIZE, :PHASH_SIZE]
+
+    def where(mask, a, b):
+        return np.where(mask[:, None, None], a, b)
+
+    swap = np.abs(low[:, 1, 0]) > np.abs(low[:, 0, 1])
+    low = where(swap, low.transpose(0, 2, 1), low)
+    pixels = where(swap, pixels.transpose(0, 2, 1), pixels)
+    flip_columns = low[:, 0, 1] < 0
+    low = where(flip_columns, low * _SIGNS[None, None, :], low)
+    pixels = where(flip_columns, pixels[:, :, ::-1], pixels)
+    flip_rows = low[:, 1, 0] < 0
+    low = where(flip_rows, low * _SIGNS[None, :, None], low)
+    pixels = where(flip_rows, pixels[:, ::-1, :], pixels)
+
+    low = low.reshape(len(pixels), PHASH_SIZE * PHASH_SIZE)
+    phash = _pack_bits(low > np.median(low, axis=1, keepdims=True))
+    step = PHASH_IMAGE_SIZE // PHASH_SIZE
+    blocks = pixels.reshape(len(pixels), PHASH_SIZE, step, PHASH_SIZE, step).mean(axis=(2, 4))
+    ahash = _pack_bits(blocks > blocks.mean(axis=(1, 2), keepdims=True))
+    rows = pixels.reshape(len(pixels), PHASH_SIZE, step, PHASH_IMAGE_SIZE).mean(axis=2) @ _DHASH_COLUMNS
+    dhash = _pack_bits(rows[:, :, 1:] > rows[:, :, :-1])
+    return [p | a << HASH_BITS | d << 2 * HASH_BITS
+            for p, a, d in zip(phash.tolist(), ahash.tolist(), dhash.tolist())]
+
+
+class InvariantHasher(PhashHasher):
+    """
+    旋轉/翻轉/裁切比對模式的雜湊計算器：解碼方式與 PhashHasher 相同，
+    但雜湊為 invariant_hash_batch() 的串接雜湊 (標準方向的 phash 加上 ahash、dhash 預篩雜湊)，
+    以 CascadeHashes 保存。標準方向的 phash 與一般 phash 不同，快取中以不同的 name 區分。
+    """
+
+    @property
+    def name(self):
+        return 'phash-invariant-reduced' if self.reduced_decode else 'phash-invariant'
+
+    def hash_prepared(self, pixels):
+        return invariant_hash_batch(pixels)
+
+    def new_store(self):
+        return CascadeHashes()
+
+
+# 比對模式：一般 phash，或可找出旋轉、翻轉與輕微裁切圖片的串接雜湊
+MATCH_MODES = ('phash', 'invariant')
+DEFAULT_MATCH_MODE = 'phash'
+
+
+def create_hasher(match=DEFAULT_MATCH_MODE, reduced_decode=True, max_pixels=DEFAULT_MAX_PIXELS):
+    """依比對模式建立雜湊計算器。"""
+    if match == 'phash':
+        return PhashHasher(reduced_decode, max_pixels)
+    if match == 'invariant':
+        return InvariantHasher(reduced_decode, max_pixels)
+    raise ValueError(f"未知的比對模式: {match} (可用: {', '.join(MATCH_MODES)})")
+
+
+DEFAULT_HASHER = PhashHasher()
+
+
+class MediaDeduplicator:
+    """
+    同一次掃描中，內容完全相同的圖片只解碼並計算一次雜湊。
+
+    先以 zip 中央目錄記錄的 CRC32 與解壓縮後大小篩選，
+    再以內容摘要 (BLAKE2b) 確認真的一模一樣，避免 CRC 碰撞造成誤判。
+    """
+
+    def __init__(self):
+        self._seen = {}  # (crc, size) -> {digest: hash}
+        self.hits = 0
+
+    @staticmethod
+    def digest(data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def lookup(self, crc, size, digest):
+        value = self._seen.get((crc, size), {}).get(digest)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    def add(self, crc, size, digest, value):
+        self._seen.setdefault((crc, size), {})[digest] = value
+
+
+class HashBatch:
+    """
+    收集需要計算雜湊的圖片，最後一次批次計算。
+
+    add() 會立即把圖片解碼成 hasher.prepare() 的像素 (圖片 bytes 不會留在記憶體中)，
+    累積 HASH_BATCH_SIZE 張或呼叫 compute() 時再以 hasher.hash_prepared() 一次計算。
+    hasher 沒有 prepare/hash_prepared 時 add() 直接呼叫 hasher(bytes)。
+    timer (DocumentTimer) 會分別記錄解碼 (decode) 與批次計算 (phash) 的時間。
+    """
+
+    def __init__(self, hasher, timer=None):
+        self.hasher = hasher
+        self.timer = timer if timer is not None else DocumentTimer()
+        self.batched = hasattr(hasher, 'hash_prepared')
+        self.values = {}
+        self._keys = []
+        self._pixels = []
+
+    def __contains__(self, key):
+        return key in self.values or key in self._keys
+
+    def add(self, key, img_bytes):
+        if not self.batched:
+            with self.timer.stage('decode'):
+                self.values[key] = self.hasher(img_bytes)
+            return
+        with self.timer.stage('decode'):
+            pixels = self.hasher.prepare(img_bytes)
+        self._pixels.append(pixels)
+        self._keys.append(key)
+        if len(self._pixels) >= HASH_BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._pixels:
+            with self.timer.stage('phash'):
+                self.values.update(zip(self._keys, self.hasher.hash_prepared(self._pixels)))
+        self._keys = []
+        self._pixels = []
+
+    def compute(self):
+        """計算尚未處理的圖片，回傳 {key: hash}。"""
+        self._flush()
+        return self.values
+
+
+def _hash_member(docx_zip, zinfo, lookup_media, dedup, batch):
+    """
+    取得單一 zip 成員的雜湊：依序查快取、同次掃描的相同內容，最後才交給 batch 解碼。
+    回傳 (hash, None)；需要計算時回傳 (None, key)，batch.compute() 後再以 key 取得雜湊。
+    """
+    timer = batch.timer
+    key = (zinfo.CRC, zinfo.file_size)
+    if lookup_media is not None:
+        with timer.stage('cache'):
+            value = lookup_media(*key)
+        if value is not None:
+            return value, None
+
+    with timer.stage('zip'):
+        data = docx_zip.read(zinfo)
+    timer.bytes_read += len(data)
+    if dedup is not None:
+        digest = dedup.digest(data)
+        value = dedup.lookup(*key, digest)
+        if value is not None:
+            return value, None
+    else:
+        # 沒有內容摘要時以成員名稱區分，不同成員各自計算
+        digest = zinfo.filename
+
+    pending = (*key, digest)
+    if pending not in batch:
+        batch.add(pending, data)
+        timer.image(zinfo.filename, data, timer.last)
+    return None, pending
+
+
+def _scan_zip(docx_path, lookup_media, log, dedup=None, hasher=DEFAULT_HASHER, source=None, timer=None):
+    """
+    開啟壓縮檔並計算每張圖片的雜湊。lookup_media 為 (crc, size) -> hash 或 None 的查詢函式，
+    dedup 為 MediaDeduplicator，hasher 為 bytes -> hash 的計算器。
+    source 為已讀入記憶體的檔案物件 (例如 BytesIO)，省略時直接開啟 docx_path。
+    timer (DocumentTimer) 記錄讀取 zip、解析 XML、解碼與計算雜湊各自的時間。
+    回傳 (records, new_media, ok)，new_media 是這次新算出來的 (crc, size, hash)。
+    """
+    filename = os.path.basename(docx_path)
+    records = []
+    new_media = []
+    # 同一份文件內多次引用同一個 word/media/imageN 時，只讀取與計算一次
+    member_hashes = {}
+    member_pending = {}
+    refs = []
+    batch = HashBatch(hasher, timer)
+    timer = batch.timer
+    try:
+        with timer.stage('zip'):
+            docx_zip = zipfile.ZipFile(docx_path if source is None else source, 'r')
+        with docx_zip:
+            ref_iter = iter_image_refs(docx_zip)
+            while True:
+                # document.xml 是邊走訪邊解析的，計時只包含取得下一個圖片參照的部分
+                with timer.stage('xml'):
+                    ref = next(ref_iter, None)
+                if ref is None:
+                    break
+                refs.append(ref)
+                member = ref['member']
+                if member in member_hashes or member in member_pending:
+                    continue
+                try:
+                    value, pending = _hash_member(docx_zip, docx_zip.getinfo(member), lookup_media, dedup, batch)
+                except Exception as e:
+                    value, pending = None, None
+                    log(f"    無法解析圖片 {ref['image_name']}: {e}")
+                if pending is not None:
+                    member_pending[member] = pending
+                else:
+                    member_hashes[member] = value
+
+        # 文件內需要計算的圖片都已解碼成像素，一次批次計算雜湊
+        computed = batch.compute()
+        for member, pending in member_pending.items():
+            member_hashes[member] = computed[pending]
+        for (crc, size, digest), value in computed.items():
+            if dedup is not None:
+                dedup.add(crc, size, digest, value)
+            new_media.append((crc, size, value))
+
+        for ref in refs:
+            value = member_hashes[ref['member']]
+            if value is None:
+                continue
+            records.append({
+                'filename': filename,
+                'image_name': ref['image_name'],
+                'context': ref['context'],
+                'page': ref['page'],
+                'docx_path': docx_path,
+                'member': ref['member'],
+                'hash': value,
+            })
+    except Exception as e:
+        log(f"處理檔案時發生錯誤 {docx_path}: {e}")
+        return records, new_media, False
+    finally:
+        timer.image_count = len(records)
+
+    return records, new_media, True
+
+
+def _lookup_document(cache, docx_path):
+    """查詢文件層級的快取，回傳 (stat, records)，沒有命中時 records 為 None。"""
+    try:
+        stat = os.stat(docx_path)
+    except OSError:
+        # 檔案在列出後被刪除或無法存取，交給後續開啟壓縮檔時回報錯誤
+        return None, None
+    cached = cache.lookup_document(docx_path, stat.st_size, stat.st_mtime_ns)
+    if cached is not None:
+        filename = os.path.basename(docx_path)
+        cached = [dict(rec, filename=filename, docx_path=docx_path) for rec in cached]
+    return stat, cached
+
+
+def _store_results(cache, docx_path, stat, records, new_media, ok):
+    for crc, size, value in new_media:
+        cache.store_media(crc, size, value)
+    # 文件本身有問題時不寫入文件快取，下次仍會重新嘗試
+    if ok and stat is not None:
+        cache.store_document(docx_path, stat.st_size, stat.st_mtime_ns, records)
+
+
+def scan_docx(docx_path, cache=None, log=print, dedup=None, hasher=DEFAULT_HASHER, timer=None):
+    """
+    提取單一 docx 內所有圖片並計算雜湊，回傳不含圖片內容的紀錄清單
+    (filename、image_name、context、page、hash，以及供 read_image_bytes 使用的 docx_path、member)。
+    每張圖片的 bytes 只在計算雜湊時短暫存在。
+
+    若提供 cache (HashCache)，未變動的文件會直接沿用快取結果而不開啟壓縮檔；
+    已變動的文件也只會解碼 CRC 沒有出現在快取中的圖片。
+    若提供 dedup (MediaDeduplicator)，與先前處理過的圖片內容完全相同時直接沿用雜湊。
+    cache 的 variant 應與 hasher.name 相同，避免不同算法的雜湊混用。
+    若提供 timer (DocumentTimer)，會記錄各處理階段的時間。
+    """
+    if cache is None:
+        return _scan_zip(docx_path, None, log, dedup, hasher, timer=timer)[0]
+
+    timer = timer if timer is not None else DocumentTimer()
+    with timer.stage('cache'):
+        stat, cached = _lookup_document(cache, docx_path)
+    if cached is not None:
+        timer.cached = True
+        timer.image_count = len(cached)
+        return cached
+
+    records, new_media, ok = _scan_zip(docx_path, cache.lookup_media, log, dedup, hasher, timer=timer)
+    with timer.stage('cache'):
+        _store_results(cache, docx_path, stat, records, new_media, ok)
+    return records
+
+
+def scan_docx_source(docx_path, source=None, log=print, hasher=DEFAULT_HASHER):
+    """
+    不使用快取處理一份文件並回傳 (records, ok)，ok 為 False 代表整份文件無法開啟或解析 (錯誤訊息已交給 log)。
+    source 為已讀入記憶體的檔案物件 (例如上傳內容的 BytesIO)，此時 docx_path 只作為顯示名稱。
+    """
+    records, _, ok = _scan_zip(docx_path, None, log, hasher=hasher, source=source)
+    return records, ok
+
+
+# --- 多行程平行處理 ---
+# 每個子行程各自以唯讀方式開啟快取，只用來查詢圖片雜湊；
+# 新算出的雜湊會連同結果一起回傳，由主行程統一寫入。
+_worker_cache = None
+_worker_dedup = None
+_worker_hasher = DEFAULT_HASHER
+
+
+def _init_worker(cache_path, cache_variant, hasher):
+    global _worker_cache, _worker_dedup, _worker_hasher
+    # 每個子行程各自記住處理過的圖片內容，跨文件的完全重複圖片在同一行程內只解碼一次
+    _worker_dedup = MediaDeduplicator()
+    _worker_hasher = hasher
+    if cache_path is not None:
+        from hash_cache import HashCache
+        _worker_cache = HashCache(cache_path, readonly=True, variant=cache_variant)
+
+
+def _scan_document(docx_path, data, cache, dedup, hasher, profile=False):
+    """
+    處理一份文件 (data 為已讀入的檔案內容，None 代表直接開啟檔案)，快取只用來查詢。
+    回傳 (records, new_media, ok, messages, hits, misses, timings)，
+    timings 為 DocumentTimer.as_dict()；profile=True 時另外記錄每張圖片的大小與解碼時間。
+    """
+    messages = []
+    lookup = cache.lookup_media if cache is not None else None
+    hits_before = cache.hits if cache is not None else 0
+    misses_before = cache.misses if cache is not None else 0
+
+    timer = DocumentTimer(images=profile)
+    source = io.BytesIO(data) if data is not None else None
+    records, new_media, ok = _scan_zip(docx_path, lookup, messages.append, dedup, hasher, source, timer)
+
+    if cache is not None:
+        hits = cache.hits - hits_before
+        misses = cache.misses - misses_before
+    else:
+        hits = misses = 0
+    return records, new_media, ok, messages, hits, misses, timer.as_dict()
+
+
+def _scan_worker(docx_path, data=None, profile=False):
+    """在子行程中處理一份文件，只回傳精簡的紀錄 (不含圖片內容) 與訊息。"""
+    return _scan_document(docx_path, data, _worker_cache, _worker_dedup, _worker_hasher, profile)
+
+
+def _lookup_timed(cache, docx_path, profile):
+    """查詢文件快取；profile 不為 None 時連同查詢時間回傳 timings (命中時也要記錄)。"""
+    if cache is None:
+        return None, None, None
+    if profile is None:
+        return (*_lookup_document(cache, docx_path), None)
+    timer = DocumentTimer()
+    with timer.stage('cache'):
+        stat, cached = _lookup_document(cache, docx_path)
+    if cached is not None:
+        timer.cached = True
+        timer.image_count = len(cached)
+    return stat, cached, timer.as_dict()
+
+
+def _file_size(stat, docx_path):
+    if stat is not None:
+        return stat.st_size
+    try:
+        return os.path.getsize(docx_path)
+    except OSError:
+        return None
+
+
+def resolve_workers(workers):
+    """0 或負數代表使用所有 CPU 核心。"""
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def scan_files(docx_files, workers=1, cache=None, hasher=DEFAULT_HASHER, read_ahead=0, readers=2, stats=None,
+               profile=None):
+    """
+    依 docx_files 的順序逐一產生 (docx_path, records, messages)。
+
+    workers > 1 時以行程池平行處理，但結果仍依輸入順序回傳，因此輸出與單一行程相同。
+    messages 為處理該文件時的錯誤訊息，由呼叫端決定如何顯示。
+    read_ahead > 0 時改用分段管線 (見 scan_pipelined)，由 readers 條執行緒預先讀取文件，
+    stats (PipelineStats) 會記錄各階段的統計。
+    profile (ScanProfile) 不為 None 時記錄每份文件各階段的時間與圖片大小。
+    """
+    workers = resolve_workers(workers)
+    if read_ahead > 0:
+        yield from scan_pipelined(docx_files, workers, cache, hasher, read_ahead, readers, stats, profile)
+        return
+    if workers == 1:
+        dedup = MediaDeduplicator()
+        for path in docx_files:
+            messages = []
+            timer = DocumentTimer(images=True) if profile is not None else None
+            records = scan_docx(path, cache, messages.append, dedup, hasher, timer)
+            if profile is not None:
+                profile.add_document(path, timer.as_dict(), _file_size(None, path))
+            yield path, records, messages
+        return
+
+    cache_path = cache.path if cache is not None else None
+    cache_variant = cache.variant if cache is not None else None
+    # 最多同時排入 workers * 4 份文件，避免結果堆積在記憶體中
+    max_pending = workers * 4
+    files = iter(docx_files)
+    pending = deque()
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_path, cache_variant, hasher))
+    try:
+        def submit_next():
+            for path in files:
+                stat, cached, timings = _lookup_timed(cache, path, profile)
+                if cached is not None:
+                    pending.append((path, stat, None, cached, timings))
+                else:
+                    future = pool.submit(_scan_worker, path, None, profile is not None)
+                    pending.append((path, stat, future, None, timings))
+                return True
+            return False
+
+        while len(pending) < max_pending and submit_next():
+            pass
+
+        while pending:
+            path, stat, future, records, lookup_timings = pending.popleft()
+            messages = []
+            timings = lookup_timings
+            if future is not None:
+                records, new_media, ok, messages, hits, misses, timings = future.result()
+                if cache is not None:
+                    cache.hits += hits
+                    cache.misses += misses
+                    _store_results(cache, path, stat, records, new_media, ok)
+                if lookup_timings is not None:
+                    add_stage(timings, 'cache', **lookup_timings['stages']['cache'])
+            if profile is not None:
+                profile.add_document(path, timings, _file_size(stat, path))
+            submit_next()
+            yield path, records, messages
+    finally:
+        # 提前關閉產生器 (例如取消掃描) 時不再處理尚未開始的文件
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# --- 分段管線 ---
+# 文件放在網路磁碟時，逐一「開檔 → 解析 → 雜湊」會讓 CPU 在等待 I/O 時閒置。
+# 管線把讀取與計算拆成兩個階段，以有上限的佇列連接：
+#   主執行緒 (查文件快取) → 待讀取佇列 → 讀取執行緒 → 待解析佇列 → 解析與雜湊 → 主執行緒依序輸出
+# 待解析佇列滿了時讀取執行緒會等待，因此記憶體中最多只有約 read_ahead 份文件的內容。
+
+def read_document(docx_path):
+    """讀取整份 docx 的內容，管線的讀取階段都透過這個函式讀檔。"""
+    with open(docx_path, 'rb') as f:
+        return f.read()
+
+
+class PipelineStats:
+    """
+    分段管線的統計：各階段處理的文件數與忙碌時間、讀取量，以及佇列深度 (每次放入或取出時取樣)。
+    各階段的執行緒會同時更新，因此以鎖保護。
+    """
+
+    STAGES = (('read', '讀取'), ('parse', '解析'), ('hash', '雜湊'))
+    QUEUES = (('read', '待讀取'), ('hash', '待解析'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.finished = None
+        self.documents = 0
+        self.cached = 0
+        self.bytes_read = 0
+        self.count = {name: 0 for name, _ in self.STAGES}
+        self.busy = {name: 0.0 for name, _ in self.STAGES}
+        # 各階段同時處理的數量 (執行緒或行程數)，用來計算使用率
+        self.parallel = {name: 1 for name, _ in self.STAGES}
+        # 佇列深度：取樣次數、總和、最大值，以及佇列上限 (0 代表不限)
+        self.depth = {name: [0, 0, 0] for name, _ in self.QUEUES}
+        self.capacity = {name: 0 for name, _ in self.QUEUES}
+
+    def add(self, stage, seconds, nbytes=0):
+        with self._lock:
+            self.count[stage] += 1
+            self.busy[stage] += seconds
+            self.bytes_read += nbytes
+
+    def sample(self, queue_name, depth):
+        with self._lock:
+            entry = self.depth[queue_name]
+            entry[0] += 1
+            entry[1] += depth
+            entry[2] = max(entry[2], depth)
+
+    @property
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    def utilization(self, stage):
+        """忙碌時間佔 (經過時間 × 同時處理數) 的比例，最高的階段就是瓶頸。"""
+        elapsed = self.elapsed
+        return self.busy[stage] / (elapsed * self.parallel[stage]) if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        elapsed = self.elapsed
+        return {
+            'elapsed': elapsed,
+            'documents': self.documents,
+            'cached': self.cached,
+            'bytes_read': self.bytes_read,
+            'stages': {name: {'count': self.count[name],
+                              'busy': self.busy[name],
+                              'parallel': self.parallel[name],
+                              'per_second': self.count[name] / elapsed if elapsed > 0 else 0.0,
+                              'utilization': self.utilization(name)}
+                       for name, _ in self.STAGES},
+            'queues': {name: {'mean': self.depth[name][1] / self.depth[name][0] if self.depth[name][0] else 0.0,
+                              'max': self.depth[name][2],
+                              'capacity': self.capacity[name]}
+                       for name, _ in self.QUEUES},
+        }
+
+    def summary_lines(self):
+        info = self.as_dict()
+        elapsed = info['elapsed']
+        lines = [f"管線統計：{elapsed:.2f} 秒，{self.documents} 份文件 (其中 {self.cached} 份沿用快取)"]
+        for name, label in self.STAGES:
+            stage = info['stages'][name]
+            line = f"  {label}: {stage['count']} 份，{stage['per_second']:.1f} 份/秒"
+            if name == 'read':
+                mib = self.bytes_read / 1024 / 1024
+                line += f"，{mib:.1f} MiB ({mib / elapsed if elapsed > 0 else 0:.1f} MiB/秒)"
+            line += f"，忙碌 {stage['busy']:.2f} 秒 (並行 {stage['parallel']}，使用率 {stage['utilization']:.0%})"
+            lines.append(line)
+        for name, label in self.QUEUES:
+            queue_info = info['queues'][name]
+            limit = f"/{queue_info['capacity']}" if queue_info['capacity'] else ""
+            lines.append(f"  {label}佇列: 平均 {queue_info['mean']:.1f}，最大 {queue_info['max']}{limit}")
+        if self.documents > self.cached:
+            bottleneck = max(self.STAGES, key=lambda stage: self.utilization(stage[0]))[1]
+            lines.append(f"  瓶頸: {bottleneck}")
+        return lines
+
+
+def scan_pipelined(docx_files, workers=1, cache=None, hasher=DEFAULT_HASHER, read_ahead=8, readers=2, stats=None,
+                   profile=None):
+    """
+    以分段管線處理文件，依 docx_files 的順序逐一產生 (docx_path, records, messages)，結果與 scan_files 相同。
+
+    - 讀取：readers 條執行緒把整份 docx 讀入記憶體，最多預先讀取 read_ahead 份；
+    - 解析與雜湊：workers == 1 時在一條執行緒中處理，否則交給 workers 個子行程；
+    - 主執行緒查詢與寫入快取 (SQLite 連線不能跨執行緒)，命中文件快取的文件完全不讀檔。
+    提前關閉產生器時會停止所有階段；任一階段的執行緒發生未預期的例外時，主執行緒會停止並丟出同一個例外。
+    profile (ScanProfile) 的文件計時會另外包含讀檔 (read) 階段。
+    """
+    workers = resolve_workers(workers)
+    read_ahead = max(1, read_ahead)
+    readers = max(1, readers)
+    if stats is None:
+        stats = PipelineStats()
+    stats.parallel.update(read=readers, parse=workers, hash=workers)
+    stats.capacity['hash'] = read_ahead
+    # 交給解析階段但尚未完成的文件數上限
+    hash_slots = 1 if workers == 1 else workers * 2
+    max_pending = read_ahead + readers + hash_slots
+    stats.capacity['read'] = max_pending
+
+    stop = threading.Event()
+    read_queue = queue.Queue()
+    hash_queue = queue.Queue(maxsize=read_ahead)
+    results = {}
+    # 各階段執行緒中未預期的例外，由主執行緒重新丟出
+    errors = []
+    done = threading.Condition()
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def finish(seq, result, read_wall, read_cpu):
+        if not isinstance(result, BaseException):
+            timings = result[6]
+            hash_seconds = sum(timings['stages'].get(name, {}).get('wall', 0.0) for name in ('decode', 'phash'))
+            stats.add('parse', timings['wall'] - hash_seconds)
+            stats.add('hash', hash_seconds)
+            add_stage(timings, 'read', read_wall, read_cpu)
+        with done:
+            results[seq] = result
+            done.notify_all()
+
+    def guarded(target, *args):
+        # 例外若只留在背景執行緒，主執行緒會一直等待永遠不會完成的文件
+        try:
+            target(*args)
+        except BaseException as e:
+            stop.set()
+            with done:
+                errors.append(e)
+                done.notify_all()
+
+    def failed(path, error):
+        return [], [], False, [f"處理檔案時發生錯誤 {path}: {error}"], 0, 0, DocumentTimer().as_dict()
+
+    def reader():
+        while True:
+            item = get(read_queue)
+            if item is None:
+                return
+            stats.sample('read', read_queue.qsize())
+            seq, path = item
+            start, cpu = time.perf_counter(), time.thread_time()
+            try:
+                data, error = read_document(path), None
+            except OSError as e:
+                data, error = None, e
+            read_wall, read_cpu = time.perf_counter() - start, time.thread_time() - cpu
+            stats.add('read', read_wall, len(data) if data is not None else 0)
+            if not put(hash_queue, (seq, path, data, error, read_wall, read_cpu)):
+                return
+            stats.sample('hash', hash_queue.qsize())
+
+    def hash_thread():
+        # 快取的 SQLite 連線不能跨執行緒使用，解析執行緒另外以唯讀方式開啟
+        local_cache = None
+        if cache is not None:
+            from hash_cache import HashCache
+            local_cache = HashCache(cache.path, readonly=True, variant=cache.variant)
+        dedup = MediaDeduplicator()
+        try:
+            while True:
+                item = get(hash_queue)
+                if item is None:
+                    return
+                stats.sample('hash', hash_queue.qsize())
+                seq, path, data, error, read_wall, read_cpu = item
+                if error is not None:
+                    finish(seq, failed(path, error), read_wall, read_cpu)
+                    continue
+                try:
+                    result = _scan_document(path, data, local_cache, dedup, hasher, profile is not None)
+                except Exception as e:
+                    result = e
+                finish(seq, result, read_wall, read_cpu)
+        finally:
+            if local_cache is not None:
+                local_cache.close()
+
+    def dispatch_thread(pool):
+        slots = threading.BoundedSemaphore(hash_slots)
+
+        def on_done(future, seq, read_wall, read_cpu):
+            slots.release()
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            finish(seq, result, read_wall, read_cpu)
+
+        while True:
+            item = get(hash_queue)
+            if item is None:
+                return
+            stats.sample('hash', hash_queue.qsize())
+            seq, path, data, error, read_wall, read_cpu = item
+            if error is not None:
+                finish(seq, failed(path, error), read_wall, read_cpu)
+                continue
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            try:
+                future = pool.submit(_scan_worker, path, data, profile is not None)
+            except RuntimeError as e:
+                # 行程池已關閉
+                finish(seq, e, read_wall, read_cpu)
+                return
+            future.add_done_callback(lambda f, args=(seq, read_wall, read_cpu): guarded(on_done, f, *args))
+
+    pool = None
+    if workers > 1:
+        cache_path = cache.path if cache is not None else None
+        cache_variant = cache.variant if cache is not None else None
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(cache_path, cache_variant, hasher))
+        threads = [threading.Thread(target=guarded, args=(dispatch_thread, pool), daemon=True)]
+    else:
+        threads = [threading.Thread(target=guarded, args=(hash_thread,), daemon=True)]
+    threads += [threading.Thread(target=guarded, args=(reader,), daemon=True) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+
+    files = iter(enumerate(docx_files))
+    pending = deque()
+
+    def submit_next():
+        for seq, path in files:
+            stat, cached, timings = _lookup_timed(cache, path, profile)
+            pending.append((seq, path, stat, cached, timings))
+            if cached is None:
+                read_queue.put((seq, path))
+                stats.sample('read', read_queue.qsize())
+            return True
+        return False
+
+    try:
+        while len(pending) < max_pending and submit_next():
+            pass
+
+        while pending:
+            seq, path, stat, records, lookup_timings = pending.popleft()
+            messages = []
+            timings = lookup_timings
+            if records is None:
+                with done:
+                    while seq not in results and not errors:
+                        done.wait()
+                    if seq not in results:
+                        raise errors[0]
+                    result = results.pop(seq)
+                if isinstance(result, BaseException):
+                    raise result
+                records, new_media, ok, messages, hits, misses, timings = result
+                if cache is not None:
+                    cache.hits += hits
+                    cache.misses += misses
+                    _store_results(cache, path, stat, records, new_media, ok)
+                if lookup_timings is not None:
+                    add_stage(timings, 'cache', **lookup_timings['stages']['cache'])
+            else:
+                stats.cached += 1
+            if profile is not None:
+                profile.add_document(path, timings, _file_size(stat, path))
+            stats.documents += 1
+            submit_next()
+            yield path, records, messages
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        stats.finished = time.perf_counter()
@@ -0,0 +1,347 @@
+"""
+本機 HTTP 重複圖片檢查服務：啟動時載入一次檔案庫索引 (corpus_index.py build-index 建立)，
+並預先在工作行程中載入 PIL / imagehash，之後每次送件只需要計算該文件的圖片雜湊與查詢索引。
+
+API (回傳皆為 JSON)：
+- POST /check            請求內容為 docx 檔案本身；可用 ?filename=名稱 指定顯示名稱
+- POST /check            Content-Type: application/json，內容為 {"path": "伺服器上的 docx 路徑"}
+                         以上兩者都可加 ?threshold=N 覆寫預設閥值
+- GET  /stats            請求數、延遲百分位數、吞吐量等統計
+- GET  /health           服務狀態與索引大小
+
+/check 的回傳中每張圖片有 filename、image_name、context、page、hash (十六進位) 與 matches，
+matches 另外包含檔案庫文件的路徑 docx_path 與距離 distance；文件無法開啟或解析時回傳 400 與錯誤訊息。
+
+雜湊計算在固定數量的工作行程中進行，同時處理加上排隊中的請求超過上限時回傳 503。
+服務預設只綁定 127.0.0.1。
+
+用法:
+    python duplicate_service.py archive.idx --port 8765 --workers 4
+    curl --data-binary @新文件.docx "http://127.0.0.1:8765/check?filename=新文件.docx"
+"""
+import io
+import os
+import json
+import time
+import zipfile
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from docx_scanner import resolve_workers, DEFAULT_MAX_PIXELS
+from corpus_index import CorpusIndex, hasher_for_variant, hash_document
+from hash_index import int_to_hex
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_UPLOAD = 100 * 1024 * 1024
+
+# 回傳給客戶端的圖片欄位 (member 等讀取壓縮檔用的內部欄位不輸出)
+IMAGE_FIELDS = ('filename', 'image_name', 'context', 'page')
+MATCH_FIELDS = IMAGE_FIELDS + ('docx_path',)
+
+# --- 工作行程 ---
+_worker_hasher = None
+_worker_barrier = None
+
+
+def _init_worker(variant, max_pixels, barrier):
+    global _worker_hasher, _worker_barrier
+    _worker_hasher = hasher_for_variant(variant, max_pixels)
+    _worker_barrier = barrier
+    # 先算一張小圖，讓 imagehash/scipy 的延遲載入在啟動時完成，而不是算在第一個請求上
+    buf = io.BytesIO()
+    Image.new('L', (64, 64)).save(buf, 'PNG')
+    _worker_hasher(buf.getvalue())
+
+
+def _hash_job(source, filename):
+    """在工作行程中計算一份文件的圖片雜湊。source 為上傳的 bytes 或伺服器上的路徑。"""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    elif not os.path.isfile(source):
+        raise FileNotFoundError(f"找不到檔案 {source}")
+    if not zipfile.is_zipfile(source):
+        raise ValueError("不是有效的 docx 檔案")
+    messages = []
+    records = hash_document(source, _worker_hasher, messages.append, filename)
+    return [{k: rec[k] for k in IMAGE_FIELDS} | {'hash': rec['hash']} for rec in records], messages
+
+
+def _warm_up_job(timeout):
+    """在每個工作行程各佔住一個：所有工作行程都執行到這裡之前不會返回，因此每個行程都已啟動並完成初始化。"""
+    _worker_barrier.wait(timeout)
+    return os.getpid()
+
+
+class ServiceStats:
+    """執行緒安全的請求統計，延遲百分位數以最近 window 筆請求計算。"""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.images = 0
+        self.duplicates = 0
+        self.latencies = deque(maxlen=window)
+        self.hash_times = deque(maxlen=window)
+        self.query_times = deque(maxlen=window)
+        self.finished = deque(maxlen=window)
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def end(self, latency, ok, images=0, duplicate=False, hash_time=None, query_time=None):
+        with self.lock:
+            self.in_flight -= 1
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+            self.images += images
+            self.duplicates += duplicate
+            self.latencies.append(latency)
+            self.finished.append(time.time())
+            if hash_time is not None:
+                self.hash_times.append(hash_time)
+                self.query_times.append(query_time)
+
+    def reject(self):
+        with self.lock:
+            self.rejected += 1
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return None
+        values = sorted(values)
+        pick = lambda p: round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+        return {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(values[-1] * 1000, 2)}
+
+    def snapshot(self):
+        with self.lock:
+            now = time.time()
+            uptime = now - self.started
+            recent = sum(1 for t in self.finished if t >= now - 60)
+            return {
+                'uptime_s': round(uptime, 1),
+                'requests': self.requests,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'in_flight': self.in_flight,
+                'images_hashed': self.images,
+                'documents_with_duplicates': self.duplicates,
+                'throughput_rps': round(self.requests / uptime, 3) if uptime > 0 else 0.0,
+                'throughput_last_60s_rps': round(recent / 60, 3),
+                'latency_ms': self._percentiles(self.latencies),
+                'hash_ms': self._percentiles(self.hash_times),
+                'query_ms': self._percentiles(self.query_times),
+            }
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class DuplicateService:
+    """持有索引、工作行程池與統計；HTTP 處理器只負責解析請求與回傳 JSON。"""
+
+    def __init__(self, index_path, threshold=5, workers=0, max_queue=None, max_pixels=DEFAULT_MAX_PIXELS):
+        self.index = CorpusIndex(index_path)
+        self.threshold = threshold
+        self.workers = resolve_workers(workers)
+        # 同時處理與排隊中的請求總數上限，超過時直接拒絕，避免請求無限堆積
+        self.max_pending = self.workers + (self.workers * 4 if max_queue is None else max_queue)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(self.index.variant, max_pixels, multiprocessing.Barrier(self.workers)))
+        self.stats = ServiceStats()
+
+    def warm_up(self, timeout=120):
+        """
+        等待所有工作行程啟動並完成延遲載入：每個行程送一個會互相等待的工作，
+        全部的工作都在不同行程中同時執行時才會返回，回傳各工作行程的 pid。
+        """
+        futures = [self.pool.submit(_warm_up_job, timeout) for _ in range(self.workers)]
+        return [f.result() for f in futures]
+
+    def check(self, source, filename, threshold=None):
+        """計算文件的圖片雜湊並查詢索引，回傳可直接序列化成 JSON 的結果。"""
+        if threshold is None:
+            threshold = self.threshold
+        if not self._slots.acquire(blocking=False):
+            self.stats.reject()
+            raise ServiceBusy()
+
+        start = time.perf_counter()
+        self.stats.begin()
+        ok = False
+        images = 0
+        duplicate = False
+        hash_time = query_time = None
+        try:
+            records, messages = self.pool.submit(_hash_job, source, filename).result()
+            hashed = time.perf_counter()
+            results = []
+            for rec in records:
+                found, dist = self.index.query(rec['hash'], threshold)
+                matches = []
+                for i, d in zip(found.tolist(), dist.tolist()):
+                    match = self.index.record(i)
+                    matches.append({k: match[k] for k in MATCH_FIELDS} | {'hash': int_to_hex(match['hash']), 'distance': d})
+                matches.sort(key=lambda m: (m['distance'], m['docx_path'], m['page']))
+                results.append(dict(rec, hash=int_to_hex(rec['hash']), matches=matches))
+            done = time.perf_counter()
+
+            images = len(records)
+            duplicate = any(r['matches'] for r in results)
+            hash_time, query_time = hashed - start, done - hashed
+            ok = True
+            return {
+                'filename': filename,
+                'threshold': threshold,
+                'duplicate': duplicate,
+                'images': results,
+                'messages': messages,
+                'timing_ms': {'hash': round(hash_time * 1000, 2), 'query': round(query_time * 1000, 2),
+                              'total': round((done - start) * 1000, 2)},
+            }
+        finally:
+            self.stats.end(time.perf_counter() - start, ok, images, duplicate, hash_time, query_time)
+            self._slots.release()
+
+    def close(self):
+        self.pool.shutdown()
+        self.index.close()
+
+
+class DuplicateRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'DocxDuplicateService/1.0'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/stats':
+            self.send_json(200, self.service.stats.snapshot())
+        elif path == '/health':
+            self.send_json(200, {'status': 'ok', 'images': len(self.service.index), 'index': self.service.index.path,
+                                 'workers': self.service.workers})
+        else:
+            self.send_json(404, {'error': f"找不到路徑 {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/check':
+            self.send_json(404, {'error': f"找不到路徑 {url.path}"})
+            return
+        query = parse_qs(url.query)
+
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.send_json(411, {'error': "需要 Content-Length"})
+            return
+        if length > self.server.max_upload:
+            self.send_json(413, {'error': f"上傳內容超過上限 {self.server.max_upload} bytes"})
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)
+
+        try:
+            threshold = int(query['threshold'][0]) if 'threshold' in query else None
+            if threshold is not None and threshold < 0:
+                raise ValueError
+        except ValueError:
+            self.send_json(400, {'error': "threshold 必須是非負整數"})
+            return
+
+        if self.headers.get('Content-Type', '').split(';')[0].strip() == 'application/json':
+            try:
+                source = json.loads(body)['path']
+            except (ValueError, KeyError, TypeError):
+                source = None
+            if not isinstance(source, str) or not source:
+                self.send_json(400, {'error': '請以 {"path": "..."} 指定文件路徑'})
+                return
+            filename = query.get('filename', [source.replace('\\', '/').rsplit('/', 1)[-1]])[0]
+        else:
+            source = body
+            filename = query.get('filename', ['upload.docx'])[0]
+
+        try:
+            self.send_json(200, self.service.check(source, filename, threshold))
+        except ServiceBusy:
+            self.send_json(503, {'error': "服務忙碌中，請稍後再試"})
+        except (ValueError, OSError) as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            self.send_json(500, {'error': f"處理時發生錯誤: {e}"})
+
+
+def make_server(service, host='127.0.0.1', port=DEFAULT_PORT, max_upload=DEFAULT_MAX_UPLOAD, verbose=False):
+    """建立 HTTP 伺服器 (尚未開始服務)，port=0 時由系統指定可用的埠號。"""
+    server = ThreadingHTTPServer((host, port), DuplicateRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.max_upload = max_upload
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常駐的本機重複圖片檢查服務，載入一次索引後以 HTTP 接收文件查詢。")
+    parser.add_argument("index", help="以 corpus_index.py build-index 建立的索引檔")
+    parser.add_argument("--host", default="127.0.0.1", help="綁定的位址 (預設 127.0.0.1，只接受本機連線)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"埠號 (預設 {DEFAULT_PORT}，0 代表自動選擇)")
+    parser.add_argument("--threshold", type=int, default=5, help="預設的相似度寬容閥值 (預設 5)")
+    parser.add_argument("--workers", type=int, default=0, help="計算雜湊的工作行程數 (預設 0，代表使用所有 CPU 核心)")
+    parser.add_argument("--max-queue", type=int, default=None, help="工作行程都忙碌時最多排隊的請求數 (預設為行程數的 4 倍)")
+    parser.add_argument("--max-upload-mb", type=int, default=DEFAULT_MAX_UPLOAD // 1024 // 1024, help="單一上傳檔案的大小上限 (MB)")
+    parser.add_argument("--max-pixels", type=int, default=DEFAULT_MAX_PIXELS, help="單張圖片的像素上限，0 代表只套用 PIL 內建的上限")
+    parser.add_argument("--verbose", action="store_true", help="輸出每個請求的存取紀錄")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    service = DuplicateService(args.index, args.threshold, args.workers, args.max_queue, args.max_pixels)
+    service.warm_up()
+    server = make_server(service, args.host, args.port, args.max_upload_mb * 1024 * 1024, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"已載入索引 {args.index} ({len(service.index)} 張圖片)，{service.workers} 個工作行程，"
+          f"啟動耗時 {time.perf_counter() - start:.1f} 秒")
+    print(f"服務位址 http://{host}:{port}/check ，按 Ctrl+C 結束。", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在關閉服務...")
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -1,189 +1,220 @@
 import os
 import sys
-import zipfile
-import xml.etree.ElementTree as ET
-from PIL import Image
-import imagehash
-import io
+import time
 import argparse
-
-# Docx XML 檔案中常用的命名空間
-NS = {
-    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
-    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
-    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
-    'pic': 'http://schemas.openxmlformats.org/drawingml/2006/picture',
-    'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
-}
-
-def extract_images_from_docx(docx_path):
-    """
-    解析 Docx 壓縮檔，提取裡面的圖片以及其所在的章節或上下文。
-    """
-    images_info = []
-    try:
-        with zipfile.ZipFile(docx_path, 'r') as docx_zip:
-            # 1. 讀取關聯檔 (_rels) 來取得關聯 ID 與實體圖檔路徑的映射關係
-            rels_path = 'word/_rels/document.xml.rels'
-            if rels_path not in docx_zip.namelist():
-                return images_info
-            
-            rels_xml = docx_zip.read(rels_path)
-            rels_tree = ET.fromstring(rels_xml)
-            
-            rel_map = {}
-            for rel in rels_tree.findall('.//{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'):
-                rel_id = rel.get('Id')
-                target = rel.get('Target')
-                if target.startswith('media/'):
-                    rel_map[rel_id] = target
-
-            # 2. 讀取主文件內容，依序解析段落與圖片
-            doc_path = 'word/document.xml'
-            if doc_path not in docx_zip.namelist():
-                return images_info
-                
-            doc_xml = docx_zip.read(doc_path)
-            doc_tree = ET.fromstring(doc_xml)
-            
-            current_chapter = "開頭/未命名章節"
-            recent_text_buffer = []
-
-            # 找到文件的 body
-            body = doc_tree.find('w:body', NS)
-            if body is None:
-                return images_info
-
-            # 依序走訪所有元素
-            for elem in body:
-                if elem.tag == f"{{{NS['w']}}}p": # 是一個段落
-                    # 提取這段的文字
-                    texts = [t.text for t in elem.findall('.//w:t', NS) if t.text]
-                    para_text = "".join(texts).strip()
-                    
-                    if para_text:
-                        # 檢查這段文字的樣式是不是標題 (Heading)
-                        pPr = elem.find('w:pPr', NS)
-                        if pPr is not None:
-                            pStyle = pPr.find('w:pStyle', NS)
-                            if pStyle is not None:
-                                style_val = pStyle.get(f"{{{NS['w']}}}val")
-                                if style_val and style_val.startswith('Heading'):
-                                    current_chapter = para_text
-                                    recent_text_buffer = [] # 遇到新標題就清空上下文
-                        
-                        recent_text_buffer.append(para_text)
-                        # 只保留最近兩段有文字的段落作為上下文參考
-                        if len(recent_text_buffer) > 2:
-                            recent_text_buffer.pop(0)
-
-                    # 檢查這段落裡有沒有夾帶圖片繪圖 (drawing)
-                    for drawing in elem.findall('.//w:drawing', NS):
-                        blips = drawing.findall('.//a:blip', NS)
-                        for blip in blips:
-                            embed_id = blip.get(f"{{{NS['r']}}}embed")
-                            if embed_id and embed_id in rel_map:
-                                target_media = 'word/' + rel_map[embed_id]
-                                if target_media in docx_zip.namelist():
-                                    img_bytes = docx_zip.read(target_media)
-                                     
-                                    context = current_chapter
-                                    if current_chapter == "開頭/未命名章節" and recent_text_buffer:
-                                        context = f"上下文: {' '.join(recent_text_buffer)}"
-                                        
-                                    images_info.append({
-                                        'filename': os.path.basename(docx_path),
-                                        'image_name': target_media.split('/')[-1],
-                                        'context': context[:50] + "..." if len(context) > 50 else context,
-                                        'bytes': img_bytes
-                                    })
-                                    
-    except Exception as e:
-        print(f"處理檔案時發生錯誤 {docx_path}: {e}")
-        
-    return images_info
+import multiprocessing
+
+from docx_scanner import create_hasher, PipelineStats, DEFAULT_MAX_PIXELS, MATCH_MODES, DEFAULT_MATCH_MODE
+from hash_cache import HashCache, default_cache_path, DEFAULT_MAX_DOCUMENTS, DEFAULT_MAX_MEDIA
+from hash_index import INDEX_TYPES, DEFAULT_INDEX
+from clustering import CLUSTER_MODES, DEFAULT_CLUSTER_MODE
+from incremental import FolderWatcher
+from profiling import ScanProfile, profile_stage
+from scan_engine import ScanEngine, format_group, group_records, iter_duplicate_groups, report_header, report_footer
+from discovery import DocumentWalker, add_discovery_arguments, discovery_options
+from report_writers import add_report_arguments, report_targets, report_meta, open_report_writers
 
 def main():
     parser = argparse.ArgumentParser(description="比對目標資料夾中所有 docx 檔案內的圖片使否重複。")
     parser.add_argument("folder", help="包含 docx 檔案的資料夾絕對或相對路徑")
-    parser.add_argument("--threshold", type=int, default=5, help="圖片相似度寬容閥值 (預設 5，越小越嚴格，0 代表完全一模一樣)")
+    parser.add_argument("--threshold", type=int, default=5, help="圖片相似度寬容閥值 (預設 5，越小越嚴格，0 代表完全一模一樣)；--match invariant 時為放寬的有效距離，見 --match")
+    parser.add_argument("--index", choices=sorted(INDEX_TYPES), default=DEFAULT_INDEX, help=f"分群時使用的近鄰搜尋索引 (預設 {DEFAULT_INDEX})")
+    parser.add_argument("--cache", action=argparse.BooleanOptionalAction, default=True, help="使用本機雜湊快取，略過沒有變動的文件與圖片 (預設開啟，--no-cache 關閉)")
+    parser.add_argument("--cache-path", default=None, help=f"快取檔位置 (預設 {default_cache_path()})")
+    parser.add_argument("--cache-max-documents", type=int, default=DEFAULT_MAX_DOCUMENTS, help=f"快取最多保留的文件數 (預設 {DEFAULT_MAX_DOCUMENTS})")
+    parser.add_argument("--cache-max-media", type=int, default=DEFAULT_MAX_MEDIA, help=f"快取最多保留的圖片數 (預設 {DEFAULT_MAX_MEDIA})")
+    parser.add_argument("--workers", type=int, default=1, help="同時處理文件的行程數 (預設 1，0 代表使用所有 CPU 核心)")
+    parser.add_argument("--read-ahead", type=int, default=0, help="預先讀取的文件數，讀檔與解析、雜湊同時進行，適合網路磁碟 (預設 0 代表不預讀)")
+    parser.add_argument("--readers", type=int, default=2, help="預讀時同時讀檔的執行緒數 (預設 2)")
+    parser.add_argument("--full-decode", action="store_true", help="以原始解析度解碼圖片後再計算雜湊 (預設會先縮小解碼以加快速度)")
+    parser.add_argument("--max-pixels", type=int, default=DEFAULT_MAX_PIXELS, help=f"單張圖片的像素上限，超過時略過該圖片 (預設 {DEFAULT_MAX_PIXELS}，0 代表只套用 PIL 內建的上限)")
+    parser.add_argument("--thresholds", type=parse_thresholds, default=None, help="一次掃描輸出多個閥值的結果，以逗號分隔，例如 0,3,5,8 (指定時忽略 --threshold)")
+    parser.add_argument("--cluster-mode", choices=CLUSTER_MODES, default=DEFAULT_CLUSTER_MODE,
+                        help="分群方式：representative 與各群組的代表圖片比較 (預設)；single 距離在閥值內的圖片遞移相連；"
+                             "complete 遞移相連但群組內任兩張圖片的距離不超過 --max-diameter")
+    parser.add_argument("--match", choices=MATCH_MODES, default=DEFAULT_MATCH_MODE,
+                        help="比對模式：phash 一般感知雜湊 (預設)；invariant 另外找出旋轉、翻轉與輕微裁切的圖片，"
+                             "以標準方向的 phash 搭配 ahash/dhash 預篩雜湊比對。此模式的閥值 T 為有效距離而非涵明距離："
+                             "phash 距離 <= T，或 ahash/dhash 也接近且 phash 距離 <= min(2.5T, T+8) (T=5 時 12、T=20 時 28) 即視為相似，"
+                             "不滿足三角不等式")
+    parser.add_argument("--max-diameter", type=int, default=None, help="complete 分群時群組內允許的最大距離 (預設等於閥值)")
+    parser.add_argument("--watch", action="store_true", help="持續監看資料夾，只處理新增或修改過的文件並更新重複群組 (分群方式固定為 single)")
+    parser.add_argument("--interval", type=float, default=5.0, help="監看模式檢查資料夾的間隔秒數 (預設 5)")
+    add_discovery_arguments(parser)
+    add_report_arguments(parser)
+    parser.add_argument("--profile", metavar="OUT.json", default=None,
+                        help="記錄每份文件與各處理階段的時間、讀取量與記憶體高峰，輸出成 JSON 並列出最慢的文件與最大的圖片")
     args = parser.parse_args()
+    if args.watch and args.thresholds is not None:
+        parser.error("--watch 不能與 --thresholds 同時使用")
+    if args.watch and args.profile:
+        parser.error("--watch 不能與 --profile 同時使用")
+    if args.watch and report_targets(args):
+        parser.error("--watch 不能與 --html、--jsonl、--csv 同時使用")
 
     folder_path = args.folder
     threshold = args.threshold
+    thresholds = args.thresholds
 
     if not os.path.isdir(folder_path):
         print(f"錯誤：找不到指定的資料夾 '{folder_path}'")
         sys.exit(1)
 
-    docx_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.lower().endswith('.docx') and not f.startswith('~')]
-    
-    if not docx_files:
+    hasher = create_hasher(args.match, reduced_decode=not args.full_decode, max_pixels=args.max_pixels)
+
+    if args.watch:
+        cache = HashCache(args.cache_path, args.cache_max_documents, args.cache_max_media, variant=hasher.name) if args.cache else None
+        try:
+            watch_folder(folder_path, threshold, args.interval, args.workers, cache, hasher, discovery_options(args))
+        finally:
+            if cache is not None:
+                cache.close()
+        return
+
+    # 邊走訪資料夾邊處理文件，不必等整個檔案庫列完才開始
+    walker = DocumentWalker(folder_path, **discovery_options(args))
+    print(f"開始搜尋 '{folder_path}' 中的 docx 檔案並解析、提取圖片...\n")
+
+    def on_document(path, done, total):
+        pending = "" if walker.finished else "+"
+        print(f"  處理讀取: {os.path.relpath(path, folder_path)} ({done}/{total}{pending})")
+
+    cache = HashCache(args.cache_path, args.cache_max_documents, args.cache_max_media, variant=hasher.name) if args.cache else None
+    stats = PipelineStats() if args.read_ahead > 0 else None
+    profile = ScanProfile() if args.profile else None
+    engine = ScanEngine(hasher, cache, args.workers, args.read_ahead, args.readers, args.index, stats=stats, profile=profile)
+    try:
+        result = engine.scan(walker, on_document, print)
+    except KeyboardInterrupt:
+        # 中斷時引擎會關閉行程池與讀檔執行緒，已算好的雜湊仍會寫入快取
+        print("\n已取消掃描。")
+        sys.exit(130)
+    finally:
+        if cache is not None:
+            cache.close()
+            print(f"\n快取命中 {cache.hits} 張圖片，重新計算 {cache.misses} 張 ({cache.path})")
+    print()
+    for line in walker.summary_lines():
+        print(line)
+    if not result['file_count']:
         print(f"在 '{folder_path}' 中找不到任何 docx 檔案。")
         sys.exit(0)
+    if stats is not None:
+        print()
+        for line in stats.summary_lines():
+            print(line)
+
+    report_duplicates(result['all_images'], result['hashes'], threshold, thresholds, args.cluster_mode, args.max_diameter,
+                      args.index, profile, report_targets(args), folder_path, result['file_count'])
+
+    if profile is not None:
+        profile.write_json(args.profile)
+        for line in profile.summary_lines():
+            print(line)
+        print(f"\n效能資料已儲存至 {args.profile}")
+
 
-    print(f"找到 {len(docx_files)} 個 docx 檔案，開始解析並提取圖片...\n")
-
-    all_images = []
-    
-    for df in docx_files:
-        print(f"  處理讀取: {os.path.basename(df)}")
-        extracted = extract_images_from_docx(df)
-        for img_info in extracted:
-            try:
-                # 讀取圖片 Bytes，並透過 Pillow 將其轉成圖片物件
-                img = Image.open(io.BytesIO(img_info['bytes']))
-                
-                # 計算 Perceptual Hash (感知雜湊)
-                # Phash 對於圖片稍微壓縮、調整大小等微小變動具有很強的抵抗力
-                img_hash = imagehash.phash(img)
-                img_info['hash'] = img_hash
-                all_images.append(img_info)
-            except Exception as e:
-                print(f"    無法解析圖片 {img_info['image_name']}: {e}")
-
-    print(f"\n共提取並計算了 {len(all_images)} 張圖片的 Hash。開始進行相似度比對 (目前的容忍閥值為: {threshold})...")
-
-    # 利用分群演算法將相似的圖片分類
-    groups = []
-    
-    for img in all_images:
-        found_group = False
-        for group in groups:
-            # 與群組內的第一張代表圖片進行比較
-            # ImageHash 可以直接透過減號計算兩個 Hash 之間的涵明距離 (Hamming distance)
-            if img['hash'] - group[0]['hash'] <= threshold:
-                group.append(img)
-                found_group = True
-                break
-        
-        # 若與所有現有群組都不相似，就自己建立一個新群組
-        if not found_group:
-            groups.append([img])
-
-    # 輸出簡易報告到終端機
-    print("\n" + "="*60)
-    print(" 📊 圖片重複檢查報告")
-    print("="*60)
-    
-    dup_count = 0
-    for i, group in enumerate(groups, 1):
-        if len(group) > 1:
-            dup_count += 1
-            print(f"\n[發現重複群組 #{dup_count}] 共 {len(group)} 張相似度極高的圖片:")
-            for img in group:
-                print(f"  📂 檔案來源: {img['filename']}")
-                print(f"  📍 所在章節/位置段落: {img['context']}")
-                print(f"  🖼 內部資源名稱: {img['image_name']}")
-                print(f"  🔑 Hash: {img['hash']}")
-            print("-" * 60)
-
-    print("\n" + "="*60)
-    if dup_count == 0:
-        print("🎉 太棒了！所有的檔案中沒有發現任何重複且相似的圖片。")
-    else:
-        print(f"⚠️  檢查完畢，總共發現 {dup_count} 組重複/相似的圖片。")
-    print("="*60 + "\n")
+def report_duplicates(all_images, hashes, threshold, thresholds=None, cluster_mode=DEFAULT_CLUSTER_MODE,
+                      max_diameter=None, index_kind=DEFAULT_INDEX, profile=None, targets=None, folder_path="",
+                      file_count=0):
+    """
+    把 all_images / hashes 分群並輸出報告；thresholds 不為 None 時依序輸出每個閥值的結果。
+    profile (ScanProfile) 不為 None 時記錄分群與輸出報告的時間。
+    targets (report_writers.report_targets) 指定時同時寫出 HTML / JSONL / CSV 報告檔，
+    多個閥值時檔名加上閥值 (例如 out_t3.jsonl)。
+    """
+    engine = ScanEngine(index_kind=index_kind, profile=profile)
+
+    def write_report(groups, t):
+        meta = report_meta(folder_path, t, cluster_mode, file_count, len(all_images))
+        writers = open_report_writers(targets or {}, meta, suffix_threshold=thresholds is not None)
+        with profile_stage(profile, 'report'):
+            print_report(groups, all_images, hashes, writers)
+        for writer in writers:
+            print(f"報告已儲存至 {writer.close()}")
+
+    if thresholds is None:
+        print(f"\n共提取並計算了 {len(all_images)} 張圖片的 Hash。開始進行相似度比對 (目前的容忍閥值為: {threshold})...")
+
+        # 利用分群演算法將相似的圖片分類
+        # 預設每張圖片與各群組的第一張代表圖片比較涵明距離 (Hamming distance)，
+        # 代表圖片存放在近鄰索引中，因此不必逐一掃描所有群組；
+        # single/complete 則以近鄰索引找出所有相似配對後用併查集合併
+        groups = engine.group(hashes, threshold, cluster_mode, max_diameter)
+        write_report(groups, threshold)
+        return
+
+    # 多個閥值：只建立一次鄰接圖，每個閥值都只是過濾邊後重新分群
+    print(f"\n共提取並計算了 {len(all_images)} 張圖片的 Hash。建立距離 <= {max(thresholds)} 的鄰接圖...")
+    graph = engine.build_graph(hashes, max(thresholds))
+    print(f"鄰接圖共有 {len(graph)} 組相似配對。")
+
+    for t in thresholds:
+        print(f"\n\n##### 容忍閥值: {t} #####")
+        with profile_stage(profile, 'grouping'):
+            groups = graph.cluster(t, cluster_mode, max_diameter)
+        write_report(groups, t)
+
+
+def print_report(groups, all_images, hashes, writers=()):
+    """
+    輸出簡易報告到終端機。groups 為索引值組成的群組，對應 all_images 與 hashes。
+    每個重複群組輸出後立即交給 writers 寫入報告檔，不必先收集所有群組。
+    """
+    for line in report_header():
+        print(line)
+    count = 0
+    for count, group in enumerate(iter_duplicate_groups(groups, all_images, hashes), 1):
+        for line in format_group(f"[發現重複群組 #{count}]", group):
+            print(line)
+        for writer in writers:
+            writer.write_group(group)
+    for line in report_footer(count):
+        print(line)
+
+
+def watch_folder(folder_path, threshold, interval, workers, cache, hasher, discovery=None):
+    """
+    監看模式：定期檢查資料夾，只處理新增、修改或刪除的文件並就地更新重複群組，按 Ctrl+C 結束。
+    第一次檢查輸出完整報告，之後只輸出有變動的群組。
+    """
+    watcher = FolderWatcher(folder_path, threshold, workers, cache, hasher, discovery)
+    index = watcher.index
+    print(f"監看模式：每 {interval:g} 秒檢查一次 '{folder_path}'，分群方式固定為遞移相連 (single)，按 Ctrl+C 結束。\n")
+
+    first = True
+    try:
+        while True:
+            changes = watcher.poll(lambda path, done, total: print(f"  處理讀取: {os.path.relpath(path, folder_path)} ({done}/{total})"))
+            if changes is not None:
+                for msg in changes['messages']:
+                    print(msg)
+                print(f"\n[{time.strftime('%H:%M:%S')}] 新增 {len(changes['added'])}、修改 {len(changes['modified'])}、"
+                      f"刪除 {len(changes['removed'])} 份文件，目前共 {len(watcher.snapshot)} 份文件、{len(index)} 張圖片。")
+                if first:
+                    print_report(index.duplicate_groups(), index.records, index.hashes)
+                    index.pop_changed_groups()
+                    first = False
+                else:
+                    for group in index.pop_changed_groups():
+                        for line in format_group("[群組有變動]", group_records(group, index.records, index.hashes)):
+                            print(line)
+                    print(f"目前共有 {len(index.duplicate_groups())} 組重複/相似的圖片。\n")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\n已結束監看。")
+
+
+def parse_thresholds(text):
+    """解析 --thresholds 的逗號分隔清單，例如 "0,3,5,8"。"""
+    try:
+        values = sorted({int(v) for v in text.split(',') if v.strip()})
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"無效的閥值清單: {text}")
+    if not values or values[0] < 0:
+        raise argparse.ArgumentTypeError(f"無效的閥值清單: {text}")
+    return values
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
@@ -1,273 +1,290 @@
 import os
 import sys
-import zipfile
-import xml.etree.ElementTree as ET
-from PIL import Image
-import imagehash
-import io
+import time
 import datetime
+import multiprocessing
+
+from docx_scanner import PipelineStats, create_hasher, DEFAULT_MATCH_MODE
+from hash_cache import HashCache
+from clustering import CLUSTER_MODES, DEFAULT_CLUSTER_MODE, CLUSTER_MODE_LABELS, NeighborGraph
+from incremental import FolderWatcher
+from profiling import ScanProfile
+from scan_engine import (ScanEngine, CancelToken, ScanCancelled, format_group, format_summary, group_records,
+                         iter_duplicate_groups)
+from discovery import DocumentWalker
+from results_view import DuplicateGroupModel, THUMBNAIL_SIZE
+from report_writers import report_meta, open_report_writers
 
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QLineEdit, QPushButton, QSlider, QProgressBar, QTextEdit,
-    QFileDialog, QMessageBox
+    QLabel, QLineEdit, QPushButton, QSlider, QProgressBar,
+    QFileDialog, QMessageBox, QCheckBox, QSpinBox, QComboBox, QGroupBox, QPlainTextEdit,
+    QTabWidget, QTreeView, QHeaderView
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-
-# --- 核心邏輯 ---
-NS = {
-    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
-    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
-    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
-    'pic': 'http://schemas.openxmlformats.org/drawingml/2006/picture',
-    'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
-}
-
-def extract_images_from_docx(docx_path):
-    images_info = []
-    try:
-        with zipfile.ZipFile(docx_path, 'r') as docx_zip:
-            rels_path = 'word/_rels/document.xml.rels'
-            if rels_path not in docx_zip.namelist():
-                return images_info
-            
-            rels_xml = docx_zip.read(rels_path)
-            rels_tree = ET.fromstring(rels_xml)
-            
-            rel_map = {}
-            for rel in rels_tree.findall('.//{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'):
-                rel_id = rel.get('Id')
-                target = rel.get('Target')
-                if target.startswith('media/'):
-                    rel_map[rel_id] = target
-
-            doc_path = 'word/document.xml'
-            if doc_path not in docx_zip.namelist():
-                return images_info
-                
-            doc_xml = docx_zip.read(doc_path)
-            doc_tree = ET.fromstring(doc_xml)
-            
-            current_chapter = "開頭/未命名章節"
-            recent_text_buffer = []
-
-            # 嘗試計算頁數：Word 在分頁時通常會插入 <w:lastRenderedPageBreak> 或 <w:br w:type="page"/>
-            current_page = 1
-
-            body = doc_tree.find('w:body', NS)
-            if body is None:
-                return images_info
-
-            # 遞迴或線性尋找段落與分頁符號
-            # 這裡我們用簡單的迭代 w:p 和其他可能有分頁符號的元素
-            for elem in body.iter():
-                # 計算頁碼
-                if elem.tag == f"{{{NS['w']}}}lastRenderedPageBreak":
-                    current_page += 1
-                elif elem.tag == f"{{{NS['w']}}}br":
-                    br_type = elem.get(f"{{{NS['w']}}}type")
-                    if br_type == "page":
-                        current_page += 1
-
-                # 處理段落
-                if elem.tag == f"{{{NS['w']}}}p":
-                    texts = [t.text for t in elem.findall('.//w:t', NS) if t.text]
-                    para_text = "".join(texts).strip()
-                    
-                    if para_text:
-                        pPr = elem.find('w:pPr', NS)
-                        if pPr is not None:
-                            pStyle = pPr.find('w:pStyle', NS)
-                            if pStyle is not None:
-                                style_val = pStyle.get(f"{{{NS['w']}}}val")
-                                if style_val and style_val.startswith('Heading'):
-                                    current_chapter = para_text
-                                    recent_text_buffer = []
-                        
-                        recent_text_buffer.append(para_text)
-                        if len(recent_text_buffer) > 2:
-                            recent_text_buffer.pop(0)
-
-                # 處理圖片
-                if elem.tag == f"{{{NS['w']}}}drawing":
-                    blips = elem.findall('.//a:blip', NS)
-                    for blip in blips:
-                        embed_id = blip.get(f"{{{NS['r']}}}embed")
-                        if embed_id and embed_id in rel_map:
-                            target_media = 'word/' + rel_map[embed_id]
-                            if target_media in docx_zip.namelist():
-                                img_bytes = docx_zip.read(target_media)
-                                 
-                                context = current_chapter
-                                if current_chapter == "開頭/未命名章節" and recent_text_buffer:
-                                    context = f"上下文: {' '.join(recent_text_buffer)}"
-                                    
-                                images_info.append({
-                                    'filename': os.path.basename(docx_path),
-                                    'image_name': target_media.split('/')[-1],
-                                    'context': context[:50] + "..." if len(context) > 50 else context,
-                                    'page': current_page,
-                                    'bytes': img_bytes
-                                })
-                                
-    except Exception as e:
-        print(f"處理檔案時發生錯誤 {docx_path}: {e}")
-        
-    return images_info
+from PyQt6.QtCore import Qt, QThread, QTimer, QSize, pyqtSignal
+
+# 滑桿的最大值，閥值調高超過掃描時的鄰接圖時，背景重建的鄰接圖會直接建到這個距離
+MAX_THRESHOLD = 20
+
+# 背景執行緒累積訊息，每 LOG_BATCH_LINES 行或 LOG_FLUSH_SECONDS 秒才送一次到介面
+LOG_BATCH_LINES = 200
+LOG_FLUSH_SECONDS = 0.1
+# 紀錄分頁最多保留的行數，超過時捨棄最舊的
+LOG_MAX_LINES = 10000
+# 每次送到結果分頁的群組數
+GROUP_BATCH = 1000
+
+
+def snapshot_groups(groups, records, hashes):
+    """
+    複製群組用到的圖片紀錄與雜湊，並把群組改成新清單的索引值。
+    監看模式的索引會在背景執行緒中繼續變動，送到介面的結果必須是獨立的複本。
+    """
+    snapshot_records = []
+    snapshot_hashes = []
+    snapshot = []
+    for group in groups:
+        start = len(snapshot_records)
+        for idx in group:
+            snapshot_records.append(dict(records[idx]))
+            snapshot_hashes.append(hashes[idx])
+        snapshot.append(list(range(start, len(snapshot_records))))
+    return snapshot_records, snapshot_hashes, snapshot
+
 
 # --- 背景任務執行緒 ---
 class WorkerThread(QThread):
+    # 一次送出多行訊息 (以換行分隔)
     log_signal = pyqtSignal(str)
     progress_signal = pyqtSignal(int, int)
     finished_signal = pyqtSignal()
-
-    def __init__(self, folder_path, threshold):
+    # 掃描完成後送出 all_images、hashes 與鄰接圖，讓介面調整閥值時不必重新掃描
+    result_signal = pyqtSignal(object)
+    # 分批送出重複群組 {'records', 'hashes', 'groups', 'reset', 'changed'}，reset 為 True 時取代目前的結果，
+    # changed 為修改或刪除過、縮圖需要重新讀取的文件
+    groups_signal = pyqtSignal(object)
+
+    def __init__(self, folder_path, threshold, use_cache=True, workers=1, cluster_mode=DEFAULT_CLUSTER_MODE,
+                 watch=False, interval=5, read_ahead=0, recursive=True, match=DEFAULT_MATCH_MODE):
         super().__init__()
         self.folder_path = folder_path
         self.threshold = threshold
+        self.cluster_mode = cluster_mode
+        self.use_cache = use_cache
+        self.workers = workers
+        self.watch = watch
+        self.interval = interval
+        self.read_ahead = read_ahead
+        self.discovery = {'recursive': recursive}
+        self.hasher = create_hasher(match)
+        self.cancel_token = CancelToken()
+        self._log_buffer = []
+        self._last_flush = 0.0
+
+    def log(self, text):
+        """
+        累積訊息再一次送出：每行一個訊號時，文件很多會讓介面執行緒忙著處理事件而無法回應。
+        """
+        self._log_buffer.append(text)
+        now = time.monotonic()
+        if len(self._log_buffer) >= LOG_BATCH_LINES or now - self._last_flush >= LOG_FLUSH_SECONDS:
+            self.flush_log(now)
+
+    def flush_log(self, now=None):
+        if self._log_buffer:
+            self.log_signal.emit("\n".join(self._log_buffer))
+            self._log_buffer = []
+        self._last_flush = time.monotonic() if now is None else now
+
+    def send_groups(self, records, hashes, groups, changed=()):
+        """把重複群組分批送到結果分頁，第一批取代原本的結果。"""
+        self.flush_log()
+        for start in range(0, max(len(groups), 1), GROUP_BATCH):
+            self.groups_signal.emit({
+                'records': records,
+                'hashes': hashes,
+                'groups': groups[start:start + GROUP_BATCH],
+                'reset': start == 0,
+                'changed': changed if start == 0 else (),
+            })
+
+    def cancel(self):
+        """從介面執行緒取消掃描或停止監看，背景執行緒會在處理完目前的文件後結束。"""
+        self.cancel_token.cancel()
+        self.requestInterruption()
 
     def run(self):
         try:
-            self.log_signal.emit("啟動比對任務...")
-            docx_files = [os.path.join(self.folder_path, f) for f in os.listdir(self.folder_path) if f.lower().endswith('.docx') and not f.startswith('~')]
-            
-            if not docx_files:
-                self.log_signal.emit(f"錯誤：在 '{self.folder_path}' 中找不到任何 docx 檔案。")
-                self.finished_signal.emit()
+            if self.watch:
+                self.run_watch()
                 return
 
-            self.log_signal.emit(f"找到 {len(docx_files)} 個 docx 檔案，開始解析並提取圖片...")
+            self.log("啟動比對任務...")
+            # 邊走訪資料夾邊處理文件，進度條的總數是目前已找到的文件數
+            walker = DocumentWalker(self.folder_path, **self.discovery)
+            self.log("開始搜尋 docx 檔案並解析、提取圖片...")
+            self.flush_log()
+
+            def on_document(path, done, total):
+                self.log(f"  處理讀取: {os.path.relpath(path, self.folder_path)}")
+                self.progress_signal.emit(done, total)
+
+            # SQLite 連線只能在建立它的執行緒中使用，所以在背景執行緒內開啟
+            cache = HashCache(variant=self.hasher.name) if self.use_cache else None
+            stats = PipelineStats() if self.read_ahead > 0 else None
+            # 每次掃描都記錄各階段的時間，完成後顯示在效能摘要中
+            profile = ScanProfile()
+            engine = ScanEngine(self.hasher, cache, workers=self.workers, read_ahead=self.read_ahead, stats=stats, profile=profile)
+            try:
+                result = engine.scan(walker, on_document, self.log, self.cancel_token)
+            finally:
+                if cache is not None:
+                    cache.close()
+                    self.log(f"\n快取命中 {cache.hits} 張圖片，重新計算 {cache.misses} 張")
+            self.log("\n".join(walker.summary_lines()))
+            if not result['file_count']:
+                self.log(f"錯誤：在 '{self.folder_path}' 中找不到任何 docx 檔案。")
+                return
+            if stats is not None:
+                self.log("\n" + "\n".join(stats.summary_lines()))
+
+            all_images, hashes = result['all_images'], result['hashes']
+            self.log(f"\n共提取並計算了 {len(all_images)} 張圖片。開始進行相似度比對 (目前的容忍閥值為: {self.threshold})...")
+            self.flush_log()
+
+            # 鄰接圖只建立到目前的閥值：調低閥值時直接重新分群，調高超過時才由 GraphThread 在背景重建
+            graph = engine.build_graph(hashes, self.threshold)
+            with profile.stage('grouping'):
+                groups = graph.cluster(self.threshold, self.cluster_mode)
+
+            with profile.stage('report'):
+                # 群組明細顯示在結果分頁，紀錄中只留結論
+                groups = [g for g in groups if len(g) > 1]
+                self.log("\n" + format_summary(len(groups)))
+                self.send_groups(all_images, hashes, groups)
+
+                self.generate_report(result['file_count'], len(all_images),
+                                     iter_duplicate_groups(groups, all_images, hashes))
+            self.result_signal.emit({
+                'folder_path': self.folder_path,
+                'file_count': result['file_count'],
+                'all_images': all_images,
+                'hashes': hashes,
+                'graph': graph,
+                'index_kind': engine.index_kind,
+                'profile': profile,
+            })
+
+        except ScanCancelled:
+            self.log("\n已取消掃描。")
+        except Exception as e:
+            self.log(f"\n執行中發生錯誤: {e}")
+        finally:
+            self.flush_log()
+            self.finished_signal.emit()
+
+    def run_watch(self):
+        """監看模式：定期檢查資料夾，只處理新增、修改或刪除的文件，直到呼叫 cancel()。"""
+        self.log(f"啟動監看模式：每 {self.interval:g} 秒檢查一次資料夾，分群方式固定為遞移相連。")
+        self.cluster_mode = 'single'
 
-            all_images = []
-            
-            total_files = len(docx_files)
-            for i, df in enumerate(docx_files):
-                self.log_signal.emit(f"  處理讀取: {os.path.basename(df)}")
-                extracted = extract_images_from_docx(df)
-                for img_info in extracted:
-                    try:
-                        img = Image.open(io.BytesIO(img_info['bytes']))
-                        img_hash = imagehash.phash(img)
-                        img_info['hash'] = img_hash
-                        all_images.append(img_info)
-                    except Exception as e:
-                        self.log_signal.emit(f"    無法解析圖片 {img_info['image_name']}: {e}")
-                
-                self.progress_signal.emit(i + 1, total_files)
-
-            self.log_signal.emit(f"\n共提取並計算了 {len(all_images)} 張圖片。開始進行相似度比對 (目前的容忍閥值為: {self.threshold})...")
-
-            groups = []
-            for img in all_images:
-                found_group = False
-                for group in groups:
-                    if img['hash'] - group[0]['hash'] <= self.threshold:
-                        group.append(img)
-                        found_group = True
+        def on_document(path, done, total):
+            self.log(f"  處理讀取: {os.path.relpath(path, self.folder_path)}")
+            self.progress_signal.emit(done, total)
+
+        cache = HashCache(variant=self.hasher.name) if self.use_cache else None
+        try:
+            watcher = FolderWatcher(self.folder_path, self.threshold, self.workers, cache, self.hasher, self.discovery)
+            index = watcher.index
+            first = True
+            while not self.isInterruptionRequested():
+                try:
+                    changes = watcher.poll(on_document, self.cancel_token)
+                except ScanCancelled:
+                    # 處理到一半就停止，已處理的文件仍會列入最後的報告
+                    break
+                if changes is not None:
+                    for msg in changes['messages']:
+                        self.log(msg)
+                    self.log(
+                        f"\n[{datetime.datetime.now().strftime('%H:%M:%S')}] 新增 {len(changes['added'])}、"
+                        f"修改 {len(changes['modified'])}、刪除 {len(changes['removed'])} 份文件，"
+                        f"目前共 {len(watcher.snapshot)} 份文件、{len(index)} 張圖片。")
+                    duplicate_groups = index.duplicate_groups()
+                    if first:
+                        index.pop_changed_groups()
+                        self.log(format_summary(len(duplicate_groups)))
+                        first = False
+                    else:
+                        for group in index.pop_changed_groups():
+                            for line in format_group("[群組有變動]", group_records(group, index.records, index.hashes)):
+                                self.log(line)
+                        self.log(f"目前共有 {len(duplicate_groups)} 組重複/相似的圖片。")
+                    self.send_groups(*snapshot_groups(duplicate_groups, index.records, index.hashes),
+                                     changed=changes['modified'] + changes['removed'])
+
+                self.flush_log()
+                # 分段等待，按下停止後能盡快結束
+                for _ in range(max(1, int(self.interval * 10))):
+                    if self.isInterruptionRequested():
                         break
-                
-                if not found_group:
-                    groups.append([img])
+                    self.msleep(100)
+        finally:
+            if cache is not None:
+                cache.close()
 
-            dup_count = 0
-            duplicate_groups = []
-            
-            self.log_signal.emit("\n" + "="*60)
-            self.log_signal.emit(" 📊 圖片重複檢查報告")
-            self.log_signal.emit("="*60)
-            
-            for i, group in enumerate(groups, 1):
-                if len(group) > 1:
-                    dup_count += 1
-                    duplicate_groups.append(group)
-                    
-                    self.log_signal.emit(f"\n[發現重複群組 #{dup_count}] 共 {len(group)} 張相似度極高的圖片:")
-                    for img in group:
-                        self.log_signal.emit(f"  📂 檔案來源: {img['filename']}")
-                        self.log_signal.emit(f"  📄 所在頁數: 第 {img['page']} 頁")
-                        self.log_signal.emit(f"  📍 所在節錄: {img['context']}")
-                        self.log_signal.emit(f"  🖼 圖片名稱: {img['image_name']}")
-                        self.log_signal.emit(f"  🔑 Hash: {img['hash']}")
-                    self.log_signal.emit("-" * 60)
-
-            self.log_signal.emit("\n" + "="*60)
-            if dup_count == 0:
-                self.log_signal.emit("🎉 太棒了！所有的檔案中沒有發現任何重複且相似的圖片。")
-            else:
-                self.log_signal.emit(f"⚠️  檢查完畢，總共發現 {dup_count} 組重複/相似的圖片。")
-            self.log_signal.emit("="*60 + "\n")
-            
-            self.generate_html_report(total_files, len(all_images), duplicate_groups)
+        self.log("\n已停止監看。")
+        self.generate_report(len(watcher.snapshot), len(index),
+                             iter_duplicate_groups(index.duplicate_groups(), index.records, index.hashes))
 
-        except Exception as e:
-            self.log_signal.emit(f"\n執行中發生錯誤: {e}")
-        finally:
-            self.finished_signal.emit()
+    def generate_report(self, file_count, image_count, duplicate_groups):
+        report_path = write_reports(self.folder_path, self.threshold, self.cluster_mode, file_count, image_count,
+                                    duplicate_groups)
+        self.log(f"\n[系統提示] 詳細 HTML 報告已儲存至: \n{report_path}")
 
-    def generate_html_report(self, file_count, image_count, dup_groups):
-        report_dir = os.path.join(self.folder_path, "report")
-        if not os.path.exists(report_dir):
-            os.makedirs(report_dir)
-            
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        report_path = os.path.join(report_dir, f"Duplicate_Image_Report_{timestamp}.html")
-        
-        html_content = f"""<!DOCTYPE html>
-<html lang="zh-TW">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Docx 圖片重複檢測報告</title>
-    <style>
-        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; max-width: 1000px; margin: 0 auto; padding: 20px; }}
-        h1 {{ color: #2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 10px; }}
-        h2 {{ color: #2980b9; margin-top: 30px; }}
-        .summary {{ background: #f8f9fa; padding: 15px; border-radius: 8px; margin-bottom: 30px; border-left: 4px solid #3498db; }}
-        .group {{ background: #fff; border: 1px solid #ddd; border-radius: 8px; margin-bottom: 20px; padding: 15px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }}
-        .group-title {{ font-size: 1.2em; font-weight: bold; color: #e74c3c; margin-top: 0; margin-bottom: 15px; }}
-        ul {{ list-style-type: none; padding: 0; margin: 0; }}
-        li {{ margin-bottom: 15px; padding-bottom: 15px; border-bottom: 1px dashed #eee; }}
-        li:last-child {{ margin-bottom: 0; border-bottom: none; padding-bottom: 0; }}
-        .detail-label {{ font-weight: bold; color: #555; display: inline-block; width: 150px; }}
-        .success-msg {{ font-size: 1.2em; color: #27ae60; font-weight: bold; text-align: center; padding: 20px; background: #e8f8f5; border-radius: 8px; }}
-        code {{ background: #f4f4f4; padding: 2px 5px; border-radius: 4px; font-family: monospace; color: #d63031; }}
-    </style>
-</head>
-<body>
-    <h1>Docx 圖片重複檢測報告</h1>
-    <div class="summary">
-        <p><span class="detail-label">產生時間:</span> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-        <p><span class="detail-label">掃描資料夾:</span> <code>{self.folder_path}</code></p>
-        <p><span class="detail-label">相似度閥值:</span> {self.threshold}</p>
-        <p><span class="detail-label">掃描文件數量:</span> {file_count}</p>
-        <p><span class="detail-label">提取圖片數量:</span> {image_count}</p>
-        <p><span class="detail-label">發現重複群組:</span> {len(dup_groups)}</p>
-    </div>
-"""
-        with open(report_path, "w", encoding="utf-8") as f:
-            f.write(html_content)
-            
-            if not dup_groups:
-                f.write('    <div class="success-msg">🎉 太棒了！所有的檔案中沒有發現任何重複且相似的圖片。</div>\n')
-            else:
-                f.write('    <h2>⚠️ 重複圖片詳細資料</h2>\n')
-                for i, group in enumerate(dup_groups, 1):
-                    f.write(f'    <div class="group">\n')
-                    f.write(f'        <div class="group-title">發現重複群組 #{i} (共 {len(group)} 張高度相似圖片)</div>\n')
-                    f.write('        <ul>\n')
-                    for img in group:
-                        f.write(f'            <li>\n')
-                        f.write(f'                <div><span class="detail-label">檔案來源:</span> <code>{img["filename"]}</code></div>\n')
-                        f.write(f'                <div><span class="detail-label">所在頁數:</span> 第 {img["page"]} 頁</div>\n')
-                        f.write(f'                <div><span class="detail-label">所在節錄:</span> {img["context"]}</div>\n')
-                        f.write(f'                <div><span class="detail-label">內部資源名稱:</span> <code>{img["image_name"]}</code></div>\n')
-                        f.write(f'                <div><span class="detail-label">特徵雜湊碼:</span> <code>{img["hash"]}</code></div>\n')
-                        f.write(f'            </li>\n')
-                    f.write('        </ul>\n')
-                    f.write('    </div>\n')
-            f.write('</body>\n</html>\n')
-                    
-        self.log_signal.emit(f"\n[系統提示] 詳細 HTML 報告已儲存至: \n{report_path}")
+
+class GraphThread(QThread):
+    """以已保存的雜湊在背景重建到 max_distance 的鄰接圖，不必重新掃描，也不會讓介面停止回應。"""
+    # 完成時送出鄰接圖，發生錯誤時送出 None
+    graph_signal = pyqtSignal(object)
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, hashes, max_distance, index_kind, parent=None):
+        super().__init__(parent)
+        self.hashes = hashes
+        self.max_distance = max_distance
+        self.index_kind = index_kind
+
+    def run(self):
+        try:
+            graph = NeighborGraph.from_index(self.hashes, self.max_distance, self.index_kind)
+        except Exception as e:
+            self.log_signal.emit(f"\n建立鄰接圖時發生錯誤: {e}")
+            graph = None
+        self.graph_signal.emit(graph)
+
+
+# --- HTML 報告 ---
+def write_reports(folder_path, threshold, cluster_mode, file_count, image_count, duplicate_groups):
+    """
+    把重複群組逐組寫成 folder_path/report/Duplicate_Image_Report_時間/ 底下的分頁 HTML 報告 (含縮圖)、
+    groups.jsonl 與 groups.csv，回傳 HTML 報告 index.html 的路徑。duplicate_groups 可以是產生器。
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_dir = os.path.join(folder_path, "report", f"Duplicate_Image_Report_{timestamp}")
+    targets = {
+        'html': report_dir,
+        'jsonl': os.path.join(report_dir, "groups.jsonl"),
+        'csv': os.path.join(report_dir, "groups.csv"),
+    }
+    writers = open_report_writers(targets, report_meta(folder_path, threshold, cluster_mode, file_count, image_count))
+    try:
+        for group in duplicate_groups:
+            for writer in writers:
+                writer.write_group(group)
+    finally:
+        paths = [writer.close() for writer in writers]
+    return paths[0]
 
 
 # --- GUI 應用程式 ---
@@ -304,24 +321,84 @@ class DuplicateFinderApp(QMainWindow):
         
         self.slider_threshold = QSlider(Qt.Orientation.Horizontal)
         self.slider_threshold.setMinimum(0)
-        self.slider_threshold.setMaximum(20)
+        self.slider_threshold.setMaximum(MAX_THRESHOLD)
         self.slider_threshold.setValue(3)
         self.slider_threshold.setTickPosition(QSlider.TickPosition.TicksBelow)
         self.slider_threshold.setTickInterval(1)
         self.slider_threshold.valueChanged.connect(self.update_threshold_label)
+        self.slider_threshold.setToolTip("phash 的涵明距離上限，越小越嚴格；勾選「旋轉/翻轉/裁切」時為放寬的有效距離")
         
         self.lbl_threshold_val = QLabel("3")
         self.lbl_threshold_val.setMinimumWidth(30)
         
+        self.chk_cache = QCheckBox("使用快取")
+        self.chk_cache.setChecked(True)
+        self.chk_cache.setToolTip("記住已計算過的圖片雜湊，重複掃描時略過沒有變動的文件")
+
+        lbl_mode = QLabel("分群方式:")
+        self.combo_mode = QComboBox()
+        for mode in CLUSTER_MODES:
+            self.combo_mode.addItem(CLUSTER_MODE_LABELS[mode], mode)
+        self.combo_mode.setToolTip("代表圖片：與各群組的第一張圖片比較 (原本的方式)\n"
+                                   "遞移相連：A 與 B 相似、B 與 C 相似時三者同組\n"
+                                   "完全連結：遞移相連，但群組內任兩張圖片都必須在閥值內")
+        self.combo_mode.currentIndexChanged.connect(self.schedule_regroup)
+
+        lbl_workers = QLabel("平行處理數:")
+        self.spin_workers = QSpinBox()
+        self.spin_workers.setRange(1, os.cpu_count() or 1)
+        self.spin_workers.setValue(1)
+        self.spin_workers.setToolTip("同時解析與計算雜湊的行程數，多核心電腦可調高以加快掃描")
+
+        lbl_read_ahead = QLabel("預讀文件數:")
+        self.spin_read_ahead = QSpinBox()
+        self.spin_read_ahead.setRange(0, 64)
+        self.spin_read_ahead.setValue(0)
+        self.spin_read_ahead.setToolTip("讀檔與解析、雜湊同時進行時預先讀入記憶體的文件數，文件放在網路磁碟時可調高 (0 代表不預讀)")
+
         self.btn_run = QPushButton("開始比對")
         self.btn_run.setStyleSheet("background-color: #2E8B57; color: white; font-weight: bold; padding: 5px;")
         self.btn_run.clicked.connect(self.start_processing)
+
+        self.chk_recursive = QCheckBox("包含子資料夾")
+        self.chk_recursive.setChecked(True)
+        self.chk_recursive.setToolTip("一併掃描子資料夾中的文件 (報告輸出的 report 資料夾除外)")
+
+        self.chk_invariant = QCheckBox("旋轉/翻轉/裁切")
+        self.chk_invariant.setToolTip("一併找出旋轉、鏡像翻轉或輕微裁切過的相同圖片 (雜湊與一般比對不同，第一次會重新計算)\n"
+                                      "此模式的閥值為放寬的有效距離：ahash/dhash 也接近時，phash 距離最多可到 min(2.5 倍閥值, 閥值 + 8)，"
+                                      "例如閥值 5 時為 12、閥值 20 時為 28")
+
+        self.chk_watch = QCheckBox("持續監看")
+        self.chk_watch.setToolTip("掃描後持續監看資料夾，只處理新增、修改或刪除的文件並更新重複群組")
+
+        self.btn_stop = QPushButton("停止")
+        self.btn_stop.setToolTip("取消進行中的掃描 (處理完目前的文件後停止)，或停止監看")
+        self.btn_stop.setEnabled(False)
+        self.btn_stop.clicked.connect(self.stop_task)
+
+        self.btn_export = QPushButton("匯出報告")
+        self.btn_export.setToolTip("以目前的閥值重新產生 HTML 報告")
+        self.btn_export.setEnabled(False)
+        self.btn_export.clicked.connect(self.export_report)
         
         settings_layout.addWidget(lbl_threshold)
         settings_layout.addWidget(self.slider_threshold)
         settings_layout.addWidget(self.lbl_threshold_val)
         settings_layout.addStretch()
+        settings_layout.addWidget(lbl_mode)
+        settings_layout.addWidget(self.combo_mode)
+        settings_layout.addWidget(lbl_workers)
+        settings_layout.addWidget(self.spin_workers)
+        settings_layout.addWidget(lbl_read_ahead)
+        settings_layout.addWidget(self.spin_read_ahead)
+        settings_layout.addWidget(self.chk_cache)
+        settings_layout.addWidget(self.chk_recursive)
+        settings_layout.addWidget(self.chk_invariant)
+        settings_layout.addWidget(self.chk_watch)
         settings_layout.addWidget(self.btn_run)
+        settings_layout.addWidget(self.btn_stop)
+        settings_layout.addWidget(self.btn_export)
         main_layout.addLayout(settings_layout)
 
         # 3. 進度條
@@ -329,17 +406,164 @@ class DuplicateFinderApp(QMainWindow):
         self.progressbar.setValue(0)
         main_layout.addWidget(self.progressbar)
 
-        # 4. 資訊輸出區
-        self.textbox_log = QTextEdit()
+        # 4. 結果與紀錄分頁
+        self.tabs = QTabWidget()
+        results_widget = QWidget()
+        results_layout = QVBoxLayout(results_widget)
+        results_layout.setContentsMargins(0, 0, 0, 0)
+        self.lbl_summary = QLabel("尚未掃描")
+        results_layout.addWidget(self.lbl_summary)
+        # 群組很多時只繪製畫面上看得到的列，縮圖也只在繪製時才於背景解碼
+        self.results_model = DuplicateGroupModel(parent=self)
+        self.tree_results = QTreeView()
+        self.tree_results.setModel(self.results_model)
+        self.tree_results.setUniformRowHeights(True)
+        self.tree_results.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.tree_results.setAlternatingRowColors(True)
+        self.tree_results.header().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.tree_results.setColumnWidth(0, THUMBNAIL_SIZE + 90)
+        self.tree_results.setColumnWidth(1, 180)
+        self.tree_results.setColumnWidth(2, 70)
+        self.tree_results.setColumnWidth(3, 220)
+        results_layout.addWidget(self.tree_results)
+        self.tabs.addTab(results_widget, "結果")
+
+        self.textbox_log = QPlainTextEdit()
         self.textbox_log.setReadOnly(True)
+        self.textbox_log.setMaximumBlockCount(LOG_MAX_LINES)
         self.textbox_log.setStyleSheet("font-family: 'Courier New'; font-size: 13px;")
-        main_layout.addWidget(self.textbox_log)
+        self.tabs.addTab(self.textbox_log, "紀錄")
+        main_layout.addWidget(self.tabs)
+
+        # 5. 效能摘要 (掃描完成後顯示)
+        self.profile_box = QGroupBox("效能摘要")
+        profile_layout = QVBoxLayout(self.profile_box)
+        self.textbox_profile = QPlainTextEdit()
+        self.textbox_profile.setReadOnly(True)
+        self.textbox_profile.setMaximumHeight(180)
+        self.textbox_profile.setStyleSheet("font-family: 'Courier New'; font-size: 12px;")
+        profile_layout.addWidget(self.textbox_profile)
+        self.btn_export_profile = QPushButton("匯出效能資料 (JSON)")
+        self.btn_export_profile.setToolTip("輸出每份文件與各處理階段的時間、記憶體高峰，以及最慢的文件與最大的圖片")
+        self.btn_export_profile.clicked.connect(self.export_profile)
+        profile_layout.addWidget(self.btn_export_profile, alignment=Qt.AlignmentFlag.AlignRight)
+        self.profile_box.setVisible(False)
+        main_layout.addWidget(self.profile_box)
 
         # Thread reference
         self.worker = None
+        # 最近一次掃描的結果 (含鄰接圖)，調整閥值時直接重新分群
+        self.scan_result = None
+        # 背景重建鄰接圖的執行緒，以及重建完成後是否要匯出報告
+        self.graph_worker = None
+        self.export_pending = False
+
+        # 拖動滑桿時稍待片刻再重新分群，避免每一格都重繪
+        self.regroup_timer = QTimer(self)
+        self.regroup_timer.setSingleShot(True)
+        self.regroup_timer.setInterval(150)
+        self.regroup_timer.timeout.connect(self.regroup)
 
     def update_threshold_label(self, value):
         self.lbl_threshold_val.setText(str(value))
+        self.schedule_regroup()
+
+    def schedule_regroup(self):
+        if self.scan_result is not None and self.btn_run.isEnabled():
+            self.regroup_timer.start()
+
+    def store_result(self, result):
+        self.scan_result = result
+        self.btn_export.setEnabled(True)
+        self.textbox_profile.setPlainText("\n".join(result['profile'].summary_lines()))
+        self.profile_box.setVisible(True)
+
+    def export_profile(self):
+        if self.scan_result is None:
+            return
+        default_path = os.path.join(self.scan_result['folder_path'], "report",
+                                    f"profile_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        path, _ = QFileDialog.getSaveFileName(self, "匯出效能資料", default_path, "JSON (*.json)")
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.scan_result['profile'].write_json(path)
+            self.log(f"\n[系統提示] 效能資料已儲存至: \n{path}")
+
+    def show_groups(self, batch):
+        """接收背景執行緒分批送來的重複群組。"""
+        self.results_model.forget_documents(batch['changed'])
+        if batch['reset']:
+            self.results_model.set_results(batch['records'], batch['hashes'], batch['groups'])
+        else:
+            self.results_model.add_groups(batch['groups'])
+        self.update_summary()
+
+    def update_summary(self, note=""):
+        self.lbl_summary.setText(format_summary(self.results_model.group_count()) + note)
+
+    def graph_ready(self, threshold):
+        """
+        鄰接圖是否涵蓋 threshold。掃描時只建立到當時的閥值，閥值調高超過時
+        在背景以已保存的雜湊重建到 MAX_THRESHOLD，完成後由 store_graph() 重新分群，之後調整閥值都不必再重建。
+        """
+        result = self.scan_result
+        if threshold <= result['graph'].max_distance:
+            return True
+        if self.graph_worker is None:
+            # 以視窗為父物件，執行緒物件在執行完畢前不會被回收
+            worker = GraphThread(result['hashes'], MAX_THRESHOLD, result['index_kind'], parent=self)
+            worker.graph_signal.connect(lambda graph, result=result: self.store_graph(result, graph))
+            worker.log_signal.connect(self.log)
+            worker.finished.connect(worker.deleteLater)
+            self.graph_worker = worker
+            worker.start()
+        self.update_summary(f" (正在建立閥值 {threshold} 的鄰接圖...)")
+        return False
+
+    def store_graph(self, result, graph):
+        self.graph_worker = None
+        if result is not self.scan_result:
+            # 重建期間已經重新掃描：捨棄舊結果的鄰接圖，需要時為新的結果重建
+            if self.scan_result is not None and self.btn_run.isEnabled():
+                self.regroup()
+            return
+        if graph is None:
+            self.export_pending = False
+            self.update_summary()
+            return
+        result['graph'] = graph
+        self.regroup()
+        if self.export_pending:
+            self.export_report()
+
+    def regroup(self):
+        """以目前的閥值從鄰接圖重新分群並更新結果，不需要重新掃描。"""
+        if self.scan_result is None:
+            return
+        threshold = self.slider_threshold.value()
+        mode = self.combo_mode.currentData()
+        result = self.scan_result
+        if not self.graph_ready(threshold):
+            return
+        groups = result['graph'].cluster(threshold, mode)
+        self.results_model.set_results(result['all_images'], result['hashes'], groups)
+        self.update_summary(f" (閥值 {threshold}、{CLUSTER_MODE_LABELS[mode]}，沿用上次掃描結果，共 {len(result['all_images'])} 張圖片)")
+
+    def export_report(self):
+        if self.scan_result is None:
+            return
+        threshold = self.slider_threshold.value()
+        mode = self.combo_mode.currentData()
+        result = self.scan_result
+        # 鄰接圖還不涵蓋目前的閥值時，等背景重建完成後再匯出
+        self.export_pending = not self.graph_ready(threshold)
+        if self.export_pending:
+            return
+        groups = result['graph'].cluster(threshold, mode)
+        report_path = write_reports(result['folder_path'], threshold, mode, result['file_count'],
+                                    len(result['all_images']),
+                                    iter_duplicate_groups(groups, result['all_images'], result['hashes']))
+        self.log(f"\n[系統提示] 詳細 HTML 報告已儲存至: \n{report_path}")
 
     def browse_folder(self):
         folder_selected = QFileDialog.getExistingDirectory(self, "選擇目標資料夾")
@@ -347,7 +571,7 @@ class DuplicateFinderApp(QMainWindow):
             self.entry_folder_path.setText(folder_selected)
 
     def log(self, text):
-        self.textbox_log.append(text)
+        self.textbox_log.appendPlainText(text)
         # Scroll to bottom
         scrollbar = self.textbox_log.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
@@ -355,10 +579,21 @@ class DuplicateFinderApp(QMainWindow):
     def update_progress(self, current, total):
         pct = int((current / total) * 100)
         self.progressbar.setValue(pct)
+        # 搜尋還在進行時總數會繼續增加，因此同時顯示已處理與已找到的文件數
+        self.progressbar.setFormat(f"{current} / {total} 份文件 (%p%)")
 
     def task_finished(self):
         self.btn_run.setEnabled(True)
+        self.btn_stop.setEnabled(False)
         self.progressbar.setValue(100)
+        if self.results_model.group_count():
+            self.tabs.setCurrentIndex(0)
+
+    def stop_task(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancel()
+            self.btn_stop.setEnabled(False)
+            self.log("\n正在停止監看..." if self.worker.watch else "\n正在取消掃描...")
 
     def start_processing(self):
         folder_path = self.entry_folder_path.text().strip()
@@ -369,17 +604,35 @@ class DuplicateFinderApp(QMainWindow):
         threshold = self.slider_threshold.value()
         
         self.btn_run.setEnabled(False)
+        self.btn_export.setEnabled(False)
+        self.scan_result = None
+        self.export_pending = False
+        self.profile_box.setVisible(False)
         self.textbox_log.clear()
+        self.results_model.clear()
+        self.lbl_summary.setText("掃描中...")
+        # 掃描時看紀錄，完成後再切回結果
+        self.tabs.setCurrentIndex(1)
         self.progressbar.setValue(0)
+        self.progressbar.setFormat("%p%")
         
         # 啟動背景處理
-        self.worker = WorkerThread(folder_path, threshold)
+        watch = self.chk_watch.isChecked()
+        self.btn_stop.setEnabled(True)
+        self.worker = WorkerThread(folder_path, threshold, self.chk_cache.isChecked(), self.spin_workers.value(),
+                                   self.combo_mode.currentData(), watch, read_ahead=self.spin_read_ahead.value(),
+                                   recursive=self.chk_recursive.isChecked(),
+                                   match='invariant' if self.chk_invariant.isChecked() else DEFAULT_MATCH_MODE)
         self.worker.log_signal.connect(self.log)
         self.worker.progress_signal.connect(self.update_progress)
         self.worker.finished_signal.connect(self.task_finished)
+        self.worker.result_signal.connect(self.store_result)
+        self.worker.groups_signal.connect(self.show_groups)
         self.worker.start()
 
 if __name__ == "__main__":
+    # PyInstaller 打包後的執行檔需要這行，子行程才不會重新開啟視窗
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyle("Fusion") # 給一個看起來乾淨現代的樣式
     window = DuplicateFinderApp()
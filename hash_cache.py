@@ -0,0 +1,171 @@
+"""
+以 SQLite 保存圖片雜湊的本機快取，讓重複掃描時略過沒有變動的文件與圖片。
+
+- documents：以 docx 的絕對路徑、檔案大小與 mtime 為鍵，保存整份文件的圖片紀錄。
+  文件沒有變動時可以完全不開啟壓縮檔。
+- media：以 zip 成員的 CRC32 與解壓縮後大小為鍵，保存單張圖片的雜湊。
+  文件有變動時，只需要解碼 CRC 沒見過的圖片。
+
+兩張表的鍵都包含 variant (雜湊算法名稱)，不同算法算出的雜湊不會互相混用。
+兩張表各自有筆數上限，超過時依最後使用時間淘汰最舊的資料。
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+
+from hash_index import int_to_hex
+
+DEFAULT_MAX_DOCUMENTS = 100_000
+DEFAULT_MAX_MEDIA = 1_000_000
+DEFAULT_VARIANT = 'phash-reduced'
+
+# 結構變更時遞增，開啟舊版快取檔會直接捨棄重建
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    records TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (path, variant)
+);
+CREATE TABLE IF NOT EXISTS media (
+    variant TEXT NOT NULL,
+    crc INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (variant, crc, size)
+);
+CREATE INDEX IF NOT EXISTS documents_last_used ON documents (last_used);
+CREATE INDEX IF NOT EXISTS media_last_used ON media (last_used);
+"""
+
+
+def default_cache_path():
+    """依作業系統回傳使用者快取目錄下的預設快取檔位置。"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'docx_image_compare', 'hash_cache.sqlite')
+
+
+class HashCache:
+    def __init__(self, path=None, max_documents=DEFAULT_MAX_DOCUMENTS, max_media=DEFAULT_MAX_MEDIA,
+                 readonly=False, variant=DEFAULT_VARIANT):
+        """
+        variant 為雜湊算法名稱 (通常是 hasher.name)。
+        readonly=True 供平行處理的子行程查詢使用，不會寫入也不會建立檔案。
+        """
+        self.path = path or default_cache_path()
+        self.max_documents = max_documents
+        self.max_media = max_media
+        self.readonly = readonly
+        self.variant = variant
+
+        if readonly:
+            try:
+                self.conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True)
+                if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    raise sqlite3.DatabaseError("schema version mismatch")
+            except sqlite3.Error:
+                # 快取檔尚未建立或版本不符，視為全部未命中
+                self.conn = None
+        else:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(self.path)
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self.conn.executescript("DROP TABLE IF EXISTS documents; DROP TABLE IF EXISTS media;")
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.conn.executescript(_SCHEMA)
+
+        # 命中的鍵先暫存，關閉時再一次更新 last_used，避免每次查詢都寫入
+        self._touched_documents = set()
+        self._touched_media = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def lookup_document(self, docx_path, size, mtime_ns):
+        key = os.path.abspath(docx_path)
+        row = self.conn.execute(
+            "SELECT records FROM documents WHERE path = ? AND variant = ? AND size = ? AND mtime_ns = ?",
+            (key, self.variant, size, mtime_ns)).fetchone()
+        if row is None:
+            return None
+        self._touched_documents.add(key)
+        records = json.loads(row[0])
+        for rec in records:
+            rec['hash'] = int(rec['hash'], 16)
+        self.hits += len(records)
+        return records
+
+    def store_document(self, docx_path, size, mtime_ns, records):
+        stored = [
+            {'image_name': r['image_name'], 'member': r['member'], 'context': r['context'], 'page': r['page'],
+             'hash': int_to_hex(r['hash'])}
+            for r in records
+        ]
+        self.conn.execute(
+            "INSERT OR REPLACE INTO documents (path, variant, size, mtime_ns, records, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(docx_path), self.variant, size, mtime_ns, json.dumps(stored, ensure_ascii=False), time.time()))
+
+    def lookup_media(self, crc, size):
+        if self.conn is None:
+            self.misses += 1
+            return None
+        row = self.conn.execute("SELECT hash FROM media WHERE variant = ? AND crc = ? AND size = ?",
+                                (self.variant, crc, size)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self._touched_media.add((crc, size))
+        self.hits += 1
+        return int(row[0], 16)
+
+    def store_media(self, crc, size, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO media (variant, crc, size, hash, last_used) VALUES (?, ?, ?, ?, ?)",
+            (self.variant, crc, size, int_to_hex(value), time.time()))
+
+    def evict(self):
+        """刪除超出筆數上限、最久沒被使用的資料。"""
+        for table, limit in (('documents', self.max_documents), ('media', self.max_media)):
+            count = self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            if count > limit:
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY last_used LIMIT ?)",
+                    (count - limit,))
+
+    def flush(self):
+        """更新最後使用時間、淘汰舊資料並寫入磁碟。長時間開著的快取 (例如監看模式) 可定期呼叫。"""
+        if self.conn is None or self.readonly:
+            return
+        now = time.time()
+        self.conn.executemany("UPDATE documents SET last_used = ? WHERE path = ? AND variant = ?",
+                              [(now, key, self.variant) for key in self._touched_documents])
+        self.conn.executemany("UPDATE media SET last_used = ? WHERE variant = ? AND crc = ? AND size = ?",
+                              [(now, self.variant, crc, size) for crc, size in self._touched_media])
+        self._touched_documents = set()
+        self._touched_media = set()
+        self.evict()
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.flush()
+        self.conn.close()
+        self.conn = None
@@ -0,0 +1,452 @@
+"""
+以 64-bit 感知雜湊 (phash) 為鍵的近鄰搜尋索引。
+
+所有索引都提供相同的介面：
+    add(value, item)      將一個雜湊值 (int) 與其附帶資料加入索引
+    query(value, radius)  回傳所有涵明距離 <= radius 的 (distance, item)
+
+可透過 create_index() 依名稱建立，讓 CLI 與 GUI 可以自由切換實作。
+
+另外提供 PackedHashes：以連續的 uint64 NumPy 陣列保存整批雜湊，
+搭配 hamming_distances() 一次算出多個查詢對整個語料庫的距離；
+CascadeHashes 則另外保存 ahash/dhash 兩個預篩雜湊，供旋轉/翻轉/裁切比對模式使用。
+"""
+import math
+import itertools
+
+import numpy as np
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+# 串接比對 (cascade) 的參數：phash 距離超過閥值、但在放寬的範圍內時，
+# 只要 ahash 與 dhash 的距離都夠小，就把它視為同一張圖片 (見 cascade_distances)
+CASCADE_AHASH_MAX = 8
+CASCADE_DHASH_MAX = 12
+CASCADE_SLACK = 8
+
+# mih_plan() 的成本估計 (以確認一個候選配對的成本為單位)：
+# 每個段的每次探測對每張圖片的固定成本 (排序後二分搜尋等)，以及全部比較時每個配對的成本
+MIH_PROBE_COST = 6
+FULL_SCAN_PAIR_COST = 1 / 16
+
+
+def hash_to_int(img_hash):
+    """把 imagehash.ImageHash 轉為 64-bit 整數 (與 str(hash) 的十六進位表示一致)。"""
+    return int(str(img_hash), 16)
+
+
+def int_to_hex(value, bits=HASH_BITS):
+    """把整數雜湊轉回與 str(ImageHash) 相同格式的十六進位字串。"""
+    return f"{value:0{bits // 4}x}"
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def pack_hashes(values):
+    """把整數雜湊序列轉為連續的 uint64 陣列。"""
+    return np.asarray(values, dtype=np.uint64)
+
+
+def hamming_distances(queries, corpus, chunk_size=256):
+    """
+    以 XOR + popcount 計算 queries 對 corpus 中每一個雜湊的涵明距離。
+
+    queries 可以是單一雜湊或一串雜湊，corpus 為 uint64 陣列。
+    單一查詢回傳形狀 (N,) 的陣列，多個查詢回傳 (Q, N)。
+    查詢會分批處理，避免一次產生過大的中間矩陣。
+    """
+    corpus = np.asarray(corpus, dtype=np.uint64)
+    q = np.asarray(queries, dtype=np.uint64)
+    if q.ndim == 0:
+        return np.bitwise_count(corpus ^ q)
+
+    out = np.empty((len(q), len(corpus)), dtype=np.uint8)
+    for start in range(0, len(q), chunk_size):
+        block = q[start:start + chunk_size]
+        out[start:start + len(block)] = np.bitwise_count(block[:, None] ^ corpus[None, :])
+    return out
+
+
+class PackedHashes:
+    """以連續的 uint64 陣列保存雜湊，容量不足時倍增，取代一堆 ImageHash 物件。"""
+
+    def __init__(self, values=(), capacity=1024):
+        values = pack_hashes(values)
+        self._buf = np.empty(max(capacity, len(values)), dtype=np.uint64)
+        self._buf[:len(values)] = values
+        self._len = len(values)
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if not -self._len <= i < self._len:
+            raise IndexError(i)
+        return int(self._buf[i % self._len])
+
+    @property
+    def array(self):
+        """目前內容的唯讀檢視 (不複製)。"""
+        view = self._buf[:self._len]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def nbytes(self):
+        return self._buf.nbytes
+
+    def append(self, value):
+        if self._len == len(self._buf):
+            self._grow(self._len + 1)
+        self._buf[self._len] = value
+        self._len += 1
+
+    def extend(self, values):
+        values = pack_hashes(values)
+        if self._len + len(values) > len(self._buf):
+            self._grow(self._len + len(values))
+        self._buf[self._len:self._len + len(values)] = values
+        self._len += len(values)
+
+    def tolist(self):
+        return self._buf[:self._len].tolist()
+
+    def take(self, indices):
+        """依 indices 的順序取出部分雜湊，回傳新的同類型容器。"""
+        return PackedHashes(self.array[np.asarray(indices, dtype=np.intp)])
+
+    def distances(self, queries):
+        return hamming_distances(queries, self._buf[:self._len])
+
+    def _grow(self, needed):
+        new_buf = np.empty(max(needed, len(self._buf) * 2), dtype=np.uint64)
+        new_buf[:self._len] = self._buf[:self._len]
+        self._buf = new_buf
+
+
+def primary_hash(value):
+    """串接雜湊 (phash | ahash << 64 | dhash << 128) 中的 phash 部分；一般的 64-bit 雜湊原樣回傳。"""
+    return value & HASH_MASK
+
+
+def cascade_radius(max_distance):
+    """閥值 max_distance 下，串接比對需要以 phash 查詢的候選距離上限。"""
+    return min(max_distance * 5 // 2, max_distance + CASCADE_SLACK, HASH_BITS)
+
+
+def cascade_distances(dist, ahash_dist, dhash_dist):
+    """
+    把 phash 距離換成串接比對的有效距離：ahash 與 dhash 都確認相似的配對，
+    距離縮小為 max(ceil(2d/5), d - CASCADE_SLACK)，其餘維持原本的 phash 距離。
+    有效距離 <= T 等同於「phash <= T」或「ahash、dhash 確認且 phash <= cascade_radius(T)」，
+    閥值 0 仍然只有完全相同的雜湊才會配對。
+    """
+    dist = np.asarray(dist, dtype=np.int64)
+    confirmed = (np.asarray(ahash_dist) <= CASCADE_AHASH_MAX) & (np.asarray(dhash_dist) <= CASCADE_DHASH_MAX)
+    relaxed = np.maximum((2 * dist + 4) // 5, dist - CASCADE_SLACK)
+    return np.where(confirmed, relaxed, dist).astype(np.uint8)
+
+
+def cascade_hamming(a, b):
+    """兩個串接雜湊 (整數) 之間的有效距離。"""
+    x = a ^ b
+    return int(cascade_distances((x & HASH_MASK).bit_count(), ((x >> HASH_BITS) & HASH_MASK).bit_count(),
+                                 (x >> 2 * HASH_BITS).bit_count()))
+
+
+class CascadeHashes(PackedHashes):
+    """
+    保存串接雜湊 (phash | ahash << 64 | dhash << 128)：phash 放在 PackedHashes 本身的緩衝區，
+    索引、tolist() 與報告顯示都只看到 phash；ahash 與 dhash 另外保存，由 prefilter 取得，
+    分群時用來確認 phash 距離稍大的候選配對。
+    """
+
+    def __init__(self, values=(), capacity=1024):
+        values = [int(v) for v in values]
+        super().__init__([v & HASH_MASK for v in values], capacity)
+        self.ahash = PackedHashes([(v >> HASH_BITS) & HASH_MASK for v in values], capacity)
+        self.dhash = PackedHashes([(v >> 2 * HASH_BITS) & HASH_MASK for v in values], capacity)
+
+    @property
+    def nbytes(self):
+        return super().nbytes + self.ahash.nbytes + self.dhash.nbytes
+
+    @property
+    def prefilter(self):
+        """(ahash 陣列, dhash 陣列)，索引與 phash 對應。"""
+        return self.ahash.array, self.dhash.array
+
+    def full(self, i):
+        """第 i 張圖片完整的串接雜湊。"""
+        return self[i] | self.ahash[i] << HASH_BITS | self.dhash[i] << 2 * HASH_BITS
+
+    def append(self, value):
+        super().append(value & HASH_MASK)
+        self.ahash.append((value >> HASH_BITS) & HASH_MASK)
+        self.dhash.append((value >> 2 * HASH_BITS) & HASH_MASK)
+
+    def extend(self, values):
+        values = [int(v) for v in values]
+        super().extend([v & HASH_MASK for v in values])
+        self.ahash.extend([(v >> HASH_BITS) & HASH_MASK for v in values])
+        self.dhash.extend([(v >> 2 * HASH_BITS) & HASH_MASK for v in values])
+
+    def take(self, indices):
+        return CascadeHashes([self.full(i) for i in indices])
+
+
+class LinearIndex:
+    """逐一比較所有雜湊值，等同於原本的線性掃描，作為正確性與效能的基準。"""
+
+    def __init__(self, max_distance=None):
+        self.values = []
+        self.items = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value, item):
+        self.values.append(value)
+        self.items.append(item)
+
+    def query(self, value, radius):
+        results = []
+        for v, item in zip(self.values, self.items):
+            d = (value ^ v).bit_count()
+            if d <= radius:
+                results.append((d, item))
+        return results
+
+
+class BKTree:
+    """
+    Burkhard-Keller 樹：利用涵明距離的三角不等式，
+    查詢時只需要走訪距離落在 [d - radius, d + radius] 的子樹。
+    """
+
+    def __init__(self, max_distance=None):
+        # 節點格式: [value, items, children]，children 以距離為鍵
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            d = (value ^ node[0]).bit_count()
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def query(self, value, radius):
+        results = []
+        if self.root is None:
+            return results
+
+        stack = [self.root]
+        while stack:
+            node_value, items, children = stack.pop()
+            d = (value ^ node_value).bit_count()
+            if d <= radius:
+                for item in items:
+                    results.append((d, item))
+            low, high = d - radius, d + radius
+            for child_d, child in children.items():
+                if low <= child_d <= high:
+                    stack.append(child)
+        return results
+
+
+def split_segments(max_distance):
+    """
+    把 64 bits 切成 max_distance + 1 段，回傳每一段的 (位移, 遮罩)。
+    兩個距離 <= max_distance 的雜湊至少會有一段完全相同 (鴿籠原理)。
+    """
+    segments = min(max_distance + 1, HASH_BITS)
+    base, extra = divmod(HASH_BITS, segments)
+    result = []
+    shift = 0
+    for i in range(segments):
+        width = base + (1 if i < extra else 0)
+        result.append((shift, (1 << width) - 1))
+        shift += width
+    return result
+
+
+def _probe_masks(width, probe):
+    """寬 width bits 的段內所有翻轉不超過 probe 個 bit 的 XOR 遮罩 (包含 0)。"""
+    return [sum(1 << b for b in bits) for k in range(probe + 1) for bits in itertools.combinations(range(width), k)]
+
+
+def mih_plan(max_distance, count):
+    """
+    為 count 個雜湊找出所有距離 <= max_distance 的配對 (mih_pairs) 挑選分段，回傳 (段數, 每段探測距離)；
+    段太窄無法有效篩選、全部比較反而比較快時回傳 None。
+
+    把 64 bits 切成 m 段時，距離 <= max_distance 的配對至少有一段的距離 <= max_distance // m (鴿籠原理)。
+    段數越少，每段的鍵越長、落在同一個桶子的候選越少，但每段需要探測的鍵也越多；
+    依雜湊均勻分布估計每種分段的成本，取最小者。
+    """
+    best = None
+    for m in range(1, min(max_distance + 1, HASH_BITS) + 1):
+        probe = max_distance // m
+        cost = 0
+        for _, mask in split_segments(m - 1):
+            width = mask.bit_length()
+            probes = sum(math.comb(width, k) for k in range(probe + 1))
+            cost += probes * (MIH_PROBE_COST + count / 2 ** width)
+        if best is None or cost < best[0]:
+            best = (cost, m, probe)
+    if best[0] > count / 2 * FULL_SCAN_PAIR_COST:
+        return None
+    return best[1], best[2]
+
+
+def _row_blocks(counts, max_elements):
+    """依每列的候選數把列切成連續的區塊，每塊的候選總數不超過 max_elements (單列超過時自成一塊)。"""
+    total = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        base = int(total[start - 1]) if start else 0
+        stop = max(start + 1, int(np.searchsorted(total, base + max_elements, 'right')))
+        yield start, stop
+        start = stop
+
+
+def mih_pairs(values, max_distance, plan, max_block_elements=1 << 22):
+    """
+    以多重索引雜湊一次找出 values 中所有距離 <= max_distance 的配對，回傳 (earlier, later, dist) 三個陣列 (earlier < later)。
+
+    plan 為 mih_plan() 回傳的 (段數, 每段探測距離)。每段依鍵排序後，以二分搜尋找出鍵相同
+    或只差不超過探測距離個 bit 的候選，再以 XOR + popcount 確認距離，全程向量化。
+    同一配對只保留在第一個符合探測距離的段中，不需要另外去除重複。
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    segments, probe = plan
+    segments = split_segments(segments - 1)
+    keys = [(values >> np.uint64(shift)) & np.uint64(mask) for shift, mask in segments]
+    earlier_parts, later_parts, dist_parts = [], [], []
+    for s, ((_, mask), key) in enumerate(zip(segments, keys)):
+        order = np.argsort(key, kind='stable')
+        sorted_keys = key[order]
+        for flip in _probe_masks(mask.bit_length(), probe):
+            target = key ^ np.uint64(flip)
+            lo = np.searchsorted(sorted_keys, target, 'left')
+            counts = np.searchsorted(sorted_keys, target, 'right') - lo
+            for start, stop in _row_blocks(counts, max_block_elements):
+                c = counts[start:stop]
+                total = int(c.sum())
+                if not total:
+                    continue
+                rows = np.repeat(np.arange(start, stop), c)
+                cols = order[np.repeat(lo[start:stop] - (np.cumsum(c) - c), c) + np.arange(total)]
+                keep = rows < cols
+                rows, cols = rows[keep], cols[keep]
+                dist = np.bitwise_count(values[rows] ^ values[cols])
+                keep = dist <= max_distance
+                rows, cols, dist = rows[keep], cols[keep], dist[keep]
+                for earlier_key in keys[:s]:
+                    keep = np.bitwise_count(earlier_key[rows] ^ earlier_key[cols]) > probe
+                    rows, cols, dist = rows[keep], cols[keep], dist[keep]
+                earlier_parts.append(rows)
+                later_parts.append(cols)
+                dist_parts.append(dist)
+
+    def concat(parts, dtype):
+        return np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+
+    return concat(earlier_parts, np.int32), concat(later_parts, np.int32), concat(dist_parts, np.uint8)
+
+
+class MultiIndexHash:
+    """
+    鴿籠原理的多重索引雜湊 (multi-index hashing)：
+    把 64 bits 切成 max_distance + 1 段，兩個距離 <= max_distance 的雜湊
+    至少會有一段完全相同，因此只需要比對落在同一個桶子裡的候選者。
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self.segments = split_segments(max_distance)
+        self.tables = [{} for _ in self.segments]
+        self.values = []
+        self.items = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value, item):
+        idx = len(self.values)
+        self.values.append(value)
+        self.items.append(item)
+        for table, (shift, mask) in zip(self.tables, self.segments):
+            table.setdefault((value >> shift) & mask, []).append(idx)
+
+    def query(self, value, radius):
+        if radius > self.max_distance:
+            raise ValueError(f"查詢距離 {radius} 超過索引建立時的上限 {self.max_distance}")
+
+        results = []
+        seen = set()
+        for table, (shift, mask) in zip(self.tables, self.segments):
+            for idx in table.get((value >> shift) & mask, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                d = (value ^ self.values[idx]).bit_count()
+                if d <= radius:
+                    results.append((d, self.items[idx]))
+        return results
+
+
+class PackedIndex:
+    """把雜湊放在 PackedHashes 中，以向量化的 XOR + popcount 一次比較全部。"""
+
+    def __init__(self, max_distance=None):
+        self.hashes = PackedHashes()
+        self.items = []
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, value, item):
+        self.hashes.append(value)
+        self.items.append(item)
+
+    def query(self, value, radius):
+        d = self.hashes.distances(value)
+        return [(int(d[i]), self.items[i]) for i in np.flatnonzero(d <= radius)]
+
+
+INDEX_TYPES = {
+    'mih': MultiIndexHash,
+    'bktree': BKTree,
+    'numpy': PackedIndex,
+    'linear': LinearIndex,
+}
+
+DEFAULT_INDEX = 'mih'
+
+
+def create_index(kind, max_distance):
+    """依名稱建立索引，max_distance 為之後查詢會用到的最大距離。"""
+    try:
+        cls = INDEX_TYPES[kind]
+    except KeyError:
+        raise ValueError(f"未知的索引類型: {kind} (可用: {', '.join(INDEX_TYPES)})")
+    return cls(max_distance)
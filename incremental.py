@@ -0,0 +1,238 @@
+"""
+監看模式：把資料夾中所有 docx 的圖片雜湊保留在記憶體中，定期比對資料夾內容，
+只重新處理新增或修改過的文件，並就地更新受影響的重複群組，不必重新分群整個資料夾。
+
+群組採遞移相連 (與 --cluster-mode single 相同)：這種分群與處理順序無關，
+因此逐步更新後的結果與重新完整掃描一模一樣。
+搭配 HashCache 使用時雜湊也會保存在磁碟上，重新啟動監看時可以快速重建。
+"""
+import os
+
+from docx_scanner import scan_files, DEFAULT_HASHER
+from hash_index import MultiIndexHash, PackedHashes, PackedIndex, primary_hash, cascade_radius, cascade_hamming
+from discovery import DocumentWalker, document_order
+
+
+def snapshot_folder(folder_path, discovery=None):
+    """
+    回傳資料夾中每個 docx 的 {路徑: (檔案大小, mtime_ns)}。
+    discovery 為 DocumentWalker 的參數 (是否包含子資料夾、篩選條件等)。
+    """
+    walker = DocumentWalker(folder_path, **(discovery or {}))
+    return {path: (stat.st_size, stat.st_mtime_ns) for path, stat in walker.iter_entries()}
+
+
+class IncrementalIndex:
+    """
+    可增減文件的雜湊索引與遞移相連群組。
+
+    每張圖片佔用一個 slot，records 與 hashes 以 slot 為索引，移除後 records 對應位置為 None。
+    slot 之間距離 <= threshold 的配對保存在 neighbors 中：
+    - 新增圖片時只查詢近鄰索引並合併相鄰的群組；
+    - 移除圖片時只在受影響的群組內沿著 neighbors 重新找出連通分量。
+
+    hashes 為空的 CascadeHashes (旋轉/翻轉/裁切比對模式) 時，近鄰索引以放寬的距離查詢候選，
+    再以 cascade_hamming() 的有效距離確認，與 clustering.NeighborGraph 的判斷相同。
+
+    root 為文件路徑的基準資料夾，群組內與群組間依 discovery.document_order() 排序，與完整掃描的走訪順序一致。
+    """
+
+    def __init__(self, threshold, hashes=None, root=os.curdir):
+        self.threshold = threshold
+        self.root = root
+        self.records = []
+        self.hashes = hashes if hashes is not None else PackedHashes()
+        self._cascade = hasattr(self.hashes, 'prefilter')
+        self._radius = cascade_radius(threshold) if self._cascade else threshold
+        self.neighbors = []
+        self.group_of = []
+        self.groups = {}
+        self.documents = {}
+        # slot 的排序鍵 (document_order(文件路徑), 文件內順序)，讓輸出順序與完整掃描一致
+        self._order = []
+        self._index = self._new_index()
+        self._next_group = 0
+        self._removed = 0
+        # 自上次 pop_changed_groups() 以來有變動的群組
+        self._changed = set()
+
+    def __len__(self):
+        return len(self.records) - self._removed
+
+    def add_document(self, docx_path, records):
+        """加入一份文件的圖片紀錄 (含 hash)，回傳新配置的 slot。"""
+        slots = []
+        doc_key = document_order(docx_path, self.root)
+        for position, rec in enumerate(records):
+            rec = dict(rec)
+            value = rec.pop('hash')
+            slot = len(self.records)
+            self.records.append(rec)
+            self.hashes.append(value)
+            self._order.append((doc_key, position))
+
+            key = primary_hash(value)
+            neighbors = {j for _, j in self._index.query(key, self._radius) if self.records[j] is not None}
+            if self._cascade:
+                neighbors = {j for j in neighbors if cascade_hamming(value, self.hashes.full(j)) <= self.threshold}
+            self.neighbors.append(neighbors)
+            for j in neighbors:
+                self.neighbors[j].add(slot)
+            self._index.add(key, slot)
+
+            # 與所有相鄰的群組合併，小群組併入大群組
+            group_ids = {self.group_of[j] for j in neighbors}
+            if group_ids:
+                target = max(group_ids, key=lambda g: len(self.groups[g]))
+                members = self.groups[target]
+                for gid in group_ids - {target}:
+                    for member in self.groups.pop(gid):
+                        self.group_of[member] = target
+                        members.add(member)
+                    self._changed.discard(gid)
+            else:
+                target = self._new_group()
+                members = self.groups[target]
+            members.add(slot)
+            self.group_of.append(target)
+            self._changed.add(target)
+            slots.append(slot)
+
+        self.documents[docx_path] = slots
+        return slots
+
+    def remove_document(self, docx_path):
+        """移除一份文件的所有圖片，並重新切分受影響的群組。"""
+        slots = self.documents.pop(docx_path, [])
+        affected = set()
+        for slot in slots:
+            for j in self.neighbors[slot]:
+                self.neighbors[j].discard(slot)
+            self.neighbors[slot] = set()
+            gid = self.group_of[slot]
+            self.groups[gid].discard(slot)
+            affected.add(gid)
+            self.group_of[slot] = -1
+            self.records[slot] = None
+        self._removed += len(slots)
+
+        for gid in affected:
+            self._split(gid)
+
+        # 已移除的 slot 仍留在近鄰索引中 (查詢時略過)，累積過多時壓縮 slot 並重建索引
+        if self._removed > len(self):
+            self._compact()
+        return len(slots)
+
+    def _new_group(self):
+        gid = self._next_group
+        self._next_group += 1
+        self.groups[gid] = set()
+        return gid
+
+    def _split(self, gid):
+        """群組有成員被移除後，沿著 neighbors 重新找出剩下成員的連通分量。"""
+        remaining = self.groups.pop(gid)
+        self._changed.discard(gid)
+        while remaining:
+            start = remaining.pop()
+            component = {start}
+            stack = [start]
+            while stack:
+                for j in self.neighbors[stack.pop()]:
+                    if j in remaining:
+                        remaining.discard(j)
+                        component.add(j)
+                        stack.append(j)
+            new_gid = self._new_group()
+            self.groups[new_gid] = component
+            for member in component:
+                self.group_of[member] = new_gid
+            self._changed.add(new_gid)
+
+    def _new_index(self):
+        if self._cascade:
+            # 放寬後的距離下 MIH 每段只剩幾個 bit，逐張查詢時幾乎每張圖片都是候選，
+            # 以向量化的 XOR + popcount 比較全部較快 (整批分群則由 mih_plan 決定)
+            return PackedIndex()
+        return MultiIndexHash(self._radius)
+
+    def _compact(self):
+        """
+        丟棄已移除的 slot，把剩下的 slot 依原順序重新編號後重建近鄰索引。
+        壓縮後先前取得的 slot 編號全部失效，呼叫端應在每次更新後重新讀取群組。
+        """
+        live = [slot for slot, rec in enumerate(self.records) if rec is not None]
+        new_slot = {old: new for new, old in enumerate(live)}
+        self.records = [self.records[old] for old in live]
+        self.hashes = self.hashes.take(live)
+        self.neighbors = [{new_slot[j] for j in self.neighbors[old]} for old in live]
+        self.group_of = [self.group_of[old] for old in live]
+        self._order = [self._order[old] for old in live]
+        self.groups = {gid: {new_slot[s] for s in members} for gid, members in self.groups.items()}
+        self.documents = {path: [new_slot[s] for s in slots] for path, slots in self.documents.items()}
+        self._removed = 0
+
+        self._index = self._new_index()
+        for slot in range(len(self.records)):
+            self._index.add(self.hashes[slot], slot)
+
+    def _sorted(self, members):
+        return sorted(members, key=self._order.__getitem__)
+
+    def duplicate_groups(self):
+        """所有超過一張圖片的群組，排序方式與完整掃描的分群結果相同。"""
+        groups = [self._sorted(members) for members in self.groups.values() if len(members) > 1]
+        return sorted(groups, key=lambda g: self._order[g[0]])
+
+    def pop_changed_groups(self):
+        """回傳並清除自上次呼叫以來有變動、且目前超過一張圖片的群組。"""
+        changed = [self._sorted(self.groups[gid]) for gid in self._changed
+                   if gid in self.groups and len(self.groups[gid]) > 1]
+        self._changed = set()
+        return sorted(changed, key=lambda g: self._order[g[0]])
+
+
+class FolderWatcher:
+    """定期比對資料夾內容，把新增、修改、刪除的文件同步到 IncrementalIndex。"""
+
+    def __init__(self, folder_path, threshold, workers=1, cache=None, hasher=DEFAULT_HASHER, discovery=None):
+        self.folder_path = folder_path
+        self.discovery = discovery
+        self.workers = workers
+        self.cache = cache
+        self.hasher = hasher
+        self.index = IncrementalIndex(threshold, getattr(hasher, 'new_store', PackedHashes)(), root=folder_path)
+        self.snapshot = {}
+
+    def poll(self, on_document=None, cancel=None):
+        """
+        檢查一次資料夾並處理差異，回傳 {'added', 'modified', 'removed', 'messages'}；
+        沒有任何變動時回傳 None。
+        on_document(path, done, total) 會在每份文件處理完後呼叫，可用來更新進度。
+        cancel (scan_engine.CancelToken) 被取消時在文件之間丟出 ScanCancelled，索引只更新到一半，應停止監看。
+        """
+        current = snapshot_folder(self.folder_path, self.discovery)
+        added = sorted(p for p in current if p not in self.snapshot)
+        removed = sorted(p for p in self.snapshot if p not in current)
+        modified = sorted(p for p in current if p in self.snapshot and current[p] != self.snapshot[p])
+        if not (added or removed or modified):
+            return None
+
+        for path in removed + modified:
+            self.index.remove_document(path)
+
+        changed = added + modified
+        messages = []
+        for done, (path, records, msgs) in enumerate(scan_files(changed, self.workers, self.cache, self.hasher), 1):
+            self.index.add_document(path, records)
+            messages.extend(msgs)
+            if on_document is not None:
+                on_document(path, done, len(changed))
+            if cancel is not None:
+                cancel.check()
+
+        if self.cache is not None:
+            self.cache.flush()
+        self.snapshot = current
+        return {'added': added, 'modified': modified, 'removed': removed, 'messages': messages}
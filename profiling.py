@@ -0,0 +1,276 @@
+"""
+效能分析：記錄每份文件在各處理階段 (讀取 zip、解析 XML、解碼圖片、計算 phash…) 的實際時間、
+CPU 時間與讀取量，以及整次執行的掃描、分群、輸出報告與記憶體高峰，
+並找出最慢的文件與最大的圖片。CLI 的 --profile 以 JSON 輸出，GUI 顯示文字摘要。
+"""
+import io
+import os
+import sys
+import json
+import time
+import heapq
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from PIL import Image
+
+try:
+    import resource
+except ImportError:
+    # Windows 沒有 resource 模組，記憶體高峰記為 None
+    resource = None
+
+# 每份文件的處理階段 (平行處理時各文件的時間加總會超過實際經過的時間)
+DOCUMENT_STAGES = (
+    ('cache', '查詢快取'),
+    ('read', '讀取檔案'),
+    ('zip', '讀取 zip'),
+    ('xml', '解析 XML'),
+    ('decode', '解碼圖片'),
+    ('phash', '計算 phash'),
+)
+# 整次執行的階段
+RUN_STAGES = (
+    ('scan', '掃描文件'),
+    ('grouping', '分群'),
+    ('report', '輸出報告'),
+)
+OUTLIER_COUNT = 10
+
+
+def peak_rss(children=False):
+    """
+    目前行程的記憶體高峰 (bytes)；children=True 時為已結束的子行程中最大的一個。
+    不支援的平台回傳 None。
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux 的 ru_maxrss 單位是 KiB，macOS 是 bytes
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+def profile_stage(profile, name):
+    """profile 為 None 時不記錄，讓呼叫端不必判斷是否開啟效能分析。"""
+    return profile.stage(name) if profile is not None else nullcontext()
+
+
+def format_bytes(size):
+    if size is None:
+        return "未知"
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class DocumentTimer:
+    """
+    累計單一文件在各階段的實際時間與 CPU 時間 (所在執行緒的 CPU 時間，平行處理時互不干擾)。
+    images=True 時另外記錄每張需要解碼的圖片大小、尺寸與解碼時間，供找出最大、最慢的圖片。
+    結果以 as_dict() 轉為可序列化的 dict，子行程處理的文件也能把計時傳回主行程。
+    """
+
+    def __init__(self, images=False):
+        self.wall = {}
+        self.cpu = {}
+        self.bytes_read = 0
+        self.image_count = 0
+        self.cached = False
+        self.images = [] if images else None
+        # 最近一次 stage() 的實際時間
+        self.last = 0.0
+        self._start = (time.perf_counter(), time.thread_time())
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.last = time.perf_counter() - wall
+            self.add(name, self.last, time.thread_time() - cpu)
+
+    def add(self, name, wall, cpu=0.0):
+        self.wall[name] = self.wall.get(name, 0.0) + wall
+        self.cpu[name] = self.cpu.get(name, 0.0) + cpu
+
+    def image(self, member, img_bytes, decode_seconds):
+        if self.images is None:
+            return
+        try:
+            # 只讀取檔頭取得尺寸，不會解碼像素
+            width, height = Image.open(io.BytesIO(img_bytes)).size
+        except Exception:
+            width = height = None
+        self.images.append({'member': member, 'bytes': len(img_bytes), 'width': width, 'height': height,
+                            'decode': decode_seconds})
+
+    def as_dict(self):
+        return {
+            'wall': time.perf_counter() - self._start[0],
+            'cpu': time.thread_time() - self._start[1],
+            'bytes_read': self.bytes_read,
+            'images': self.image_count,
+            'cached': self.cached,
+            'peak_rss': peak_rss(),
+            'stages': {name: {'wall': self.wall[name], 'cpu': self.cpu[name]} for name in self.wall},
+            'image_details': self.images or [],
+        }
+
+
+def add_stage(timings, name, wall, cpu=0.0):
+    """把在其他地方量測的階段 (例如管線的讀檔) 加入 DocumentTimer.as_dict() 的結果。"""
+    stage = timings['stages'].setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+    stage['wall'] += wall
+    stage['cpu'] += cpu
+    timings['wall'] += wall
+    timings['cpu'] += cpu
+
+
+class ScanProfile:
+    """
+    整次執行的效能資料：各文件的計時、各階段加總、執行階段 (掃描、分群、輸出報告) 與記憶體高峰。
+    只保留最大與解碼最慢的 OUTLIER_COUNT 張圖片，不會因為圖片多而佔用大量記憶體。
+    """
+
+    def __init__(self, outliers=OUTLIER_COUNT):
+        self.created = datetime.now().isoformat(timespec='seconds')
+        self.outliers = outliers
+        self.documents = []
+        self.run_stages = {}
+        self.bytes_read = 0
+        self.image_count = 0
+        self._largest = []
+        self._slowest_images = []
+        self._seq = 0
+
+    def add_document(self, docx_path, timings, size=None):
+        """加入一份文件的計時 (DocumentTimer.as_dict() 的結果)，size 為檔案大小。"""
+        timings = dict(timings)
+        details = timings.pop('image_details', [])
+        timings['path'] = docx_path
+        timings['filename'] = os.path.basename(docx_path)
+        timings['size'] = size
+        self.documents.append(timings)
+        self.bytes_read += timings['bytes_read']
+        self.image_count += timings['images']
+
+        for info in details:
+            info = dict(info, path=docx_path, filename=timings['filename'])
+            pixels = (info['width'] or 0) * (info['height'] or 0)
+            self._seq += 1
+            self._push(self._largest, (pixels, info['bytes'], self._seq, info))
+            self._push(self._slowest_images, (info['decode'], self._seq, info))
+
+    def _push(self, heap, item):
+        if len(heap) < self.outliers:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
+
+    @contextmanager
+    def stage(self, name):
+        """量測整次執行的階段，同名的階段會累加 (例如多個閥值各自分群)。"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stage = self.run_stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'peak_rss': None})
+            stage['wall'] += time.perf_counter() - wall
+            stage['cpu'] += time.process_time() - cpu
+            stage['peak_rss'] = peak_rss()
+
+    def document_stages(self):
+        totals = {}
+        for doc in self.documents:
+            for name, stage in doc['stages'].items():
+                total = totals.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'documents': 0})
+                total['wall'] += stage['wall']
+                total['cpu'] += stage['cpu']
+                total['documents'] += 1
+        return totals
+
+    def peak_rss(self):
+        """主行程、子行程與各文件處理時記錄到的記憶體高峰中最大的一個。"""
+        values = [peak_rss(), peak_rss(children=True)] + [doc['peak_rss'] for doc in self.documents]
+        values = [v for v in values if v is not None]
+        return max(values) if values else None
+
+    def slowest_documents(self):
+        return sorted(self.documents, key=lambda doc: doc['wall'], reverse=True)[:self.outliers]
+
+    def largest_images(self):
+        return [item[-1] for item in sorted(self._largest, reverse=True)]
+
+    def slowest_images(self):
+        return [item[-1] for item in sorted(self._slowest_images, reverse=True)]
+
+    def throughput(self):
+        scan = self.run_stages.get('scan', {}).get('wall') or sum(doc['wall'] for doc in self.documents)
+        if not scan:
+            return {'images_per_second': 0.0, 'documents_per_second': 0.0, 'bytes_per_second': 0.0}
+        return {
+            'images_per_second': self.image_count / scan,
+            'documents_per_second': len(self.documents) / scan,
+            'bytes_per_second': self.bytes_read / scan,
+        }
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'documents_count': len(self.documents),
+            'images_count': self.image_count,
+            'bytes_read': self.bytes_read,
+            'documents_size': sum(doc['size'] or 0 for doc in self.documents),
+            'peak_rss': self.peak_rss(),
+            'throughput': self.throughput(),
+            'run_stages': self.run_stages,
+            'document_stages': self.document_stages(),
+            'outliers': {
+                'slowest_documents': [doc['path'] for doc in self.slowest_documents()],
+                'largest_images': self.largest_images(),
+                'slowest_images': self.slowest_images(),
+            },
+            'documents': self.documents,
+        }
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
+
+    def summary_lines(self):
+        total_size = sum(doc['size'] or 0 for doc in self.documents)
+        lines = [f"效能分析：{len(self.documents)} 份文件 ({format_bytes(total_size)})、{self.image_count} 張圖片，"
+                 f"從 zip 讀出 {format_bytes(self.bytes_read)} 圖片資料，記憶體高峰 {format_bytes(self.peak_rss())}"]
+        for name, label in RUN_STAGES:
+            stage = self.run_stages.get(name)
+            if stage is not None:
+                lines.append(f"  {label}: {stage['wall']:.2f} 秒 (CPU {stage['cpu']:.2f} 秒)")
+        throughput = self.throughput()
+        lines.append(f"  處理速度: 每秒 {throughput['images_per_second']:.1f} 張圖片、"
+                     f"{throughput['documents_per_second']:.1f} 份文件")
+
+        stages = self.document_stages()
+        if stages:
+            lines.append("各文件的階段時間加總 (平行處理時會超過實際經過時間):")
+            for name, label in DOCUMENT_STAGES:
+                stage = stages.get(name)
+                if stage is not None:
+                    lines.append(f"  {label}: {stage['wall']:.2f} 秒 (CPU {stage['cpu']:.2f} 秒)")
+
+        slowest = [doc for doc in self.slowest_documents() if not doc['cached']]
+        if slowest:
+            lines.append(f"最慢的 {len(slowest)} 份文件:")
+            for doc in slowest:
+                lines.append(f"  {doc['wall']:.3f} 秒  {doc['filename']} ({doc['images']} 張圖片，{format_bytes(doc['size'])})")
+
+        largest = self.largest_images()
+        if largest:
+            lines.append(f"最大的 {len(largest)} 張圖片:")
+            for img in largest:
+                size = f"{img['width']}x{img['height']}" if img['width'] else "尺寸未知"
+                lines.append(f"  {size} ({format_bytes(img['bytes'])})  {img['filename']} {img['member']}，"
+                             f"解碼 {img['decode'] * 1000:.1f} ms")
+        return lines
@@ -0,0 +1,318 @@
+"""
+把重複群組寫成檔案報告。每個群組一確定就寫出，不必先把所有群組收集到記憶體中：
+
+- JsonlReportWriter：每行一個群組的 JSON，方便其他程式逐行讀取；
+- CsvReportWriter：每行一張圖片，可用試算表開啟；
+- HtmlReportWriter：分頁的 HTML 報告 (index.html 加上 page_0001.html ...)，
+  每張不同的圖片只產生一次小縮圖，瀏覽器捲動到該處時才載入。
+"""
+import os
+import csv
+import html
+import json
+import zipfile
+import argparse
+import datetime
+
+from clustering import CLUSTER_MODE_LABELS
+from docx_scanner import make_thumbnail
+
+REPORT_FORMATS = ('html', 'jsonl', 'csv')
+# HTML 報告每頁的群組數
+DEFAULT_PAGE_SIZE = 200
+# HTML 報告縮圖的最長邊
+HTML_THUMBNAIL_SIZE = 160
+
+# 每張圖片輸出的欄位 (JSONL 與 CSV 共用)
+IMAGE_FIELDS = ('filename', 'page', 'context', 'image_name', 'hash', 'docx_path', 'member')
+
+
+def report_meta(folder_path, threshold, cluster_mode, file_count, image_count):
+    """報告開頭的摘要資料。"""
+    return {
+        'generated': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'folder_path': folder_path,
+        'threshold': threshold,
+        'cluster_mode': cluster_mode,
+        'file_count': file_count,
+        'image_count': image_count,
+    }
+
+
+def _make_parent(path):
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+
+
+def _image_fields(img):
+    return {field: img.get(field) for field in IMAGE_FIELDS}
+
+
+class _ReportWriter:
+    """共用的計數與 with 敘述支援；write_group() 接收 scan_engine.group_records 產生的圖片紀錄。"""
+
+    def __init__(self, meta):
+        self.meta = meta
+        self.group_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_group(self, group):
+        self.group_count += 1
+        self._write_group(self.group_count, group)
+
+
+class JsonlReportWriter(_ReportWriter):
+    """每行一個群組：{"threshold", "group", "size", "images": [...]}。"""
+
+    def __init__(self, path, meta):
+        super().__init__(meta)
+        self.path = path
+        _make_parent(path)
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def _write_group(self, number, group):
+        row = {'threshold': self.meta['threshold'], 'group': number, 'size': len(group),
+               'images': [_image_fields(img) for img in group]}
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+        return self.path
+
+
+class CsvReportWriter(_ReportWriter):
+    """每行一張圖片，以 group 欄位表示所屬群組。加上 BOM 讓 Excel 正確辨識中文。"""
+
+    def __init__(self, path, meta):
+        super().__init__(meta)
+        self.path = path
+        _make_parent(path)
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(('threshold', 'group') + IMAGE_FIELDS)
+
+    def _write_group(self, number, group):
+        for img in group:
+            self._writer.writerow([self.meta['threshold'], number] + [img.get(field) for field in IMAGE_FIELDS])
+
+    def close(self):
+        self._file.close()
+        return self.path
+
+
+_STYLE = """body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; max-width: 1000px; margin: 0 auto; padding: 20px; }
+h1 { color: #2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 10px; }
+h2 { color: #2980b9; margin-top: 30px; }
+.summary { background: #f8f9fa; padding: 15px; border-radius: 8px; margin-bottom: 30px; border-left: 4px solid #3498db; }
+.group { background: #fff; border: 1px solid #ddd; border-radius: 8px; margin-bottom: 20px; padding: 15px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
+.group-title { font-size: 1.2em; font-weight: bold; color: #e74c3c; margin-top: 0; margin-bottom: 15px; }
+ul { list-style-type: none; padding: 0; margin: 0; }
+li { display: flex; gap: 15px; margin-bottom: 15px; padding-bottom: 15px; border-bottom: 1px dashed #eee; }
+li:last-child { margin-bottom: 0; border-bottom: none; padding-bottom: 0; }
+.thumb { flex: 0 0 %(size)dpx; text-align: center; }
+.thumb img { border: 1px solid #ddd; background: #fafafa; }
+.detail-label { font-weight: bold; color: #555; display: inline-block; width: 150px; }
+.success-msg { font-size: 1.2em; color: #27ae60; font-weight: bold; text-align: center; padding: 20px; background: #e8f8f5; border-radius: 8px; }
+.nav { display: flex; justify-content: space-between; margin: 20px 0; }
+code { background: #f4f4f4; padding: 2px 5px; border-radius: 4px; font-family: monospace; color: #d63031; }
+""" % {'size': HTML_THUMBNAIL_SIZE}
+
+
+def _page_head(title):
+    return f"""<!DOCTYPE html>
+<html lang="zh-TW">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{html.escape(title)}</title>
+    <link rel="stylesheet" href="style.css">
+</head>
+<body>
+"""
+
+
+class HtmlReportWriter(_ReportWriter):
+    """
+    分頁的 HTML 報告，寫在 out_dir 資料夾中：每 page_size 個群組一頁，寫滿就關閉該頁，
+    最後產生列出摘要與各頁群組範圍的 index.html。縮圖存放在 thumbs/，內容相同 (CRC、大小與雜湊都相同) 的圖片即使出現在不同文件中也只產生一次，
+    並以 loading="lazy" 讓瀏覽器只載入畫面附近的縮圖。
+    """
+
+    def __init__(self, out_dir, meta, page_size=DEFAULT_PAGE_SIZE, thumbnails=True):
+        super().__init__(meta)
+        self.out_dir = out_dir
+        self.page_size = page_size
+        self.thumbnails = thumbnails
+        self.thumb_dir = os.path.join(out_dir, 'thumbs')
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        with open(os.path.join(out_dir, 'style.css'), 'w', encoding='utf-8') as f:
+            f.write(_STYLE)
+        # 已產生的縮圖：(crc, 檔案大小, 雜湊) -> (檔名, 寬, 高)，無法解碼時為 None。
+        # CRC32 與大小仍可能碰巧相同，加上圖片的雜湊，不同的圖片才不會共用縮圖
+        self._thumbs = {}
+        # (docx_path, member) -> 上述的鍵，同一份文件多次引用同一張圖片時不必重新開啟壓縮檔
+        self._thumb_keys = {}
+        # 每頁的 (第一個群組編號, 最後一個群組編號, 圖片數)
+        self.pages = []
+        self._page = None
+
+    @staticmethod
+    def page_name(number):
+        return f"page_{number:04d}.html"
+
+    def _thumbnail(self, img):
+        location = (img['docx_path'], img['member'])
+        if location not in self._thumb_keys:
+            key = None
+            try:
+                with zipfile.ZipFile(img['docx_path'], 'r') as docx_zip:
+                    zinfo = docx_zip.getinfo(img['member'])
+                    key = (zinfo.CRC, zinfo.file_size, img['hash'])
+                    if key not in self._thumbs:
+                        self._thumbs[key] = self._save_thumbnail(key, docx_zip.read(zinfo))
+            except Exception:
+                self._thumbs[key] = None
+            self._thumb_keys[location] = key
+        return self._thumbs[self._thumb_keys[location]]
+
+    def _save_thumbnail(self, key, data):
+        name = f"{key[0]:08x}_{key[1]}_{key[2]}.jpg"
+        try:
+            thumb = make_thumbnail(data, HTML_THUMBNAIL_SIZE).convert('RGB')
+        except Exception:
+            return None
+        thumb.save(os.path.join(self.thumb_dir, name), 'JPEG', quality=80)
+        return name, thumb.width, thumb.height
+
+    def _nav(self, number, has_next):
+        prev_link = f'<a href="{self.page_name(number - 1)}">« 上一頁</a>' if number > 1 else '<span></span>'
+        next_link = f'<a href="{self.page_name(number + 1)}">下一頁 »</a>' if has_next else '<span></span>'
+        return f'    <div class="nav">{prev_link}<a href="index.html">回到摘要</a>{next_link}</div>\n'
+
+    def _close_page(self, has_next):
+        number = len(self.pages)
+        self._page.write(self._nav(number, has_next))
+        self._page.write('</body>\n</html>\n')
+        self._page.close()
+        self._page = None
+
+    def _write_group(self, number, group):
+        if self._page is not None and number > self.pages[-1][0] + self.page_size - 1:
+            self._close_page(has_next=True)
+        if self._page is None:
+            self.pages.append([number, number, 0])
+            page_number = len(self.pages)
+            self._page = open(os.path.join(self.out_dir, self.page_name(page_number)), 'w', encoding='utf-8')
+            self._page.write(_page_head(f"Docx 圖片重複檢測報告 - 第 {page_number} 頁"))
+            self._page.write(f'    <h1>Docx 圖片重複檢測報告 - 第 {page_number} 頁</h1>\n')
+        page = self.pages[-1]
+        page[1] = number
+        page[2] += len(group)
+
+        f = self._page
+        f.write(f'    <div class="group" id="group-{number}">\n')
+        f.write(f'        <div class="group-title">發現重複群組 #{number} (共 {len(group)} 張高度相似圖片)</div>\n')
+        f.write('        <ul>\n')
+        for img in group:
+            f.write('            <li>\n')
+            thumb = self._thumbnail(img) if self.thumbnails else None
+            if thumb is not None:
+                name, width, height = thumb
+                f.write(f'                <div class="thumb"><img src="thumbs/{name}" width="{width}" height="{height}" '
+                        f'loading="lazy" decoding="async" alt=""></div>\n')
+            f.write('                <div>\n')
+            f.write(f'                <div><span class="detail-label">檔案來源:</span> <code>{html.escape(img["filename"])}</code></div>\n')
+            f.write(f'                <div><span class="detail-label">所在頁數:</span> 第 {img["page"]} 頁</div>\n')
+            f.write(f'                <div><span class="detail-label">所在節錄:</span> {html.escape(img["context"])}</div>\n')
+            f.write(f'                <div><span class="detail-label">內部資源名稱:</span> <code>{html.escape(img["image_name"])}</code></div>\n')
+            f.write(f'                <div><span class="detail-label">特徵雜湊碼:</span> <code>{img["hash"]}</code></div>\n')
+            f.write('                </div>\n')
+            f.write('            </li>\n')
+        f.write('        </ul>\n')
+        f.write('    </div>\n')
+
+    def close(self):
+        """結束最後一頁並寫出 index.html，回傳 index.html 的路徑。"""
+        if self._page is not None:
+            self._close_page(has_next=False)
+        meta = self.meta
+        index_path = os.path.join(self.out_dir, 'index.html')
+        with open(index_path, 'w', encoding='utf-8') as f:
+            f.write(_page_head("Docx 圖片重複檢測報告"))
+            f.write('    <h1>Docx 圖片重複檢測報告</h1>\n')
+            f.write('    <div class="summary">\n')
+            f.write(f'        <p><span class="detail-label">產生時間:</span> {meta["generated"]}</p>\n')
+            f.write(f'        <p><span class="detail-label">掃描資料夾:</span> <code>{html.escape(meta["folder_path"])}</code></p>\n')
+            f.write(f'        <p><span class="detail-label">相似度閥值:</span> {meta["threshold"]}</p>\n')
+            f.write(f'        <p><span class="detail-label">分群方式:</span> {CLUSTER_MODE_LABELS[meta["cluster_mode"]]}</p>\n')
+            f.write(f'        <p><span class="detail-label">掃描文件數量:</span> {meta["file_count"]}</p>\n')
+            f.write(f'        <p><span class="detail-label">提取圖片數量:</span> {meta["image_count"]}</p>\n')
+            f.write(f'        <p><span class="detail-label">發現重複群組:</span> {self.group_count}</p>\n')
+            f.write('    </div>\n')
+            if not self.group_count:
+                f.write('    <div class="success-msg">🎉 太棒了！所有的檔案中沒有發現任何重複且相似的圖片。</div>\n')
+            else:
+                f.write('    <h2>⚠️ 重複圖片詳細資料</h2>\n')
+                f.write('    <ul>\n')
+                for number, (first, last, image_count) in enumerate(self.pages, 1):
+                    f.write(f'        <li><a href="{self.page_name(number)}">第 {number} 頁</a>：'
+                            f'群組 #{first} ~ #{last} (共 {image_count} 張圖片)</li>\n')
+                f.write('    </ul>\n')
+            f.write('</body>\n</html>\n')
+        return index_path
+
+
+def add_report_arguments(parser):
+    """加入輸出報告檔的選項。"""
+    parser.add_argument("--html", metavar="DIR", default=None,
+                        help=f"把分頁的 HTML 報告 (含縮圖) 寫到此資料夾，開啟其中的 index.html 瀏覽 (每頁 {DEFAULT_PAGE_SIZE} 組)")
+    parser.add_argument("--jsonl", metavar="OUT.jsonl", default=None, help="每行一個重複群組的 JSON，供其他程式讀取")
+    parser.add_argument("--csv", metavar="OUT.csv", default=None, help="每行一張重複圖片的 CSV，可用試算表開啟")
+    parser.add_argument("--page-size", type=_positive_int, default=DEFAULT_PAGE_SIZE,
+                        help=f"HTML 報告每頁的群組數 (預設 {DEFAULT_PAGE_SIZE})")
+
+
+def _positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"必須是正整數: {text}")
+    return value
+
+
+def report_targets(args):
+    """add_report_arguments 的選項中有指定的輸出 {'html', 'jsonl', 'csv', 'page_size'}。"""
+    targets = {fmt: getattr(args, fmt) for fmt in REPORT_FORMATS if getattr(args, fmt)}
+    if targets:
+        targets['page_size'] = args.page_size
+    return targets
+
+
+def with_threshold(path, threshold):
+    """一次輸出多個閥值時，在檔名 (或資料夾名稱) 後面加上閥值，例如 out.jsonl -> out_t3.jsonl。"""
+    root, ext = os.path.splitext(path.rstrip('/\\'))
+    return f"{root}_t{threshold}{ext}"
+
+
+def open_report_writers(targets, meta, suffix_threshold=False):
+    """依 report_targets() 開啟各格式的 writer；suffix_threshold 為 True 時在輸出路徑加上閥值。"""
+    writers = []
+
+    def path_for(fmt):
+        path = targets[fmt]
+        return with_threshold(path, meta['threshold']) if suffix_threshold else path
+
+    if targets.get('html'):
+        writers.append(HtmlReportWriter(path_for('html'), meta, targets.get('page_size', DEFAULT_PAGE_SIZE)))
+    if targets.get('jsonl'):
+        writers.append(JsonlReportWriter(path_for('jsonl'), meta))
+    if targets.get('csv'):
+        writers.append(CsvReportWriter(path_for('csv'), meta))
+    return writers
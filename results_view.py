@@ -0,0 +1,252 @@
+"""
+GUI 的重複群組結果檢視：以 QTreeView 顯示「群組 → 圖片」兩層的結果。
+
+- DuplicateGroupModel 只保存群組的索引值，欄位文字在檢視繪製到該列時才產生；
+  群組分批加入，並透過 canFetchMore/fetchMore 在捲動到底時才逐批顯示，數萬組結果也不會卡住介面。
+- ThumbnailLoader 只在檢視需要繪製縮圖時，才在背景執行緒池中從 docx 讀出並解碼該張圖片，
+  縮圖保存在有上限的 LRU 快取中，記憶體用量不隨結果數量增加。
+"""
+from collections import OrderedDict
+
+from docx_scanner import load_thumbnail
+from hash_index import int_to_hex
+
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, QAbstractItemModel, QModelIndex, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+
+THUMBNAIL_SIZE = 64
+# 最多保留的縮圖數 (每張約 THUMBNAIL_SIZE² × 4 bytes)
+THUMBNAIL_CACHE_SIZE = 512
+THUMBNAIL_THREADS = 2
+# 每次捲動到底時多顯示的群組數
+FETCH_BATCH = 200
+
+COLUMNS = ("群組 / 縮圖", "檔案來源", "頁數", "所在節錄", "圖片名稱", "Hash")
+
+
+def decode_thumbnail(record, size=THUMBNAIL_SIZE):
+    """讀出紀錄對應的圖片並縮成最長邊 size 的 QImage，無法讀取或解碼時回傳 None。在背景執行緒中呼叫。"""
+    try:
+        img = load_thumbnail(record, size).convert('RGBA')
+    except Exception:
+        return None
+    data = img.tobytes('raw', 'RGBA')
+    # copy() 讓 QImage 擁有自己的緩衝區，不再參照 data
+    return QImage(data, img.width, img.height, img.width * 4, QImage.Format.Format_RGBA8888).copy()
+
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, loader, key, record, size):
+        super().__init__()
+        self.loader = loader
+        self.key = key
+        self.record = record
+        self.size = size
+
+    def run(self):
+        self.loader._decoded.emit(self.key, decode_thumbnail(self.record, self.size))
+
+
+class ThumbnailLoader(QObject):
+    """
+    背景解碼縮圖並以 LRU 快取保存。get() 在快取中沒有時排入執行緒池並回傳 None，
+    解碼完成後送出 loaded(key)。較晚提出的請求優先處理，快速捲動時目前畫面上的縮圖會先出現。
+    """
+
+    loaded = pyqtSignal(object)
+    # 背景執行緒解碼完成 (跨執行緒送到主執行緒)
+    _decoded = pyqtSignal(object, object)
+
+    def __init__(self, size=THUMBNAIL_SIZE, capacity=THUMBNAIL_CACHE_SIZE, threads=THUMBNAIL_THREADS, parent=None):
+        super().__init__(parent)
+        self.size = size
+        self.capacity = capacity
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(threads)
+        self.cache = OrderedDict()
+        self.pending = set()
+        self._priority = 0
+        self._decoded.connect(self._on_decoded)
+
+    def get(self, key, record):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        if key not in self.pending:
+            self.pending.add(key)
+            self._priority = (self._priority + 1) % (1 << 30)
+            self.pool.start(_ThumbnailTask(self, key, record, self.size), self._priority)
+        return None
+
+    def _on_decoded(self, key, image):
+        if key not in self.pending:
+            # clear() 之後才完成的舊請求
+            return
+        self.pending.discard(key)
+        # QPixmap 只能在主執行緒建立；無法解碼的圖片存成空的 QPixmap，不會一再重試
+        self.cache[key] = QPixmap.fromImage(image) if image is not None else QPixmap()
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+        self.loaded.emit(key)
+
+    def clear(self):
+        self.pool.clear()
+        self.cache.clear()
+        self.pending.clear()
+
+    def discard(self, docx_paths):
+        """捨棄這些文件的縮圖 (文件已修改或刪除)；尚在解碼中的舊請求完成後也不會放入快取。"""
+        docx_paths = set(docx_paths)
+        for key in [key for key in self.cache if key[0] in docx_paths]:
+            del self.cache[key]
+        self.pending = {key for key in self.pending if key[0] not in docx_paths}
+
+
+class DuplicateGroupModel(QAbstractItemModel):
+    """
+    重複群組的樹狀模型。最上層每列是一個群組，子列是群組內的圖片；
+    群組以 records / hashes 的索引值表示 (與 scan_engine.ScanEngine.scan 的結果相同)。
+    """
+
+    def __init__(self, loader=None, parent=None):
+        super().__init__(parent)
+        self.loader = loader if loader is not None else ThumbnailLoader(parent=self)
+        self.loader.loaded.connect(self._on_thumbnail)
+        self.records = []
+        self.hashes = []
+        self.groups = []
+        # 目前顯示的群組數，其餘的在捲動到底時才加入
+        self.visible = 0
+        # 等待縮圖的列：key -> {(群組列, 子列)}
+        self._waiting = {}
+
+    # --- 資料 ---
+
+    def set_results(self, records, hashes, groups=()):
+        """換成新的掃描結果，groups 只保留重複 (兩張以上) 的群組。"""
+        self.beginResetModel()
+        self.records = records
+        self.hashes = hashes
+        self.groups = []
+        self.visible = 0
+        self._waiting.clear()
+        self.endResetModel()
+        self.add_groups(groups)
+
+    def add_groups(self, groups):
+        """加入一批群組；第一批先顯示，之後的由檢視捲動到底時逐批顯示。"""
+        self.groups.extend(g for g in groups if len(g) > 1)
+        if self.visible < FETCH_BATCH:
+            self.fetchMore(QModelIndex())
+
+    def clear(self):
+        """清除結果與縮圖快取 (重新掃描時文件可能已經變動)。"""
+        self.loader.clear()
+        self.set_results([], [])
+
+    def forget_documents(self, docx_paths):
+        """
+        監看模式中文件被修改或刪除時呼叫：縮圖以 (docx_path, member) 為鍵，
+        修改後的文件沿用相同的圖片名稱時，不捨棄就會一直顯示舊的縮圖。
+        """
+        self.loader.discard(docx_paths)
+
+    def group_count(self):
+        return len(self.groups)
+
+    def record(self, index):
+        """子列對應的圖片紀錄 (不含 hash)，群組列回傳 None。"""
+        if not index.isValid() or index.internalId() == 0:
+            return None
+        return self.records[self.groups[index.internalId() - 1][index.row()]]
+
+    # --- QAbstractItemModel ---
+
+    def index(self, row, column, parent=QModelIndex()):
+        # 檢視每次重新排版都會對每一列呼叫，因此直接檢查範圍而不經過 hasIndex()
+        if not 0 <= column < len(COLUMNS) or row < 0:
+            return QModelIndex()
+        if not parent.isValid():
+            if row >= self.visible:
+                return QModelIndex()
+            # internalId 0 代表群組列，子列記錄所屬群組列 + 1
+            return self.createIndex(row, column, 0)
+        group_row = parent.row()
+        if parent.internalId() != 0 or parent.column() != 0 or row >= len(self.groups[group_row]):
+            return QModelIndex()
+        return self.createIndex(row, column, group_row + 1)
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == 0:
+            return QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0, 0)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return self.visible
+        if parent.internalId() == 0 and parent.column() == 0:
+            return len(self.groups[parent.row()])
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.visible < len(self.groups)
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        count = min(FETCH_BATCH, len(self.groups) - self.visible)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.visible, self.visible + count - 1)
+        self.visible += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        column = index.column()
+        if index.internalId() == 0:
+            if role == Qt.ItemDataRole.DisplayRole:
+                if column == 0:
+                    return f"群組 #{index.row() + 1}"
+                if column == 1:
+                    return f"{len(self.groups[index.row()])} 張相似圖片"
+            return None
+
+        group_row = index.internalId() - 1
+        idx = self.groups[group_row][index.row()]
+        img = self.records[idx]
+        if role == Qt.ItemDataRole.DecorationRole and column == 0:
+            key = (img['docx_path'], img['member'])
+            pixmap = self.loader.get(key, img)
+            if pixmap is None:
+                self._waiting.setdefault(key, set()).add((group_row, index.row()))
+            return pixmap
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 1:
+                return img['filename']
+            if column == 2:
+                return f"第 {img['page']} 頁"
+            if column == 3:
+                return img['context']
+            if column == 4:
+                return img['image_name']
+            if column == 5:
+                return int_to_hex(self.hashes[idx])
+        if role == Qt.ItemDataRole.ToolTipRole and column in (1, 3):
+            return img['docx_path'] if column == 1 else img['context']
+        return None
+
+    def _on_thumbnail(self, key):
+        for group_row, row in self._waiting.pop(key, ()):
+            if group_row < self.visible:
+                index = self.index(row, 0, self.index(group_row, 0))
+                self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
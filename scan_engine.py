@@ -0,0 +1,187 @@
+"""
+無介面的掃描引擎：CLI (find_docx_duplicates.py) 與 GUI (gui_app.py) 共用的
+「找出文件 → 擷取圖片並計算雜湊 → 分群 → 產生報告內容」流程。
+
+- 文件清單可以是 list，也可以是邊走訪邊產生路徑的 discovery.DocumentWalker；
+- 結果以串流方式逐份文件回傳 (iter_documents)，或一次收集成 all_images / hashes (scan)；
+- progress(path, done, total) 與 log(message) 回呼讓前端決定如何顯示進度與訊息；
+- CancelToken 可從其他執行緒取消掃描，引擎在每份文件之間檢查並丟出 ScanCancelled，
+  同時關閉背後的行程池與管線；
+- 雜湊方式 (hasher)、近鄰索引 (index_kind) 與執行方式 (executor) 都可以替換。
+"""
+import threading
+
+from docx_scanner import scan_files, DEFAULT_HASHER
+from hash_index import int_to_hex, PackedHashes, DEFAULT_INDEX
+from clustering import cluster_hashes, NeighborGraph, DEFAULT_CLUSTER_MODE
+from discovery import DocumentWalker
+from profiling import profile_stage
+
+
+class ScanCancelled(Exception):
+    """掃描被 CancelToken 取消。"""
+
+
+class CancelToken:
+    """可跨執行緒使用的取消旗標：前端呼叫 cancel()，引擎在每份文件之間呼叫 check()。"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise ScanCancelled()
+
+
+def find_docx_files(folder_path, **options):
+    """
+    一次列出資料夾中所有的 docx 檔案 (options 為 DocumentWalker 的參數)。
+    順序固定，不受檔案系統與平行處理影響；需要邊走訪邊掃描時直接把 DocumentWalker 交給 ScanEngine。
+    """
+    return list(DocumentWalker(folder_path, **options))
+
+
+class ScanEngine:
+    """
+    掃描設定與執行。cache (HashCache) 由呼叫端開啟與關閉：SQLite 連線只能在建立它的執行緒中使用，
+    因此必須在執行掃描的同一條執行緒中開啟。
+
+    - hasher：具有 name、prepare()、hash_prepared() 與 __call__() 的物件 (見 docx_scanner.PhashHasher)；
+    - index_kind：分群時使用的近鄰索引 (hash_index.INDEX_TYPES 的名稱)；
+    - executor：與 docx_scanner.scan_files 參數相同、依序產生 (path, records, messages) 的函式。
+    - stats (PipelineStats) 與 profile (ScanProfile) 不為 None 時記錄管線統計與各階段時間。
+    """
+
+    def __init__(self, hasher=DEFAULT_HASHER, cache=None, workers=1, read_ahead=0, readers=2,
+                 index_kind=DEFAULT_INDEX, executor=scan_files, stats=None, profile=None):
+        self.hasher = hasher
+        self.cache = cache
+        self.workers = workers
+        self.read_ahead = read_ahead
+        self.readers = readers
+        self.index_kind = index_kind
+        self.executor = executor
+        self.stats = stats
+        self.profile = profile
+
+    def iter_documents(self, docx_files, progress=None, cancel=None):
+        """
+        依 docx_files 的順序逐一產生 (docx_path, records, messages)，records 內的 'hash' 為整數。
+        每份文件處理完後呼叫 progress(path, done, total)；docx_files 是 DocumentWalker 時
+        total 為目前已找到的文件數 (discovered)，走訪尚未完成時會繼續增加；其他沒有長度的可迭代物件 (例如產生器)
+        則為目前已處理的文件數。
+        cancel 被取消時丟出 ScanCancelled。
+        """
+        if cancel is not None:
+            cancel.check()
+        total = len(docx_files) if hasattr(docx_files, '__len__') else None
+        results = self.executor(docx_files, self.workers, self.cache, self.hasher, self.read_ahead, self.readers,
+                                self.stats, self.profile)
+        try:
+            for done, (path, records, messages) in enumerate(results, 1):
+                if progress is not None:
+                    progress(path, done, total if total is not None else getattr(docx_files, 'discovered', done))
+                yield path, records, messages
+                if cancel is not None:
+                    cancel.check()
+        finally:
+            # 提前結束 (取消或例外) 時停止背後的行程池與讀檔執行緒
+            results.close()
+
+    def scan(self, docx_files, progress=None, log=None, cancel=None):
+        """
+        掃描所有文件，回傳 {'file_count', 'all_images', 'hashes'}；hashes (PackedHashes 或 CascadeHashes)
+        的索引與 all_images 對應。
+        處理文件時的錯誤訊息交給 log(message)。
+        """
+        file_count = 0
+        all_images = []
+        # 所有圖片的雜湊另外以連續的 uint64 陣列保存，索引與 all_images 對應
+        # (旋轉/翻轉/裁切比對模式的 hasher 會提供 CascadeHashes，另外保存預篩雜湊)
+        new_store = getattr(self.hasher, 'new_store', PackedHashes)
+        hashes = new_store()
+        with profile_stage(self.profile, 'scan'):
+            for _, records, messages in self.iter_documents(docx_files, progress, cancel):
+                file_count += 1
+                if log is not None:
+                    for msg in messages:
+                        log(msg)
+                for img_info in records:
+                    hashes.append(img_info.pop('hash'))
+                    all_images.append(img_info)
+        return {'file_count': file_count, 'all_images': all_images, 'hashes': hashes}
+
+    def group(self, hashes, threshold, cluster_mode=DEFAULT_CLUSTER_MODE, max_diameter=None):
+        """以設定的近鄰索引分群，回傳以索引值組成的群組清單。"""
+        with profile_stage(self.profile, 'grouping'):
+            return cluster_hashes(hashes, threshold, cluster_mode, max_diameter, self.index_kind)
+
+    def build_graph(self, hashes, max_distance):
+        """
+        以設定的近鄰索引建立距離 <= max_distance 的鄰接圖，之後 <= max_distance 的各閥值只需過濾邊後重新分群。
+        成本隨 max_distance 增加，應只建立到實際需要的距離，不要預先建到很大的距離。
+        """
+        with profile_stage(self.profile, 'grouping'):
+            return NeighborGraph.from_index(hashes, max_distance, self.index_kind)
+
+
+# --- 報告內容 ---
+
+def group_records(group, all_images, hashes):
+    """把索引值組成的群組轉成圖片紀錄，並帶上十六進位的 hash。"""
+    return [dict(all_images[idx], hash=int_to_hex(hashes[idx])) for idx in group]
+
+
+def format_group(title, group):
+    lines = [f"\n{title} 共 {len(group)} 張相似度極高的圖片:"]
+    for img in group:
+        lines.append(f"  📂 檔案來源: {img['filename']}")
+        lines.append(f"  📄 所在頁數: 第 {img['page']} 頁")
+        lines.append(f"  📍 所在節錄: {img['context']}")
+        lines.append(f"  🖼 圖片名稱: {img['image_name']}")
+        lines.append(f"  🔑 Hash: {img['hash']}")
+    lines.append("-" * 60)
+    return lines
+
+
+def format_summary(duplicate_count):
+    """報告最後的結論句。"""
+    if not duplicate_count:
+        return "🎉 太棒了！所有的檔案中沒有發現任何重複且相似的圖片。"
+    return f"⚠️  檢查完畢，總共發現 {duplicate_count} 組重複/相似的圖片。"
+
+
+def report_header():
+    return ["\n" + "="*60, " 📊 圖片重複檢查報告", "="*60]
+
+
+def report_footer(duplicate_count):
+    return ["\n" + "="*60, format_summary(duplicate_count), "="*60 + "\n"]
+
+
+def iter_duplicate_groups(groups, all_images, hashes):
+    """逐一產生重複 (兩張以上) 的群組，轉成帶十六進位 hash 的圖片紀錄；報告可以邊分群結果邊輸出。"""
+    for group in groups:
+        if len(group) > 1:
+            yield group_records(group, all_images, hashes)
+
+
+def format_report(groups, all_images, hashes):
+    """
+    產生報告文字。groups 為索引值組成的群組，對應 all_images 與 hashes。
+    回傳 (報告的每一行, 重複群組)，重複群組內的圖片紀錄帶有十六進位的 hash 供 HTML 報告使用。
+    """
+    lines = report_header()
+    duplicate_groups = []
+    for group in iter_duplicate_groups(groups, all_images, hashes):
+        duplicate_groups.append(group)
+        lines.extend(format_group(f"[發現重複群組 #{len(duplicate_groups)}]", group))
+    lines.extend(report_footer(len(duplicate_groups)))
+    return lines, duplicate_groups
@@ -0,0 +1,91 @@
+"""
+測試共用的工具：把專案根目錄加入 sys.path (模組都放在根目錄)，並提供產生圖片與 docx 的函式。
+"""
+import io
+import os
+import sys
+import random
+import zipfile
+
+import pytest
+from PIL import Image, ImageDraw
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+    '</Types>'
+)
+_NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+)
+_IMAGE_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+
+def make_image(seed, size=(256, 192), fmt='PNG', **save_options):
+    """以 seed 畫出固定內容的圖片 (幾個色塊與線條)，不同 seed 的 phash 相差很遠。"""
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = rng.randrange(x0, size[0] + 1), rng.randrange(y0, size[1] + 1)
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    img.save(buf, fmt, **save_options)
+    return buf.getvalue()
+
+
+def clustered_hashes(count, seed=0, max_flips=10, bits=64):
+    """產生成群的隨機雜湊：每個中心後面跟著 0~3 個翻轉了 0~max_flips 個 bit 的變形。"""
+    rng = random.Random(seed)
+    values = []
+    while len(values) < count:
+        center = rng.getrandbits(bits)
+        values.append(center)
+        for _ in range(rng.randint(0, 3)):
+            value = center
+            for bit in rng.sample(range(bits), rng.randint(0, max_flips)):
+                value ^= 1 << bit
+            values.append(value)
+    return values[:count]
+
+
+def write_docx(path, images, texts=None):
+    """寫出一份最簡單的 docx：每張圖片 (bytes) 前有一段文字。"""
+    body, rels = [], []
+    for i, data in enumerate(images, 1):
+        ext = 'jpeg' if data[:2] == b'\xff\xd8' else 'png'
+        text = texts[i - 1] if texts else f"第 {i} 張圖片的說明"
+        body.append(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>')
+        body.append(f'<w:p><w:r><w:drawing><a:blip r:embed="rId{i}"/></w:drawing></w:r></w:p>')
+        rels.append((f"rId{i}", f"media/image{i}.{ext}", data))
+    document = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {_NAMESPACES}><w:body>'
+                + "".join(body) + '</w:body></w:document>')
+    rels_xml = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                + "".join(f'<Relationship Id="{rid}" Type="{_IMAGE_REL_TYPE}" Target="{target}"/>'
+                          for rid, target, _ in rels)
+                + '</Relationships>')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as docx_zip:
+        docx_zip.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        docx_zip.writestr('word/document.xml', document)
+        docx_zip.writestr('word/_rels/document.xml.rels', rels_xml)
+        for _, target, data in rels:
+            docx_zip.writestr(f"word/{target}", data)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache(tmp_path, monkeypatch):
+    """預設的快取位置改到暫存資料夾，測試不會讀寫使用者的快取。"""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'xdg'))
+    monkeypatch.setenv('LOCALAPPDATA', str(tmp_path / 'xdg'))
@@ -0,0 +1,68 @@
+import itertools
+
+import pytest
+
+from conftest import clustered_hashes
+from clustering import cluster_hashes, CLUSTER_MODES
+from hash_index import INDEX_TYPES, CascadeHashes, PackedHashes, cascade_hamming, hamming
+
+STORES = {
+    'phash': (PackedHashes, 64, hamming),
+    'invariant': (CascadeHashes, 192, cascade_hamming),
+}
+
+
+def reference_groups(values, threshold, mode, distance, max_diameter=None):
+    """不使用任何索引或鄰接圖，直接依定義計算的分群結果。"""
+    n = len(values)
+    if mode == 'representative':
+        groups = []
+        for i in range(n):
+            for group in groups:
+                if distance(values[group[0]], values[i]) <= threshold:
+                    group.append(i)
+                    break
+            else:
+                groups.append([i])
+        return groups
+
+    edges = sorted((distance(values[a], values[b]), b, a) for a, b in itertools.combinations(range(n), 2))
+    edges = [(d, a, b) for d, b, a in edges if d <= threshold]
+    group_of = list(range(n))
+    members = {i: [i] for i in range(n)}
+    limit = threshold if max_diameter is None else max_diameter
+    for d, a, b in edges:
+        ga, gb = group_of[a], group_of[b]
+        if ga == gb:
+            continue
+        if mode == 'complete' and any(distance(values[x], values[y]) > limit
+                                      for x in members[ga] for y in members[gb]):
+            continue
+        for member in members.pop(gb):
+            group_of[member] = ga
+            members[ga].append(member)
+    return sorted(sorted(g) for g in members.values())
+
+
+@pytest.mark.parametrize('match', sorted(STORES))
+@pytest.mark.parametrize('mode', CLUSTER_MODES)
+@pytest.mark.parametrize('index_kind', sorted(INDEX_TYPES))
+def test_grouping_matches_brute_force(index_kind, mode, match):
+    store, bits, distance = STORES[match]
+    values = clustered_hashes(160, seed=11, max_flips=14, bits=bits)
+    hashes = store(values)
+    for threshold in (0, 4, 7):
+        groups = cluster_hashes(hashes, threshold, mode, index_kind=index_kind)
+        expected = reference_groups(values, threshold, mode, distance)
+        if mode != 'representative':
+            groups = sorted(sorted(g) for g in groups)
+        assert groups == expected, (threshold, mode)
+
+
+@pytest.mark.parametrize('index_kind', sorted(INDEX_TYPES))
+def test_complete_linkage_respects_max_diameter(index_kind):
+    values = clustered_hashes(160, seed=12, max_flips=14)
+    groups = cluster_hashes(PackedHashes(values), 7, 'complete', max_diameter=9, index_kind=index_kind)
+    assert sorted(sorted(g) for g in groups) == reference_groups(values, 7, 'complete', hamming, max_diameter=9)
+    for group in groups:
+        assert all(hamming(values[a], values[b]) <= 9 for a, b in itertools.combinations(group, 2))
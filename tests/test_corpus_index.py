@@ -0,0 +1,93 @@
+import io
+import json
+import sys
+
+import pytest
+
+from conftest import make_image, write_docx
+import corpus_index
+import find_docx_duplicates
+from corpus_index import hash_document, hasher_for_variant
+
+
+def run(module, argv, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', [module.__name__ + '.py'] + [str(a) for a in argv])
+    with pytest.raises(SystemExit) as exc:
+        module.main()
+        sys.exit(0)
+    out, err = capsys.readouterr()
+    return exc.value.code or 0, out, err
+
+
+@pytest.fixture
+def library(tmp_path):
+    folder = tmp_path / 'lib'
+    folder.mkdir()
+    write_docx(folder / 'a.docx', [make_image(1), make_image(2)])
+    write_docx(folder / 'b.docx', [make_image(3)])
+    (folder / 'broken.docx').write_bytes(b'not a zip')
+    return folder
+
+
+@pytest.fixture
+def index_path(library, tmp_path, monkeypatch, capsys):
+    path = tmp_path / 'lib.idx'
+    code, out, _ = run(corpus_index, ['build-index', library, path, '--no-cache'], monkeypatch, capsys)
+    assert code == 0
+    assert 'broken.docx' in out
+    return path
+
+
+def test_query_reports_duplicates_as_json(index_path, tmp_path, monkeypatch, capsys):
+    new = write_docx(tmp_path / 'new.docx', [make_image(1), make_image(9)])
+    code, out, err = run(corpus_index, ['query', index_path, new, '--json'], monkeypatch, capsys)
+    assert code == 1
+    lines = [json.loads(line) for line in out.splitlines()]
+    assert [len(line['matches']) for line in lines] == [1, 0]
+    assert lines[0]['matches'][0]['filename'] == 'a.docx'
+    assert err == ''
+
+
+@pytest.mark.parametrize('content', [b'not a zip', b'PK\x03\x04 truncated'])
+def test_query_corrupt_document_exits_with_error(index_path, tmp_path, monkeypatch, capsys, content):
+    bad = tmp_path / 'bad.docx'
+    bad.write_bytes(content)
+    new = write_docx(tmp_path / 'new.docx', [make_image(1)])
+    code, out, err = run(corpus_index, ['query', index_path, bad, new, '--json'], monkeypatch, capsys)
+    # 有重複也有無法讀取的文件時，以無法讀取 (2) 為準；錯誤訊息不混入 JSON 輸出
+    assert code == 2
+    assert 'bad.docx' in err
+    assert [json.loads(line)['query']['filename'] for line in out.splitlines()] == ['new.docx']
+
+    code, out, err = run(corpus_index, ['query', index_path, bad], monkeypatch, capsys)
+    assert code == 2
+    assert 'bad.docx' in err and 'bad.docx' not in out
+
+
+@pytest.mark.parametrize('content', [None, b'', b'not an index'])
+def test_query_unreadable_index_exits_with_error(tmp_path, monkeypatch, capsys, content):
+    index_path = tmp_path / 'lib.idx'
+    if content is not None:
+        index_path.write_bytes(content)
+    new = write_docx(tmp_path / 'new.docx', [make_image(1)])
+    code, out, err = run(corpus_index, ['query', index_path, new, '--json'], monkeypatch, capsys)
+    # 索引檔不存在、是空檔或格式不符時與文件無法讀取相同，以 2 回報且 stdout 不輸出任何東西
+    assert code == 2
+    assert out == '' and 'lib.idx' in err
+
+
+def test_hash_document_from_file_object(tmp_path):
+    path = write_docx(tmp_path / 'upload.docx', [make_image(4)] * 2)
+    with open(path, 'rb') as f:
+        data = io.BytesIO(f.read())
+    records = hash_document(data, hasher_for_variant('phash-reduced'), filename='upload.docx')
+    assert [rec['filename'] for rec in records] == ['upload.docx', 'upload.docx']
+    assert records[0]['hash'] == records[1]['hash']
+    with pytest.raises(ValueError):
+        hash_document(io.BytesIO(b'PK garbage'), hasher_for_variant('phash-reduced'), filename='bad.docx')
+
+
+def test_scan_reports_corrupt_document(library, monkeypatch, capsys):
+    code, out, _ = run(find_docx_duplicates, [library, '--no-cache'], monkeypatch, capsys)
+    assert code == 0
+    assert '處理檔案時發生錯誤' in out and 'broken.docx' in out
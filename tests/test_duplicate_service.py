@@ -0,0 +1,81 @@
+import json
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pytest
+
+from conftest import make_image, write_docx
+from corpus_index import hash_document, hasher_for_variant, write_index
+from duplicate_service import DuplicateService, make_server
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('service')
+    hasher = hasher_for_variant('phash-reduced')
+    records = []
+    for name, seeds in (('a.docx', (1, 2)), ('b.docx', (3,))):
+        records += hash_document(write_docx(folder / name, [make_image(s) for s in seeds]), hasher)
+    index_path = str(folder / 'lib.idx')
+    write_index(index_path, records, [rec.pop('hash') for rec in records])
+
+    service = DuplicateService(index_path, workers=2)
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    service.url = f"http://{host}:{port}"
+    yield service
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def post(service, body, filename, headers={}):
+    url = f"{service.url}/check?{urllib.parse.urlencode({'filename': filename})}"
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body, headers=headers, method='POST')) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def stats(service):
+    with urllib.request.urlopen(f"{service.url}/stats") as resp:
+        return json.loads(resp.read())
+
+
+def test_warm_up_starts_every_worker(service):
+    assert len(set(service.warm_up())) == service.workers == 2
+
+
+def test_check_reports_matches_without_internal_fields(service, tmp_path):
+    with open(write_docx(tmp_path / 'new.docx', [make_image(1), make_image(9)]), 'rb') as f:
+        status, result = post(service, f.read(), 'new.docx')
+    assert status == 200
+    assert result['duplicate'] is True
+    first, second = result['images']
+    assert set(first) == {'filename', 'image_name', 'context', 'page', 'hash', 'matches'}
+    assert first['filename'] == 'new.docx'
+    [match] = first['matches']
+    assert set(match) == {'filename', 'image_name', 'context', 'page', 'docx_path', 'hash', 'distance'}
+    assert match['filename'] == 'a.docx' and match['distance'] == 0
+    assert second['matches'] == []
+
+
+@pytest.mark.parametrize('body', [b'not a zip', b'PK\x03\x04 truncated'])
+def test_unreadable_upload_is_an_error(service, body):
+    errors = stats(service)['errors']
+    status, result = post(service, body, 'bad.docx')
+    assert status == 400
+    assert 'error' in result and 'duplicate' not in result
+    assert stats(service)['errors'] == errors + 1
+
+
+@pytest.mark.parametrize('body', [b'{"path": 5}', b'{"path": ""}', b'{"path": null}', b'[1]', b'{"file": "a.docx"}', b'{'])
+def test_invalid_path_request_is_rejected(service, body):
+    status, result = post(service, body, 'a.docx', {'Content-Type': 'application/json'})
+    assert status == 400
+    assert 'path' in result['error']
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+
+import pytest
+
+import hash_cache
+from hash_cache import HashCache, SCHEMA_VERSION
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """讓 last_used 可控：clock.now 為目前時間。"""
+    class Clock:
+        now = 1000.0
+    monkeypatch.setattr(hash_cache.time, 'time', lambda: Clock.now)
+    return Clock
+
+
+def records(value):
+    return [{'image_name': 'image1.png', 'member': 'word/media/image1.png', 'context': '說明', 'page': 1, 'hash': value}]
+
+
+def test_document_key_is_path_size_mtime_and_variant(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache.sqlite')
+    monkeypatch.chdir(tmp_path)
+    with HashCache(path) as cache:
+        cache.store_document('a.docx', 100, 5, records(0xabc))
+        # 相對路徑與絕對路徑是同一個鍵
+        assert cache.lookup_document(str(tmp_path / 'a.docx'), 100, 5)[0]['hash'] == 0xabc
+        assert cache.lookup_document('a.docx', 101, 5) is None
+        assert cache.lookup_document('a.docx', 100, 6) is None
+        assert cache.lookup_document('b.docx', 100, 5) is None
+    with HashCache(path, variant='phash-invariant-reduced') as other:
+        assert other.lookup_document('a.docx', 100, 5) is None
+    with HashCache(path) as cache:
+        assert cache.lookup_document('a.docx', 100, 5)[0]['member'] == 'word/media/image1.png'
+        assert cache.hits == 1
+
+
+def test_media_key_is_crc_size_and_variant(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with HashCache(path) as cache:
+        cache.store_media(0x1234, 10, 1 << 63)
+        assert cache.lookup_media(0x1234, 10) == 1 << 63
+        assert cache.lookup_media(0x1234, 11) is None
+        assert cache.lookup_media(0x1235, 10) is None
+        assert (cache.hits, cache.misses) == (1, 2)
+    with HashCache(path, variant='phash') as other:
+        assert other.lookup_media(0x1234, 10) is None
+    with HashCache(path, readonly=True) as reader:
+        assert reader.lookup_media(0x1234, 10) == 1 << 63
+
+
+def test_eviction_keeps_recently_used_entries(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite')
+    with HashCache(path, max_documents=2, max_media=2) as cache:
+        for i, name in enumerate(('a.docx', 'b.docx', 'c.docx')):
+            clock.now += 1
+            cache.store_document(str(tmp_path / name), 1, 1, records(i))
+            cache.store_media(i, 1, i)
+        # a 與 media 0 最舊，但剛被使用過，淘汰的應該是 b 與 media 1
+        clock.now += 1
+        assert cache.lookup_document(str(tmp_path / 'a.docx'), 1, 1) is not None
+        assert cache.lookup_media(0, 1) == 0
+        clock.now += 1
+        cache.flush()
+        assert cache.lookup_document(str(tmp_path / 'b.docx'), 1, 1) is None
+        assert cache.lookup_document(str(tmp_path / 'c.docx'), 1, 1) is not None
+        assert cache.lookup_document(str(tmp_path / 'a.docx'), 1, 1) is not None
+        assert [cache.lookup_media(i, 1) for i in range(3)] == [0, None, 2]
+
+
+def test_schema_mismatch_discards_old_cache(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with HashCache(path) as cache:
+        cache.store_media(1, 1, 7)
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION - 1}")
+    conn.commit()
+    conn.close()
+
+    with HashCache(path, readonly=True) as reader:
+        assert reader.lookup_media(1, 1) is None
+    with HashCache(path) as cache:
+        assert cache.lookup_media(1, 1) is None
+
+
+def test_readonly_missing_cache_is_all_misses(tmp_path):
+    path = str(tmp_path / 'missing' / 'cache.sqlite')
+    with HashCache(path, readonly=True) as reader:
+        assert reader.lookup_media(1, 1) is None
+        assert reader.misses == 1
+    assert not os.path.exists(path)
@@ -0,0 +1,37 @@
+import pytest
+from PIL import Image
+
+from conftest import make_image
+from docx_scanner import DEFAULT_MAX_PIXELS, PhashHasher, compute_phash, open_for_hash
+from hash_index import hamming
+
+
+def test_reduced_decode_close_to_imagehash():
+    data = make_image(1, (1600, 1200), 'JPEG', quality=90)
+    assert hamming(PhashHasher(reduced_decode=True)(data), compute_phash(data)) <= 6
+    assert PhashHasher(reduced_decode=False)(data) == compute_phash(data)
+
+
+@pytest.mark.parametrize('reduced', [True, False])
+def test_pixel_cap_uses_original_size(reduced):
+    # draft() 會把 4000x4000 的 JPEG 縮成 500x500，上限必須以原始尺寸判斷
+    data = make_image(2, (4000, 4000), 'JPEG', quality=50)
+    with pytest.raises(ValueError):
+        PhashHasher(reduced_decode=reduced, max_pixels=1_000_000)(data)
+    with pytest.raises(ValueError):
+        open_for_hash(data, max_pixels=1_000_000)
+
+
+@pytest.mark.parametrize('reduced', [True, False])
+def test_pil_limit_still_applies(reduced, monkeypatch):
+    data = make_image(3, (400, 300), 'PNG')
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    # PIL 的全域上限不會被更動或停用，超過兩倍時一律拒絕，--max-pixels 0 也一樣
+    for max_pixels in (0, 200_000):
+        with pytest.raises(ValueError):
+            PhashHasher(reduced_decode=reduced, max_pixels=max_pixels)(data)
+    assert Image.MAX_IMAGE_PIXELS == 1000
+
+
+def test_default_cap_within_pil_limit():
+    assert DEFAULT_MAX_PIXELS <= 2 * Image.MAX_IMAGE_PIXELS
@@ -0,0 +1,111 @@
+import os
+import random
+
+import pytest
+
+from conftest import clustered_hashes
+from clustering import cluster_hashes
+from hash_index import CascadeHashes, PackedHashes
+from incremental import IncrementalIndex
+
+
+def make_documents(count, per_document=3, seed=0, bits=64):
+    values = clustered_hashes(count * per_document, seed=seed, bits=bits)
+    rng = random.Random(seed)
+    rng.shuffle(values)
+    return {f'doc{d:03d}.docx': [{'hash': v, 'name': f'doc{d:03d}:{i}'}
+                                 for i, v in enumerate(values[d * per_document:(d + 1) * per_document])]
+            for d in range(count)}
+
+
+def named_groups(index):
+    return sorted(sorted(index.records[s]['name'] for s in group) for group in index.duplicate_groups())
+
+
+def expected_groups(documents, threshold, store):
+    records = [rec for path in sorted(documents) for rec in documents[path]]
+    hashes = store([rec['hash'] for rec in records])
+    groups = cluster_hashes(hashes, threshold, 'single')
+    return sorted(sorted(records[i]['name'] for i in group) for group in groups if len(group) > 1)
+
+
+@pytest.mark.parametrize('store, bits', [(PackedHashes, 64), (CascadeHashes, 192)])
+def test_add_modify_remove_matches_full_clustering(store, bits):
+    documents = make_documents(60, seed=4, bits=bits)
+    index = IncrementalIndex(6, store())
+    for path, records in documents.items():
+        index.add_document(path, records)
+    assert named_groups(index) == expected_groups(documents, 6, store)
+
+    rng = random.Random(5)
+    replacements = make_documents(20, seed=6, bits=bits)
+    for path in rng.sample(sorted(documents), 20):
+        # 修改 = 移除後以新內容重新加入
+        index.remove_document(path)
+        documents[path] = [dict(rec, name=f'{path}:new{i}')
+                           for i, rec in enumerate(replacements.popitem()[1])]
+        index.add_document(path, documents[path])
+    for path in rng.sample(sorted(documents), 15):
+        index.remove_document(path)
+        del documents[path]
+
+    assert len(index) == sum(len(recs) for recs in documents.values())
+    assert named_groups(index) == expected_groups(documents, 6, store)
+
+
+@pytest.mark.parametrize('store, bits', [(PackedHashes, 64), (CascadeHashes, 192)])
+def test_watch_churn_compacts_slots(monkeypatch, store, bits):
+    index = IncrementalIndex(6, store())
+    compactions = []
+    compact = index._compact
+    monkeypatch.setattr(index, '_compact', lambda: (compactions.append(len(index.records)), compact()))
+
+    documents = make_documents(20, seed=7, bits=bits)
+    for path, records in documents.items():
+        index.add_document(path, records)
+    live = len(index)
+
+    # 同一批文件反覆修改：每輪移除再加入，存活的圖片數量不變
+    rounds = 200
+    for _ in range(rounds):
+        for path, records in documents.items():
+            index.remove_document(path)
+            index.add_document(path, records)
+
+    assert len(index) == live
+    # 每次壓縮都要累積超過存活數量的已移除 slot，不會每次移除都重建
+    assert 0 < len(compactions) <= rounds * len(documents) * 3 // live
+    assert len(index.records) <= 2 * live + 3
+    assert len(index.hashes) == len(index.records) == len(index.neighbors) == len(index.group_of)
+    assert named_groups(index) == expected_groups(documents, 6, store)
+
+
+def test_compaction_keeps_slots_consistent():
+    documents = make_documents(10, seed=8)
+    index = IncrementalIndex(6)
+    for path, records in documents.items():
+        index.add_document(path, records)
+    for path in sorted(documents)[:6]:
+        index.remove_document(path)
+        del documents[path]
+
+    assert index._removed == 0
+    assert len(index.records) == len(index)
+    for path, slots in index.documents.items():
+        assert [index.records[s]['name'] for s in slots] == [rec['name'] for rec in documents[path]]
+        assert [index.hashes[s] for s in slots] == [rec['hash'] for rec in documents[path]]
+    for slot, neighbors in enumerate(index.neighbors):
+        assert all(slot in index.neighbors[j] for j in neighbors)
+        assert slot in index.groups[index.group_of[slot]]
+
+
+def test_groups_follow_walker_order(tmp_path):
+    # 依字串排序時 "a-b" < "a/b"，依走訪順序 (逐層比較名稱) 則 a/b 在前
+    root = str(tmp_path)
+    first = os.path.join(root, 'a', 'b.docx')
+    second = os.path.join(root, 'a-b.docx')
+    index = IncrementalIndex(4, root=root)
+    index.add_document(second, [{'hash': 0, 'name': 'second'}])
+    index.add_document(first, [{'hash': 1, 'name': 'first'}])
+    [group] = index.duplicate_groups()
+    assert [index.records[s]['name'] for s in group] == ['first', 'second']
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from conftest import clustered_hashes
+import clustering
+from clustering import NeighborGraph, cluster_hashes, CLUSTER_MODES
+from hash_index import INDEX_TYPES, CascadeHashes, PackedHashes, mih_pairs, mih_plan
+from scan_engine import ScanEngine
+
+
+def edges(graph):
+    return sorted(zip(graph.earlier.tolist(), graph.later.tolist(), graph.dist.tolist()))
+
+
+@pytest.mark.parametrize('index_kind', sorted(INDEX_TYPES))
+def test_build_graph_uses_index_and_matches_blocked_build(index_kind):
+    hashes = PackedHashes(clustered_hashes(400, seed=1))
+    graph = ScanEngine(index_kind=index_kind).build_graph(hashes, 8)
+    assert graph.max_distance == 8
+    assert edges(graph) == edges(NeighborGraph.build(hashes, 8))
+
+
+@pytest.mark.parametrize('mode', CLUSTER_MODES)
+def test_graph_regroups_any_lower_threshold(mode):
+    hashes = PackedHashes(clustered_hashes(400, seed=2))
+    graph = ScanEngine().build_graph(hashes, 8)
+    for threshold in (0, 3, 5, 8):
+        assert graph.cluster(threshold, mode) == cluster_hashes(hashes, threshold, mode)
+    with pytest.raises(ValueError):
+        graph.cluster(9, mode)
+
+
+def test_graph_edges_are_exactly_the_close_pairs():
+    values = clustered_hashes(200, seed=3)
+    graph = ScanEngine().build_graph(values, 6)
+    packed = np.array(values, dtype=np.uint64)
+    expected = sorted((i, j, int(np.bitwise_count(packed[i] ^ packed[j])))
+                      for j in range(len(values)) for i in range(j)
+                      if np.bitwise_count(packed[i] ^ packed[j]) <= 6)
+    assert edges(graph) == expected
+
+
+def brute_force_pairs(values, max_distance):
+    packed = np.array(values, dtype=np.uint64)
+    d = np.bitwise_count(packed[:, None] ^ packed[None, :])
+    rows, cols = np.nonzero(np.triu(d <= max_distance, 1))
+    return sorted(zip(rows.tolist(), cols.tolist(), d[rows, cols].tolist()))
+
+
+@pytest.mark.parametrize('plan', [(7, 0), (4, 1), (3, 2), (2, 3)])
+def test_mih_pairs_match_brute_force(plan):
+    # 重複的雜湊讓同一個桶子有多個候選，也測試分塊 (每塊最多 64 個候選)
+    values = clustered_hashes(300, seed=4) * 2
+    earlier, later, dist = mih_pairs(values, 6, plan, max_block_elements=64)
+    assert sorted(zip(earlier.tolist(), later.tolist(), dist.tolist())) == brute_force_pairs(values, 6)
+
+
+def test_mih_plan_falls_back_when_segments_cannot_prune():
+    assert mih_plan(5, 100000) is not None
+    assert mih_plan(20, 100000) is None
+    assert mih_plan(5, 10) is None
+
+
+@pytest.mark.parametrize('index_kind', sorted(INDEX_TYPES))
+def test_cascade_graph_matches_blocked_build(index_kind, monkeypatch):
+    hashes = CascadeHashes(clustered_hashes(300, seed=5, max_flips=16, bits=192))
+    expected = edges(NeighborGraph.build(hashes, 5))
+    # ahash/dhash 確認後放寬的配對比只看 phash 時多
+    assert len(expected) > len(NeighborGraph.build(hashes.array, 5))
+    assert edges(NeighborGraph.from_index(hashes, 5, index_kind)) == expected
+    # 圖片數少時 mih_plan 會改為全部比較，強制使用分段確認候選配對的路徑
+    monkeypatch.setattr(clustering, 'mih_plan', lambda radius, count: (4, radius // 4))
+    assert edges(NeighborGraph.from_index(hashes, 5, index_kind)) == expected
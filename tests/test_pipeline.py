@@ -0,0 +1,65 @@
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import make_image, write_docx
+import docx_scanner
+import hash_cache
+from docx_scanner import scan_files, scan_pipelined
+from hash_cache import HashCache
+
+
+@pytest.fixture
+def documents(tmp_path):
+    paths = [write_docx(tmp_path / f"doc{i}.docx", [make_image(i), make_image(i + 10)]) for i in range(6)]
+    (tmp_path / 'broken.docx').write_bytes(b'not a zip')
+    return paths[:3] + [str(tmp_path / 'broken.docx')] + paths[3:]
+
+
+def drain(scan, timeout=30):
+    """在另一條執行緒中執行 scan() 並取出所有結果；管線卡住時測試失敗而不是一直等待。"""
+    outcome = {}
+
+    def run():
+        try:
+            outcome['results'] = list(scan())
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "管線沒有結束"
+    return outcome
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_pipeline_matches_sequential_scan(documents, workers):
+    expected = [(path, [rec['hash'] for rec in records], len(messages)) for path, records, messages in scan_files(documents)]
+    results = drain(lambda: scan_pipelined(documents, workers=workers, read_ahead=2))['results']
+    assert [(path, [rec['hash'] for rec in records], len(messages)) for path, records, messages in results] == expected
+    assert expected[3][2] == 1
+
+
+def test_reader_failure_is_raised(documents, monkeypatch):
+    def broken(path):
+        raise RuntimeError("讀取失敗")
+    monkeypatch.setattr(docx_scanner, 'read_document', broken)
+    outcome = drain(lambda: scan_pipelined(documents))
+    assert isinstance(outcome.get('error'), RuntimeError)
+
+
+def test_hash_thread_failure_is_raised(documents, tmp_path, monkeypatch):
+    def broken(*args, **kwargs):
+        raise sqlite3.OperationalError("無法開啟快取")
+
+    def scan():
+        # SQLite 連線只能在開啟它的執行緒中使用
+        with HashCache(str(tmp_path / 'cache.sqlite')) as cache:
+            # 解析執行緒另外以唯讀方式開啟快取，開啟失敗時主執行緒也必須結束
+            monkeypatch.setattr(hash_cache, 'HashCache', broken)
+            return list(scan_pipelined(documents, cache=cache))
+
+    outcome = drain(scan)
+    assert isinstance(outcome.get('error'), sqlite3.OperationalError)
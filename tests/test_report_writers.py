@@ -0,0 +1,125 @@
+import csv
+import json
+import os
+import zlib
+
+import pytest
+
+from conftest import make_image, write_docx
+from report_writers import (CsvReportWriter, HtmlReportWriter, JsonlReportWriter, open_report_writers, report_meta,
+                            with_threshold)
+
+
+def image(path, index, value):
+    return {'filename': os.path.basename(path), 'page': 1, 'context': f'第 {index} 張', 'image_name': f'image{index}.png',
+            'hash': f'{value:016x}', 'docx_path': path, 'member': f'word/media/image{index}.png'}
+
+
+@pytest.fixture
+def groups(tmp_path):
+    # 兩份文件共用同一張圖片，另外各有一張只出現在群組中的圖片
+    first = write_docx(tmp_path / 'first.docx', [make_image(1), make_image(2)])
+    second = write_docx(tmp_path / 'second.docx', [make_image(1), make_image(3)])
+    return [[image(first, 1, 1), image(second, 1, 1)],
+            [image(first, 2, 2), image(second, 2, 3)],
+            [image(first, 1, 1), image(second, 1, 1), image(second, 2, 3)]]
+
+
+def meta(image_count=6):
+    return report_meta('/docs', 5, 'single', 2, image_count)
+
+
+def test_jsonl_and_csv_writers(tmp_path, groups):
+    with JsonlReportWriter(str(tmp_path / 'out' / 'groups.jsonl'), meta()) as jsonl, \
+            CsvReportWriter(str(tmp_path / 'groups.csv'), meta()) as table:
+        for group in groups:
+            jsonl.write_group(group)
+            table.write_group(group)
+
+    with open(tmp_path / 'out' / 'groups.jsonl', encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f]
+    assert [(row['group'], row['size'], row['threshold']) for row in rows] == [(1, 2, 5), (2, 2, 5), (3, 3, 5)]
+    assert rows[1]['images'][1]['hash'] == f'{3:016x}'
+
+    with open(tmp_path / 'groups.csv', encoding='utf-8-sig', newline='') as f:
+        table = list(csv.DictReader(f))
+    assert len(table) == 7
+    assert [row['group'] for row in table] == ['1', '1', '2', '2', '3', '3', '3']
+    assert table[0]['filename'] == 'first.docx' and table[0]['member'] == 'word/media/image1.png'
+
+
+def test_html_pages_and_shared_thumbnails(tmp_path, groups):
+    out_dir = str(tmp_path / 'html')
+    with HtmlReportWriter(out_dir, meta(), page_size=2) as writer:
+        for group in groups:
+            writer.write_group(group)
+    assert writer.pages == [[1, 2, 4], [3, 3, 3]]
+
+    # 同一張圖片出現在兩份文件中，只產生一次縮圖；三張不同的圖片共三個縮圖
+    assert len(os.listdir(os.path.join(out_dir, 'thumbs'))) == 3
+    with open(os.path.join(out_dir, 'page_0001.html'), encoding='utf-8') as f:
+        page = f.read()
+    sources = [part.split('"')[0] for part in page.split('src="thumbs/')[1:]]
+    assert len(sources) == 4 and sources[0] == sources[1] and len(set(sources)) == 3
+    assert 'page_0002.html' in page
+    with open(os.path.join(out_dir, 'index.html'), encoding='utf-8') as f:
+        index = f.read()
+    assert '群組 #3 ~ #3' in index
+
+
+def forge_crc(data, target):
+    """回傳 4 個 bytes，接在 data 後面時 CRC32 等於 target (CRC 對附加的 bytes 是仿射的，以 GF(2) 高斯消去求解)。"""
+    def crc(x):
+        return zlib.crc32(data + x.to_bytes(4, 'little'))
+    base = crc(0)
+    # (CRC 的變化, 附加的 bit 組合)，每個向量的最低位 bit 不出現在之後的向量中
+    basis = []
+    for i in range(32):
+        v, x = crc(1 << i) ^ base, 1 << i
+        for bv, bx in basis:
+            if v & bv & -bv:
+                v, x = v ^ bv, x ^ bx
+        if v:
+            basis.append((v, x))
+    want, solution = target ^ base, 0
+    for bv, bx in basis:
+        if want & bv & -bv:
+            want, solution = want ^ bv, solution ^ bx
+    assert want == 0
+    return solution.to_bytes(4, 'little')
+
+
+def test_html_does_not_share_thumbnails_on_crc_collision(tmp_path):
+    # PNG 會忽略 IEND 之後的內容：補齊長度並調整結尾，讓兩張不同的圖片 CRC32 與大小都相同
+    first, second = make_image(1), make_image(2, (128, 256))
+    size = max(len(first), len(second)) + 4
+    second += b'\0' * (size - len(second))
+    first += b'\0' * (size - 4 - len(first))
+    first += forge_crc(first, zlib.crc32(second))
+    assert zlib.crc32(first) == zlib.crc32(second) and len(first) == len(second)
+
+    paths = [write_docx(tmp_path / 'first.docx', [first]), write_docx(tmp_path / 'second.docx', [second])]
+    with HtmlReportWriter(str(tmp_path / 'html'), meta()) as writer:
+        writer.write_group([image(paths[0], 1, 1), image(paths[1], 1, 2)])
+    assert len(os.listdir(tmp_path / 'html' / 'thumbs')) == 2
+
+
+def test_html_skips_unreadable_images(tmp_path, groups):
+    missing = dict(groups[0][0], docx_path=str(tmp_path / 'gone.docx'))
+    with HtmlReportWriter(str(tmp_path / 'html'), meta()) as writer:
+        writer.write_group([missing, groups[0][1]])
+    with open(tmp_path / 'html' / 'page_0001.html', encoding='utf-8') as f:
+        assert f.read().count('src="thumbs/') == 1
+
+
+def test_empty_html_report(tmp_path):
+    index_path = HtmlReportWriter(str(tmp_path / 'html'), meta(0)).close()
+    with open(index_path, encoding='utf-8') as f:
+        assert '沒有發現任何重複' in f.read()
+
+
+def test_open_report_writers_suffixes_threshold(tmp_path):
+    targets = {'jsonl': str(tmp_path / 'out.jsonl'), 'csv': str(tmp_path / 'out.csv')}
+    writers = open_report_writers(targets, meta(), suffix_threshold=True)
+    assert [w.close() for w in writers] == [with_threshold(targets['jsonl'], 5), with_threshold(targets['csv'], 5)]
+    assert with_threshold(str(tmp_path / 'report') + '/', 3) == str(tmp_path / 'report_t3')
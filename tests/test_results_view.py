@@ -0,0 +1,46 @@
+import os
+import time
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QApplication
+
+from conftest import make_image, write_docx
+from results_view import DuplicateGroupModel, THUMBNAIL_SIZE
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def thumbnail(app, model, index, timeout=10):
+    """取得縮圖，背景解碼完成前持續處理事件。"""
+    deadline = time.monotonic() + timeout
+    while True:
+        pixmap = model.data(index, Qt.ItemDataRole.DecorationRole)
+        if pixmap is not None or time.monotonic() > deadline:
+            return pixmap
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def test_modified_document_gets_a_new_thumbnail(app, tmp_path):
+    path = write_docx(tmp_path / 'a.docx', [make_image(1, (256, 128)), make_image(2)])
+    records = [{'filename': 'a.docx', 'docx_path': path, 'member': f'word/media/image{i}.png', 'page': 1,
+                'context': '', 'image_name': f'image{i}.png'} for i in (1, 2)]
+    model = DuplicateGroupModel()
+    model.set_results(records, [1, 2], [[0, 1]])
+    index = model.index(0, 0, model.index(0, 0))
+    assert thumbnail(app, model, index).width() == THUMBNAIL_SIZE
+    assert thumbnail(app, model, index).height() == THUMBNAIL_SIZE // 2
+
+    # 監看模式中文件被改寫，圖片名稱不變但內容不同
+    write_docx(path, [make_image(3, (128, 256)), make_image(2)])
+    model.forget_documents([path])
+    model.set_results(records, [3, 2], [[0, 1]])
+    index = model.index(0, 0, model.index(0, 0))
+    assert thumbnail(app, model, index).height() == THUMBNAIL_SIZE
+    assert thumbnail(app, model, index).width() == THUMBNAIL_SIZE // 2
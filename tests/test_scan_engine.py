@@ -0,0 +1,35 @@
+import pytest
+
+from conftest import make_image, write_docx
+from discovery import DocumentWalker
+from scan_engine import CancelToken, ScanCancelled, ScanEngine, find_docx_files
+
+
+@pytest.fixture
+def folder(tmp_path):
+    for i in range(3):
+        write_docx(tmp_path / f"doc{i}.docx", [make_image(i), make_image(i)])
+    return tmp_path
+
+
+@pytest.mark.parametrize('source', ['list', 'generator', 'walker'])
+def test_progress_for_any_iterable(folder, source):
+    paths = find_docx_files(str(folder))
+    docx_files = {'list': lambda: paths, 'generator': lambda: (p for p in paths),
+                  'walker': lambda: DocumentWalker(str(folder))}[source]()
+    progress = []
+    result = ScanEngine().scan(docx_files, lambda path, done, total: progress.append((path, done, total)))
+    assert result['file_count'] == 3 and len(result['hashes']) == 6
+    assert [(path, done) for path, done, _ in progress] == [(p, i) for i, p in enumerate(paths, 1)]
+    assert all(done <= total for _, done, total in progress)
+    assert progress[-1][2] == 3
+
+
+def test_cancel_stops_scan(folder):
+    token = CancelToken()
+
+    def progress(path, done, total):
+        token.cancel()
+
+    with pytest.raises(ScanCancelled):
+        ScanEngine().scan(find_docx_files(str(folder)), progress, cancel=token)